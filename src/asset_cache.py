@@ -0,0 +1,202 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import requests
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator
+
+# local imports
+from blob_store import BlobStore, get_blob_store
+from utils import ASSET_CACHE_DIR, ASSET_CACHE_MAX_BYTES, ASSET_REVALIDATE_AFTER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    validated_at REAL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE INDEX IF NOT EXISTS entries_sha256 ON entries (sha256);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# URLs sharing a blob take its space once
+STORED_BYTES_SQL = "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM entries GROUP BY sha256)"
+
+
+class AssetCache:
+    # persistent cache of downloaded assets keyed by URL. Stores the validators (ETag/Last-Modified)
+    # so later runs can revalidate with conditional requests. The bodies live in the content-addressed
+    # blob store, so URLs with the same content share one copy. The least recently used entries
+    # are evicted above max_bytes
+
+    def __init__(self, cache_dir: str = ASSET_CACHE_DIR, max_bytes: int = ASSET_CACHE_MAX_BYTES,
+                 blob_store: BlobStore | None = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.blobs = blob_store or get_blob_store()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db_path = os.path.join(cache_dir, "index.sqlite3")
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(entries)")}
+            if "validated_at" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN validated_at REAL")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # short-lived connections keep the cache usable from download threads and worker processes
+        conn = sqlite3.connect(self._db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def blob_path(self, entry: Dict[str, Any]) -> str:
+        return self.blobs.path_for(entry["sha256"])
+
+    def lookup(self, url: str) -> Dict[str, Any] | None:
+        # returns the cache entry of url if its body is still on disk
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM entries WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        if not os.path.exists(self.blob_path(entry)):
+            self._delete(url)
+            return None
+        return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        # an entry validated recently (e.g. by another product in this run) is reused without any request
+        validated_at = entry.get("validated_at") or 0
+        return time.time() - validated_at < ASSET_REVALIDATE_AFTER_SECONDS
+
+    def conditional_headers(self, entry: Dict[str, Any]) -> Dict[str, str]:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record_hit(self, entry: Dict[str, Any], revalidated: bool = True):
+        # a 304 answer (revalidated) or a fresh entry reused without a request: the cached body is still valid
+        now = time.time()
+        with self._connect() as conn:
+            if revalidated:
+                conn.execute("UPDATE entries SET last_used = ?, validated_at = ? WHERE url = ?", (now, now, entry["url"]))
+                self._increment(conn, "hits")
+            else:
+                conn.execute("UPDATE entries SET last_used = ? WHERE url = ?", (now, entry["url"]))
+                self._increment(conn, "fresh_hits")
+            self._increment(conn, "bytes_saved", entry["size"])
+
+    def store_response(self, url: str, response: requests.Response, chunk_size: int) -> Dict[str, Any]:
+        # streams a 200 response into the blob store, hashing it on the way
+        sha256, size = self.blobs.write_stream(response.iter_content(chunk_size=chunk_size))
+
+        now = time.time()
+        entry = {
+            "url": url,
+            "file_name": sha256,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": size,
+            "sha256": sha256,
+            "fetched_at": now,
+            "last_used": now,
+            "validated_at": now,
+        }
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (url, file_name, etag, last_modified, size, sha256, fetched_at, last_used, validated_at) "
+                "VALUES (:url, :file_name, :etag, :last_modified, :size, :sha256, :fetched_at, :last_used, :validated_at)", entry)
+            self._increment(conn, "misses")
+            self._increment(conn, "bytes_downloaded", size)
+        self.evict(keep_url=url)
+        return entry
+
+    def link_to(self, entry: Dict[str, Any], dest: str):
+        # places the cached body at dest. Skips the write when dest already holds it
+        self.blobs.link_into(entry["sha256"], dest)
+
+    def invalidate(self, url: str):
+        # forgets url, e.g. after its body failed verification, so the next download fetches it again
+        entry = self.lookup(url)
+        if entry is not None:
+            self._delete(url, entry["sha256"])
+
+    def evict(self, keep_url: str | None = None):
+        # drops the least recently used bodies until the cache fits in max_bytes.
+        # Product files hardlinked to an evicted body are left in place
+        with self._connect() as conn:
+            total = conn.execute(STORED_BYTES_SQL).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = conn.execute("SELECT url, sha256, size FROM entries ORDER BY last_used").fetchall()
+
+        for row in rows:
+            if total <= self.max_bytes:
+                break
+            if row["url"] == keep_url:
+                continue
+            # a blob still referenced by another URL frees nothing
+            if self._delete(row["url"], row["sha256"]):
+                total -= row["size"]
+            logger.debug(f"Evicted {row['url']} from the asset cache")
+            with self._connect() as conn:
+                self._increment(conn, "evictions")
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            stats = {row["name"]: row["value"] for row in conn.execute("SELECT name, value FROM stats")}
+            entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = conn.execute(STORED_BYTES_SQL).fetchone()[0]
+        stats["entries"] = entries
+        stats["total_bytes"] = total
+        return stats
+
+    def _delete(self, url: str, sha256: str | None = None) -> bool:
+        # the blob is only removed when no other URL shares it. Returns whether it was removed
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+            shared = sha256 and conn.execute("SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone()
+        if sha256 and not shared:
+            self.blobs.remove(sha256)
+            return True
+        return False
+
+    @staticmethod
+    def _increment(conn: sqlite3.Connection, name: str, amount: int = 1):
+        conn.execute("INSERT INTO stats (name, value) VALUES (?, ?) "
+                     "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, amount))
+
+
+_asset_cache: AssetCache | None = None
+_asset_cache_lock = threading.Lock()
+
+
+def get_asset_cache() -> AssetCache:
+    # one cache instance per process
+    global _asset_cache
+    with _asset_cache_lock:
+        if _asset_cache is None:
+            _asset_cache = AssetCache()
+        return _asset_cache
@@ -2,63 +2,194 @@ import os
 import time
 import logging
 import requests
+import sqlite3
 import re
+import itertools
 from urllib.parse import urlparse, urljoin
-from selenium.webdriver.remote.webdriver import WebDriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException, StaleElementReferenceException
 from typing import Dict, List, Any, Tuple, Optional
 
 # Importa funções utilitárias dos módulos locais
-from selenium_utils import click_tab, safe_find_element
-from utils import ASSETS_BASE_DIR, clean_filename, get_file_extension_from_url
+from asset_cache import get_asset_cache
+from asset_manifest import get_asset_manifest
+from asset_verifier import sniff_format, FORMAT_EXTENSIONS, SNIFF_BYTES
+from metrics import metrics
+from rate_limiter import get_rate_limiter
+from utils import ASSETS_BASE_DIR, USER_AGENT, DOWNLOAD_CHUNK_SIZE, USE_ASSET_CACHE, VERIFY_ASSETS, clean_filename, get_file_extension_from_url
 
 logger = logging.getLogger(__name__)
 
-
-def download_asset_with_requests(asset_url: str | None, product_id: str, asset_type: str) -> str | None:
-    # downloads assets using requests and saves them in the product's assets directory. Used for manuals and images
-    
+# extensions of assets saved under their type's name, when the first bytes don't tell the format
+DEFAULT_EXTENSIONS = {"manual": ".pdf", "image": ".jpg"}
+CONTENT_TYPE_EXTENSIONS = {
+    "application/pdf": ".pdf",
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+
+def download_asset_with_requests(asset_url: str | None, product_id: str, asset_type: str,
+                                 session: requests.Session | None = None,
+                                 chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                                 file_name: str | None = None,
+                                 extra_headers: Dict[str, str] | None = None) -> str | None:
     if not asset_url:
         logger.debug(f"  empty download URL for '{asset_type}' skiping download.")
         return None
+    with metrics.span(f"download_{asset_type}"):
+        return _download_asset(asset_url, product_id, asset_type, session, chunk_size, file_name, extra_headers)
 
-    cleaned_product_id = clean_filename(product_id)
-    product_asset_subdir = os.path.join(ASSETS_BASE_DIR, cleaned_product_id)
-    os.makedirs(product_asset_subdir, exist_ok=True)
 
-    ext_map = {"manual": ".pdf", "image": ".jpg"}
-    ext = ext_map.get(asset_type)
+def _content_length(response: requests.Response) -> int | None:
+    # body size announced by the server. Unknown for encoded bodies, which requests decodes on the way
+    if response.headers.get("Content-Encoding", "identity").lower() != "identity":
+        return None
+    try:
+        return int(response.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _record_download(product_id: str, asset_type: str, relative_path: str, asset_url: str,
+                     expected_size: int | None, content_type: str | None = None):
+    # what the verifier checks the file against (asset_verifier.py)
+    if not VERIFY_ASSETS:
+        return
+    try:
+        get_asset_manifest().record_download(product_id, asset_type, relative_path, asset_url, expected_size, content_type)
+    except sqlite3.Error as e:
+        logger.warning(f"  Error recording '{asset_type}' in the asset manifest: {e}")
+
 
-    # Usa o asset_type como nome do arquivo (manual.pdf, image.jpg)
-    local_filename = f"{clean_filename(asset_type)}{ext}"
-    local_filepath_absolute = os.path.join(product_asset_subdir, local_filename)
-    local_path_relative = os.path.join(os.path.basename(ASSETS_BASE_DIR), cleaned_product_id, local_filename).replace('\\', '/')
+def _asset_extension(asset_type: str, head: bytes, content_type: str | None) -> str:
+    # extension of the body's real format: sniffed from its first bytes, else told by the Content-Type,
+    # else the asset type's usual one (an HTML error page keeps it, verification rejects it)
+    ext = FORMAT_EXTENSIONS.get(sniff_format(head))
+    if ext is None and content_type:
+        ext = CONTENT_TYPE_EXTENSIONS.get(content_type.split(";")[0].strip().lower())
+    return ext or DEFAULT_EXTENSIONS.get(asset_type, "")
 
-    if os.path.exists(local_filepath_absolute):
-         logger.debug(f"  file already exists {local_filepath_absolute}, removing it")
-         try: os.remove(local_filepath_absolute)
-         except OSError as e: logger.warning(f"   error remobing existing file {local_filepath_absolute}: {e}")
 
-    logger.info(f"  Downloading asset '{asset_type}' de {asset_url} para {local_filepath_absolute} usando requests...")
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+def _read_head(file_path: str) -> bytes:
     try:
-        with requests.get(asset_url, stream=True, headers=headers, timeout=30) as r:
-            r.raise_for_status()
+        with open(file_path, 'rb') as f:
+            return f.read(SNIFF_BYTES)
+    except OSError:
+        return b""
+
+
+def _remove_other_extensions(product_asset_subdir: str, asset_type: str, local_filename: str):
+    # an image saved as image.jpg by an earlier run (or renamed by rename_misnamed) would be left
+    # next to the new image.png
+    for ext in set(FORMAT_EXTENSIONS.values()) | set(DEFAULT_EXTENSIONS.values()):
+        stale_filename = f"{clean_filename(asset_type)}{ext}"
+        if stale_filename != local_filename:
+            try: os.remove(os.path.join(product_asset_subdir, stale_filename))
+            except FileNotFoundError: pass
+            except OSError as e: logger.warning(f"   error removing {stale_filename}: {e}")
+
+
+def _download_asset(asset_url: str, product_id: str, asset_type: str, session: requests.Session | None,
+                    chunk_size: int, file_name: str | None, extra_headers: Dict[str, str] | None) -> str | None:
+    # downloads assets using requests and saves them in the product's assets directory. Used for manuals, images
+    # and CAD files resolved to a direct URL. A shared session reuses keep-alive connections across downloads.
+    # Without a file name the asset type names the file, with the extension of the format received
+    # (image.png, manual.pdf...)
 
-            with open(local_filepath_absolute, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+    cleaned_product_id = clean_filename(product_id)
+    product_asset_subdir = os.path.join(ASSETS_BASE_DIR, cleaned_product_id)
+    os.makedirs(product_asset_subdir, exist_ok=True)
 
-        logger.info(f"  Asset downloaded '{asset_type}' ")
+    def local_paths(head: bytes, content_type: str | None) -> Tuple[str, str]:
+        # absolute and relative path of the file, once the first bytes of the body are known
+        local_filename = (clean_filename(file_name) if file_name
+                          else f"{clean_filename(asset_type)}{_asset_extension(asset_type, head, content_type)}")
+        if not file_name:
+            _remove_other_extensions(product_asset_subdir, asset_type, local_filename)
+        return (os.path.join(product_asset_subdir, local_filename),
+                os.path.join(os.path.basename(ASSETS_BASE_DIR), cleaned_product_id, local_filename).replace('\\', '/'))
+
+    asset_cache = get_asset_cache() if USE_ASSET_CACHE else None
+    cached_entry = asset_cache.lookup(asset_url) if asset_cache else None
+
+    if cached_entry and asset_cache.is_fresh(cached_entry):
+        # already fetched or revalidated recently, e.g. a manual shared with another product
+        asset_cache.record_hit(cached_entry, revalidated=False)
+        metrics.increment("asset_requests", asset_type=asset_type, result="fresh")
+        local_filepath_absolute, local_path_relative = local_paths(_read_head(asset_cache.blob_path(cached_entry)), None)
+        asset_cache.link_to(cached_entry, local_filepath_absolute)
+        _record_download(product_id, asset_type, local_path_relative, asset_url, cached_entry['size'])
+        logger.info(f"  Asset '{asset_type}' linked from the asset store, no download needed")
+        return local_path_relative
+
+    logger.info(f"  Downloading asset '{asset_type}' de {asset_url} para {product_asset_subdir} usando requests...")
+    headers = {'User-Agent': USER_AGENT}
+    if extra_headers:
+        headers.update(extra_headers)
+    if cached_entry:
+        # revalidates the cached copy instead of downloading it again
+        headers.update(asset_cache.conditional_headers(cached_entry))
+    local_filepath_absolute = None
+    try:
+        http = session if session is not None else requests
+        # the host's request slot is held while the body streams, capping concurrent downloads per host
+        with get_rate_limiter().request(asset_url) as slot, \
+                http.get(asset_url, stream=True, headers=headers, timeout=30) as r:
+            slot.observe_response(r)
+            if cached_entry and r.status_code == 304:
+                asset_cache.record_hit(cached_entry)
+                metrics.increment("asset_requests", asset_type=asset_type, result="not_modified")
+                local_filepath_absolute, local_path_relative = local_paths(
+                    _read_head(asset_cache.blob_path(cached_entry)), None)
+                asset_cache.link_to(cached_entry, local_filepath_absolute)
+                _record_download(product_id, asset_type, local_path_relative, asset_url, cached_entry['size'])
+                logger.info(f"  Asset '{asset_type}' not modified, using cached copy")
+                return local_path_relative
+
+            r.raise_for_status()
+            content_type = r.headers.get("Content-Type")
+
+            if asset_cache:
+                cached_entry = asset_cache.store_response(asset_url, r, chunk_size)
+                local_filepath_absolute, local_path_relative = local_paths(
+                    _read_head(asset_cache.blob_path(cached_entry)), content_type)
+                asset_cache.link_to(cached_entry, local_filepath_absolute)
+                downloaded_bytes = cached_entry['size']
+            else:
+                chunks = r.iter_content(chunk_size=chunk_size)
+                first_chunk = next(chunks, b"")
+                local_filepath_absolute, local_path_relative = local_paths(first_chunk, content_type)
+                # the file may be a hardlink to a blob of an earlier run, it is replaced rather than overwritten
+                if os.path.exists(local_filepath_absolute):
+                    os.remove(local_filepath_absolute)
+                downloaded_bytes = 0
+                with open(local_filepath_absolute, 'wb') as f:
+                    for chunk in itertools.chain([first_chunk], chunks):
+                        if chunk:
+                            f.write(chunk)
+                            downloaded_bytes += len(chunk)
+
+            # a connection dropped mid-body ends the stream without an error
+            expected_size = _content_length(r)
+            if expected_size is not None and downloaded_bytes != expected_size:
+                logger.warning(f"  Asset '{asset_type}' from {asset_url} truncated: {downloaded_bytes} of {expected_size} bytes")
+                metrics.increment("asset_requests", asset_type=asset_type, result="truncated")
+                if asset_cache:
+                    asset_cache.invalidate(asset_url)
+                try: os.remove(local_filepath_absolute)
+                except OSError as rm_err: logger.warning(f"  Error removing file {local_filepath_absolute}: {rm_err}")
+                return None
+            metrics.increment("asset_requests", asset_type=asset_type, result="downloaded")
+            metrics.increment("downloaded_bytes", downloaded_bytes, asset_type=asset_type)
+
+        _record_download(product_id, asset_type, local_path_relative, asset_url, expected_size, content_type)
+        logger.info(f"  Asset downloaded '{asset_type}' as {local_path_relative}")
         return local_path_relative
 
     except requests.exceptions.RequestException as e:
         logger.warning(f"  Error downloading '{asset_type}' from {asset_url} using requests: {e}")
-        if os.path.exists(local_filepath_absolute):
+        if local_filepath_absolute and os.path.exists(local_filepath_absolute):
              try: os.remove(local_filepath_absolute)
              except OSError as rm_err: logger.warning(f"  Error removing file {local_filepath_absolute}: {rm_err}")
         return None
@@ -67,133 +198,7 @@ def download_asset_with_requests(asset_url: str | None, product_id: str, asset_t
         return None
     except Exception as e:
         logger.error(f"  Error downloading '{asset_type}' from {asset_url} using requests: {e}")
-        if os.path.exists(local_filepath_absolute):
+        if local_filepath_absolute and os.path.exists(local_filepath_absolute):
              try: os.remove(local_filepath_absolute)
              except OSError as rm_err: logger.warning(f"  Error removing file {local_filepath_absolute}: {rm_err}")
         return None
-
-
-def download_cad_interactively(driver: WebDriver, product_id: str, selenium_download_dir: str) -> str | None:
-    
-    # Goes to the Drawings tab, interacts with the dropdown, clicks the download button and returns the downloaded file path
-   
-    logger.info("Starting CAD download")
-    cad_downloaded_path_relative: str | None = None
-
-    cleaned_product_id = clean_filename(product_id)
-    logger.debug(f"path set to {selenium_download_dir}")
-
-    if not click_tab(driver, 'drawings'):
-        logger.warning("Error accessing drawings tab")
-        return None
-
-    logger.debug("Drawings tab accessed")
-
-    cad_section_locator = (By.CSS_SELECTOR, '.pane[data-tab="drawings"] .section.cadfiles')
-    if not safe_find_element(driver, *cad_section_locator, wait_time=10):
-        logger.warning("CAD files section found")
-        return None
-
-    dropdown_input_locator = (By.CSS_SELECTOR, '.pane[data-tab="drawings"] .k-dropdown-wrap .k-input')
-    try:
-        dropdown_input = WebDriverWait(driver, 15).until(EC.element_to_be_clickable(dropdown_input_locator))
-        logger.debug("Dropdown found")
-        dropdown_input.click()
-        logger.debug("Dropdown clicked")
-        time.sleep(1)
-
-    except (TimeoutException, NoSuchElementException, StaleElementReferenceException) as e:
-        logger.warning(f"Error clicking dropdown: {e}")
-        return None
-
-    dropdown_list_locator = (By.XPATH, "//div[contains(@class, 'k-animation-container') and not(@aria-hidden='true')]//ul[@role='listbox']")
-    first_dwg_option = None
-    option_text_found = None
-
-    try:
-        WebDriverWait(driver, 10).until(EC.visibility_of_element_located(dropdown_list_locator))
-        logger.debug("Kendo UI dropdown list visible")
-
-        list_items_locator = (By.XPATH, "//div[contains(@class, 'k-animation-container') and not(@aria-hidden='true')]//li[@role='option']")
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located(list_items_locator))
-
-        list_items = driver.find_elements(*list_items_locator)
-        logger.debug(f"{len(list_items)} options found in the dropdown list")
-
-        for item in list_items:
-            try:
-                item_text = item.text
-                if "DWG" in item_text.upper():
-                    first_dwg_option = item
-                    option_text_found = item_text
-                    logger.info(f"First option containing DWG: '{option_text_found}'")
-                    break
-            except StaleElementReferenceException:
-                 logger.debug("StaleElementReferenceException while verifying this item. Skipping")
-                 continue
-
-        if first_dwg_option:
-            WebDriverWait(driver, 10).until(EC.element_to_be_clickable(first_dwg_option))
-            first_dwg_option.click()
-            logger.info(f"Option '{option_text_found}' clicked.")
-            time.sleep(2)
-        else:
-            logger.warning("No DWG option in the dropdown. CAD was NOT downloaded")
-            return None
-
-    except (TimeoutException, NoSuchElementException, StaleElementReferenceException) as e:
-        logger.warning(f"Error finding or clicking DWG. CAD was NOT downloaded : {e}")
-        return None
-
-    logger.debug("Waiting for the download button")
-    download_button_locator = (By.ID, 'cadDownload')
-    download_button = None
-    try:
-        download_button = WebDriverWait(driver, 15).until(EC.element_to_be_clickable(download_button_locator))
-        WebDriverWait(driver, 5).until(lambda driver: driver.find_element(*download_button_locator).get_attribute("aria-disabled") == "false")
-        logger.info("Button found and clickable")
-
-    except (TimeoutException, NoSuchElementException, StaleElementReferenceException) as e:
-        logger.warning(f"Button not found or cliclable: {e}")
-        return None
-
-    files_before = os.listdir(selenium_download_dir)
-    logger.debug(f"Files in directory before the click {files_before}")
-
-    try:
-        download_button.click()
-        logger.info("Button clicked")
-        time.sleep(2)
-
-    except (ElementClickInterceptedException, Exception) as e:
-        logger.warning(f"Error clicking: {e}")
-        return None
-
-    logger.info(f"Waiting for the file at '{selenium_download_dir}'...")
-    timeout_seconds = 30
-    check_interval_seconds = 1
-    end_time = time.time() + timeout_seconds
-    downloaded_file_name = None
-
-    while time.time() < end_time:
-        files_after = os.listdir(selenium_download_dir)
-        new_files = [f for f in files_after if f not in files_before and not f.endswith('.crdownload')]
-
-        if new_files:
-            downloaded_file_name = new_files[0]
-            full_downloaded_path = os.path.join(selenium_download_dir, downloaded_file_name)
-
-            time.sleep(1)
-            if os.path.exists(full_downloaded_path) and not full_downloaded_path.endswith('.crdownload'):
-                logger.info(f"CAD detected: {downloaded_file_name}")
-                time.sleep(1)
-
-                logger.info(f"CAD downloaded: {downloaded_file_name}")
-                relative_path = os.path.join(os.path.basename(ASSETS_BASE_DIR), cleaned_product_id, downloaded_file_name).replace('\\', '/')
-                return relative_path
-
-
-        time.sleep(check_interval_seconds)
-
-    logger.warning(f"Timeout {timeout_seconds}s ")
-    return None
\ No newline at end of file
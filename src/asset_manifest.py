@@ -0,0 +1,122 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterable, Iterator
+
+# local imports
+from utils import ASSET_MANIFEST_PATH
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    product_id TEXT NOT NULL,
+    asset_type TEXT NOT NULL,
+    path TEXT,
+    url TEXT,
+    expected_size INTEGER,
+    content_type TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    format TEXT,
+    status TEXT NOT NULL,
+    detail TEXT,
+    downloaded_at REAL,
+    verified_at REAL,
+    PRIMARY KEY (product_id, asset_type)
+);
+CREATE INDEX IF NOT EXISTS assets_status ON assets (status);
+"""
+
+# unverified -> ok | missing | empty | truncated | size_mismatch | wrong_format.
+# Every status but ok and unverified queues the asset for re-download
+UNVERIFIED, OK = "unverified", "ok"
+
+
+class AssetManifest:
+    # checksum manifest of the asset files: what the server announced when they were downloaded
+    # (Content-Length, Content-Type) and what the verifier found on disk (size, sha256, format)
+
+    def __init__(self, path: str = ASSET_MANIFEST_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # short-lived connections, downloads are recorded from download threads and worker processes
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record_download(self, product_id: str, asset_type: str, path: str, url: str | None,
+                        expected_size: int | None, content_type: str | None):
+        # a new file replaces the asset, it is verified again on the next pass
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO assets (product_id, asset_type, path, url, expected_size, "
+                         "content_type, status, downloaded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (product_id, asset_type, path, url, expected_size, content_type, UNVERIFIED, time.time()))
+
+    def record_verification(self, results: Iterable[Dict[str, Any]]):
+        # results carry product_id, asset_type, path, size, mtime_ns, sha256, format, status and detail
+        now = time.time()
+        rows = [{**result, "verified_at": now} for result in results]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO assets (product_id, asset_type, status) VALUES "
+                             "(:product_id, :asset_type, :status)", rows)
+            conn.executemany("UPDATE assets SET path = :path, size = :size, mtime_ns = :mtime_ns, sha256 = :sha256, "
+                             "format = :format, status = :status, detail = :detail, verified_at = :verified_at "
+                             "WHERE product_id = :product_id AND asset_type = :asset_type", rows)
+
+    def record_rename(self, product_id: str, asset_type: str, path: str):
+        # renaming keeps size and mtime, the renamed file still counts as verified
+        with self._connect() as conn:
+            conn.execute("UPDATE assets SET path = ?, detail = NULL WHERE product_id = ? AND asset_type = ?",
+                         (path, product_id, asset_type))
+
+    def entries(self, product_ids: Iterable[str] | None = None) -> Dict[tuple, Dict[str, Any]]:
+        # (product_id, asset_type) -> entry
+        with self._connect() as conn:
+            if product_ids is None:
+                rows = conn.execute("SELECT * FROM assets").fetchall()
+            else:
+                rows = []
+                for p_id in product_ids:
+                    rows.extend(conn.execute("SELECT * FROM assets WHERE product_id = ?", (p_id,)).fetchall())
+        return {(row["product_id"], row["asset_type"]): dict(row) for row in rows}
+
+    def queued(self, product_ids: Iterable[str] | None = None) -> Dict[str, List[str]]:
+        # the re-download queue: product_id -> asset types the last verification rejected
+        queue: Dict[str, List[str]] = {}
+        for (p_id, asset_type), entry in sorted(self.entries(product_ids).items()):
+            if entry["status"] not in (OK, UNVERIFIED):
+                queue.setdefault(p_id, []).append(asset_type)
+        return queue
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return {row["status"]: row["total"] for row in
+                    conn.execute("SELECT status, COUNT(*) AS total FROM assets GROUP BY status")}
+
+
+_asset_manifest: AssetManifest | None = None
+_asset_manifest_lock = threading.Lock()
+
+
+def get_asset_manifest() -> AssetManifest:
+    # one manifest instance per process
+    global _asset_manifest
+    with _asset_manifest_lock:
+        if _asset_manifest is None:
+            _asset_manifest = AssetManifest()
+        return _asset_manifest
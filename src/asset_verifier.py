@@ -0,0 +1,213 @@
+import os
+import mmap
+import time
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Iterable, Tuple
+
+# local imports
+from asset_manifest import get_asset_manifest, OK
+from output_sinks import read_json_products, JsonFileSink
+from product_fields import ASSET_TYPES
+from utils import DATA_OUTPUT_DIR, USE_ASSET_CACHE, VERIFY_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# checks the asset files of the saved products: size against the Content-Length recorded at download time,
+# file signature against the asset type and, for PDF/JPEG/PNG, the end-of-file marker. Files are hashed
+# in worker processes through mmap. Checksums go to the asset manifest and rejected assets are queued there
+# for re-download. The downloader names files by the format it received, misnamed files (a PNG saved as
+# image.jpg by older runs) are only reported here and renamed by rename_misnamed
+
+SIGNATURES = (
+    ("pdf", b"%PDF-"),
+    ("jpeg", b"\xff\xd8\xff"),
+    ("png", b"\x89PNG\r\n\x1a\n"),
+    ("gif", b"GIF8"),
+    ("dwg", b"AC10"),
+)
+FORMAT_EXTENSIONS = {"pdf": ".pdf", "jpeg": ".jpg", "png": ".png", "gif": ".gif", "webp": ".webp", "dwg": ".dwg"}
+EXTENSION_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg"}
+EXPECTED_FORMATS = {"image": ("jpeg", "png", "gif", "webp"), "manual": ("pdf",), "cad": ("dwg",)}
+# end markers of complete files, searched in the last TRAILER_BYTES
+TRAILERS = {"pdf": b"%%EOF", "jpeg": b"\xff\xd9", "png": b"IEND"}
+SNIFF_BYTES = 64
+TRAILER_BYTES = 1024
+VERIFY_CHUNK_SIZE = 16
+# under this many files hashing stays in this process, starting a pool would cost more
+POOL_MIN_FILES = 8
+
+
+def sniff_format(head: bytes) -> str | None:
+    # format told by the first bytes. "html" catches error and login pages saved as assets
+    for file_format, signature in SIGNATURES:
+        if head.startswith(signature):
+            return file_format
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.lstrip().startswith(b"<"):
+        return "html"
+    return None
+
+
+def inspect_file(file_path: str) -> Dict[str, Any] | None:
+    # runs in a worker process. The file is mapped rather than read, so hashing doesn't copy it through
+    # python buffers. None when the file is missing or unreadable
+    try:
+        with open(file_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            info = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if stat.st_size == 0:
+                return {**info, "sha256": hashlib.sha256().hexdigest(), "format": None, "complete": False}
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                file_format = sniff_format(mm[:SNIFF_BYTES])
+                trailer = TRAILERS.get(file_format)
+                complete = trailer is None or mm.rfind(trailer, max(0, stat.st_size - TRAILER_BYTES)) != -1
+                sha256 = hashlib.sha256(mm).hexdigest()
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Error reading {file_path}: {e}")
+        return None
+    return {**info, "sha256": sha256, "format": file_format, "complete": complete}
+
+
+def judge(asset_type: str, info: Dict[str, Any] | None, expected_size: int | None) -> Tuple[str, str | None]:
+    # status and detail of an inspected asset
+    if info is None:
+        return "missing", "file not found"
+    if info["size"] == 0:
+        return "empty", None
+    if expected_size is not None and info["size"] < expected_size:
+        return "truncated", f"{info['size']} of {expected_size} bytes"
+    if expected_size is not None and info["size"] != expected_size:
+        return "size_mismatch", f"{info['size']} bytes, {expected_size} announced"
+    if info["format"] not in EXPECTED_FORMATS.get(asset_type, (info["format"],)):
+        return "wrong_format", f"{info['format'] or 'unknown'} content"
+    if not info["complete"]:
+        return "truncated", f"no {info['format']} end marker"
+    return OK, None
+
+
+def fixed_path(relative_path: str, file_format: str | None) -> str | None:
+    # the path with the extension of the file's real format, None when the extension is right
+    stem, ext = os.path.splitext(relative_path)
+    ext = EXTENSION_ALIASES.get(ext.lower(), ext.lower())
+    right_ext = FORMAT_EXTENSIONS.get(file_format)
+    if not right_ext or ext == right_ext:
+        return None
+    return stem + right_ext
+
+
+def _inspect_all(file_paths: List[str], workers: int | None) -> Iterable[Dict[str, Any] | None]:
+    if len(file_paths) < POOL_MIN_FILES or workers == 1:
+        return [inspect_file(file_path) for file_path in file_paths]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        return list(executor.map(inspect_file, file_paths, chunksize=VERIFY_CHUNK_SIZE))
+
+
+def verify_assets(product_ids: Iterable[str] | None = None, full: bool = False,
+                  workers: int | None = VERIFY_WORKERS) -> Dict[str, Any]:
+    # verifies the assets of every saved product (or the given ones). Files already verified and unchanged
+    # since (same size and mtime) are skipped unless full is set
+    start = time.monotonic()
+    product_ids = list(product_ids) if product_ids is not None else None
+    manifest = get_asset_manifest()
+    entries = manifest.entries(product_ids)
+
+    summary: Dict[str, Any] = {"checked": 0, "unchanged": 0, "ok": 0, "misnamed": 0, "rejected": {}}
+    results: List[Dict[str, Any]] = []
+    pending: List[Dict[str, Any]] = []
+    for _, product_data in read_json_products(product_ids=product_ids):
+        p_id = product_data['product_id']
+        assets = product_data.get('assets') or {}
+        for asset_type in ASSET_TYPES:
+            relative_path = assets.get(asset_type)
+            entry = entries.get((p_id, asset_type)) or {}
+            result = {"product_id": p_id, "asset_type": asset_type, "path": relative_path,
+                      "expected_size": entry.get("expected_size"), "url": entry.get("url")}
+            if not isinstance(relative_path, str):
+                results.append({**result, "size": None, "mtime_ns": None, "sha256": None, "format": None,
+                                "status": "missing", "detail": "no file recorded"})
+                continue
+            if not full and entry.get("status") == OK and entry.get("path") == relative_path:
+                try:
+                    stat = os.stat(os.path.join(DATA_OUTPUT_DIR, relative_path))
+                    if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+                        summary["unchanged"] += 1
+                        continue
+                except OSError:
+                    pass
+            pending.append(result)
+
+    infos = _inspect_all([os.path.join(DATA_OUTPUT_DIR, result["path"]) for result in pending], workers)
+    for result, info in zip(pending, infos):
+        summary["checked"] += 1
+        status, detail = judge(result["asset_type"], info, result["expected_size"])
+        right_path = fixed_path(result["path"], info["format"]) if status == OK else None
+        if right_path:
+            # the file is kept, it is hardlinked from the asset store under this name
+            summary["misnamed"] += 1
+            detail = f"{info['format']} content, should be {right_path}"
+            logger.info(f"{result['product_id']} {result['asset_type']}: {detail}")
+        info = info or {}
+        results.append({**result, "size": info.get("size"), "mtime_ns": info.get("mtime_ns"),
+                        "sha256": info.get("sha256"), "format": info.get("format"), "status": status, "detail": detail})
+
+    manifest.record_verification(results)
+    rejected = [result for result in results if result["status"] != OK]
+    summary["ok"] = summary["unchanged"] + len(results) - len(rejected)
+    for result in rejected:
+        summary["rejected"][result["status"]] = summary["rejected"].get(result["status"], 0) + 1
+        logger.warning(f"{result['product_id']} {result['asset_type']}: {result['status']}"
+                       + (f" ({result['detail']})" if result['detail'] else ""))
+    _invalidate_cached(rejected)
+
+    elapsed = time.monotonic() - start
+    summary["elapsed_seconds"] = round(elapsed, 2)
+    summary["queued"] = len(rejected)
+    logger.info(f"Verified {summary['checked']} asset files ({summary['unchanged']} unchanged skipped) "
+                f"in {elapsed:.1f}s: {summary['ok']} ok, {summary['misnamed']} misnamed, "
+                f"{len(rejected)} queued for re-download {summary['rejected'] or ''}")
+    return summary
+
+
+def rename_misnamed(product_ids: Iterable[str] | None = None) -> int:
+    # renames the verified files whose extension doesn't match their format (as recorded by the last
+    # verification) and updates the products' JSON files and the manifest. Only trees downloaded before
+    # the downloader named files by their format have any. Returns the number renamed
+    manifest = get_asset_manifest()
+    renamed: Dict[str, Dict[str, str]] = {}
+    for (p_id, asset_type), entry in manifest.entries(product_ids).items():
+        if entry["status"] != OK or not entry["path"]:
+            continue
+        new_path = fixed_path(entry["path"], entry["format"])
+        if not new_path:
+            continue
+        try:
+            os.replace(os.path.join(DATA_OUTPUT_DIR, entry["path"]), os.path.join(DATA_OUTPUT_DIR, new_path))
+        except OSError as e:
+            logger.warning(f"Error renaming {entry['path']}: {e}")
+            continue
+        logger.info(f"Renamed {entry['path']} to {new_path} ({entry['format']} content)")
+        manifest.record_rename(p_id, asset_type, new_path)
+        renamed.setdefault(p_id, {})[asset_type] = new_path
+
+    # the products' JSON files follow the renamed assets
+    sink = JsonFileSink()
+    for _, product_data in read_json_products(product_ids=list(renamed)):
+        product_data['assets'].update(renamed[product_data['product_id']])
+        sink.write(product_data['product_id'], product_data)
+    return sum(len(asset_types) for asset_types in renamed.values())
+
+
+def _invalidate_cached(rejected: List[Dict[str, Any]]):
+    # the asset cache would hand the same bad body back on re-download
+    urls = [result["url"] for result in rejected if result["url"] and result["status"] != "missing"]
+    if not USE_ASSET_CACHE or not urls:
+        return
+    from asset_cache import get_asset_cache
+    asset_cache = get_asset_cache()
+    for url in urls:
+        asset_cache.invalidate(url)
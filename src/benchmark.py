@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import importlib.util
+import resource
+import tempfile
+import threading
+from typing import Dict, List, Any
+
+# local imports
+from fixture_site import FixtureSite, fixture_product_ids
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.join(PROJECT_ROOT, "output", "benchmarks")
+
+MEMORY_SAMPLE_SECONDS = 0.5
+
+
+class MemorySampler:
+    # samples the RSS of the process tree in the background and keeps the peak. Needs psutil or /proc,
+    # otherwise only the peak RSS of this process is reported
+
+    def __init__(self, interval: float = MEMORY_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak = 0
+        self.samples: List[int] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+
+    def _run(self):
+        # imported here, after run_benchmark pointed the pipeline at the fixture site
+        from resource_governor import process_tree_rss
+        while not self._stop.wait(self.interval):
+            rss = process_tree_rss(os.getpid())
+            self.samples.append(rss)
+            self.peak = max(self.peak, rss)
+
+    def __enter__(self):
+        if os.path.isdir("/proc") or importlib.util.find_spec("psutil"):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if not self.samples:
+            # ru_maxrss is in KiB on linux
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]):
+    # prints the throughput and the per-stage p50/p95 against a previous report
+    def ratio(new, old):
+        return f"{new / old:.2f}x" if old else "n/a"
+
+    print(f"products/min: {baseline['products_per_minute']} -> {report['products_per_minute']} "
+          f"({ratio(report['products_per_minute'], baseline['products_per_minute'])})")
+    print(f"peak memory MiB: {baseline['peak_memory_mib']} -> {report['peak_memory_mib']}")
+    for stage, stats in report["stages"].items():
+        old = baseline["stages"].get(stage)
+        if old:
+            print(f"  {stage:<20} p50 {old['p50']:.3f}s -> {stats['p50']:.3f}s   p95 {old['p95']:.3f}s -> {stats['p95']:.3f}s")
+        else:
+            print(f"  {stage:<20} p50 {stats['p50']:.3f}s   p95 {stats['p95']:.3f}s (new)")
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    site = FixtureSite(latency_ms=args.latency_ms, asset_kb=args.asset_kb, bom_rows=args.bom_rows).start()
+    output_dir = tempfile.mkdtemp(prefix="baldor_bench_")
+    # the pipeline reads both at import time, so they are set before the imports below
+    os.environ["BALDOR_BASE_URL"] = site.base_url
+    os.environ["BALDOR_OUTPUT_DIR"] = output_dir
+
+    from scrape_runner import run_scrape
+    from metrics import metrics
+    from utils import ensure_output_dirs
+    ensure_output_dirs()
+
+    product_ids = fixture_product_ids(args.products)
+    try:
+        with MemorySampler() as memory:
+            summary = run_scrape(product_ids, lambda p_id, data: None,
+                                 workers=args.workers, mode=args.mode, product_timeout=args.timeout)
+    finally:
+        site.stop()
+
+    metrics_report = metrics.report()
+    return {
+        "label": args.label,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"products": args.products, "workers": args.workers, "mode": args.mode,
+                   "latency_ms": args.latency_ms, "asset_kb": args.asset_kb, "bom_rows": args.bom_rows},
+        "products_per_minute": summary["products_per_minute"],
+        "elapsed_seconds": summary["elapsed_seconds"],
+        "ok": summary["ok"],
+        "failed": summary["failed"],
+        "timeout": summary["timeout"],
+        "peak_memory_mib": round(memory.peak / 1024 ** 2, 1),
+        "fixture_requests": site.requests,
+        "stages": metrics_report["stages"],
+        "counters": metrics_report["counters"],
+        "output_dir": output_dir,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the scraping pipeline against the local fixture site")
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--latency-ms", type=int, default=100, help="latency added to every fixture response")
+    parser.add_argument("--asset-kb", type=int, default=256)
+    parser.add_argument("--bom-rows", type=int, default=12)
+    parser.add_argument("--label", default="current")
+    parser.add_argument("--compare", help="previous benchmark report to compare against")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stdout,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    report = run_benchmark(args)
+
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    report_path = os.path.join(BENCHMARK_DIR, f"{args.label}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{report['ok']}/{args.products} products ok, {report['products_per_minute']} products/min, "
+          f"peak memory {report['peak_memory_mib']} MiB")
+    for stage, stats in report["stages"].items():
+        print(f"  {stage:<20} n={stats['count']:<5} p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+    print(f"Report saved to {report_path}")
@@ -0,0 +1,124 @@
+import os
+import shutil
+import hashlib
+import logging
+import threading
+from typing import Iterable, Tuple
+
+# local imports
+from utils import BLOB_STORE_DIR
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def link_or_copy(src: str, dest: str):
+    # hardlinks src to dest (replacing dest), copying when hardlinks are not supported
+    tmp_dest = f"{dest}.tmp{os.getpid()}_{threading.get_ident()}"
+    try:
+        os.link(src, tmp_dest)
+    except OSError:
+        shutil.copyfile(src, tmp_dest)
+    os.replace(tmp_dest, dest)
+
+
+def hash_file(path: str) -> Tuple[str, int]:
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+class BlobStore:
+    # content-addressed store: every unique asset is kept once as root/<sha[:2]>/<sha>
+    # and product folders hold hardlinks to it
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def has(self, sha256: str) -> bool:
+        return os.path.exists(self.path_for(sha256))
+
+    def write_stream(self, chunks: Iterable[bytes]) -> Tuple[str, int]:
+        # stores a stream of bytes, hashing it on the way. Returns (sha256, size)
+        tmp_path = os.path.join(self.root, f"incoming.{os.getpid()}_{threading.get_ident()}")
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        sha256.update(chunk)
+                        size += len(chunk)
+            digest = sha256.hexdigest()
+            self._commit(tmp_path, digest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return digest, size
+
+    def dedupe_file(self, path: str) -> Tuple[str, int]:
+        # moves an existing file (e.g. a browser download) into the store and leaves a hardlink
+        # in its place. A file already in the store only keeps a link to the stored copy
+        digest, size = hash_file(path)
+        blob_path = self.path_for(digest)
+        if os.path.exists(blob_path):
+            if not os.path.samefile(blob_path, path):
+                link_or_copy(blob_path, path)
+                logger.debug(f"{path} deduplicated against blob {digest}")
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            try:
+                os.link(path, blob_path)
+            except FileExistsError:
+                link_or_copy(blob_path, path)
+            except OSError:
+                shutil.copyfile(path, blob_path)
+        return digest, size
+
+    def link_into(self, sha256: str, dest: str):
+        # places the blob at dest, skipping the write when dest is already a link to it
+        blob_path = self.path_for(sha256)
+        if os.path.exists(dest):
+            try:
+                if os.path.samefile(blob_path, dest):
+                    return
+            except OSError:
+                pass
+        link_or_copy(blob_path, dest)
+
+    def remove(self, sha256: str):
+        # product files linked to the blob keep their data
+        try:
+            os.remove(self.path_for(sha256))
+        except OSError:
+            pass
+
+    def _commit(self, tmp_path: str, sha256: str):
+        blob_path = self.path_for(sha256)
+        if os.path.exists(blob_path):
+            return
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(tmp_path, blob_path)
+
+
+_blob_store: BlobStore | None = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    # one store instance per process
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None:
+            _blob_store = BlobStore()
+        return _blob_store
@@ -0,0 +1,152 @@
+import os
+import logging
+from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException, StaleElementReferenceException
+
+# local imports
+from selenium_utils import click_tab, safe_find_element
+from blob_store import get_blob_store
+from download_watcher import DownloadWatcher
+from metrics import metrics
+from utils import ASSETS_BASE_DIR, clean_filename
+
+logger = logging.getLogger(__name__)
+
+# browser side of the CAD download: the Drawings tab dropdown and chrome's own download. Kept apart from
+# asset_downloader so the commands that only download over HTTP never import selenium
+
+
+def select_dwg_format(driver: WebDriver):
+    # Goes to the Drawings tab and picks the first DWG option in the dropdown. Returns the enabled download button or None
+
+    if not click_tab(driver, 'drawings'):
+        logger.warning("Error accessing drawings tab")
+        return None
+
+    logger.debug("Drawings tab accessed")
+
+    cad_section_locator = (By.CSS_SELECTOR, '.pane[data-tab="drawings"] .section.cadfiles')
+    if not safe_find_element(driver, *cad_section_locator, wait_time=10):
+        logger.warning("CAD files section found")
+        return None
+
+    dropdown_input_locator = (By.CSS_SELECTOR, '.pane[data-tab="drawings"] .k-dropdown-wrap .k-input')
+    try:
+        dropdown_input = WebDriverWait(driver, 15).until(EC.element_to_be_clickable(dropdown_input_locator))
+        logger.debug("Dropdown found")
+        dropdown_input.click()
+        logger.debug("Dropdown clicked")
+
+    except (TimeoutException, NoSuchElementException, StaleElementReferenceException) as e:
+        logger.warning(f"Error clicking dropdown: {e}")
+        return None
+
+    dropdown_list_locator = (By.XPATH, "//div[contains(@class, 'k-animation-container') and not(@aria-hidden='true')]//ul[@role='listbox']")
+    first_dwg_option = None
+    option_text_found = None
+
+    try:
+        WebDriverWait(driver, 10).until(EC.visibility_of_element_located(dropdown_list_locator))
+        logger.debug("Kendo UI dropdown list visible")
+
+        list_items_locator = (By.XPATH, "//div[contains(@class, 'k-animation-container') and not(@aria-hidden='true')]//li[@role='option']")
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located(list_items_locator))
+
+        list_items = driver.find_elements(*list_items_locator)
+        logger.debug(f"{len(list_items)} options found in the dropdown list")
+
+        for item in list_items:
+            try:
+                item_text = item.text
+                if "DWG" in item_text.upper():
+                    first_dwg_option = item
+                    option_text_found = item_text
+                    logger.info(f"First option containing DWG: '{option_text_found}'")
+                    break
+            except StaleElementReferenceException:
+                 logger.debug("StaleElementReferenceException while verifying this item. Skipping")
+                 continue
+
+        if first_dwg_option:
+            WebDriverWait(driver, 10).until(EC.element_to_be_clickable(first_dwg_option))
+            first_dwg_option.click()
+            logger.info(f"Option '{option_text_found}' clicked.")
+        else:
+            logger.warning("No DWG option in the dropdown. CAD was NOT downloaded")
+            return None
+
+    except (TimeoutException, NoSuchElementException, StaleElementReferenceException) as e:
+        logger.warning(f"Error finding or clicking DWG. CAD was NOT downloaded : {e}")
+        return None
+
+    logger.debug("Waiting for the download button")
+    download_button_locator = (By.ID, 'cadDownload')
+    download_button = None
+    try:
+        download_button = WebDriverWait(driver, 15).until(EC.element_to_be_clickable(download_button_locator))
+        WebDriverWait(driver, 5).until(lambda driver: driver.find_element(*download_button_locator).get_attribute("aria-disabled") == "false")
+        logger.info("Button found and clickable")
+
+    except (TimeoutException, NoSuchElementException, StaleElementReferenceException) as e:
+        logger.warning(f"Button not found or cliclable: {e}")
+        return None
+
+    return download_button
+
+
+def download_cad_interactively(driver: WebDriver, product_id: str, selenium_download_dir: str) -> str | None:
+    
+    # Goes to the Drawings tab, interacts with the dropdown, clicks the download button and returns the downloaded file path.
+    # selenium_download_dir must be a folder only the browser writes to: the first new file in it is taken as the CAD
+   
+    logger.info("Starting CAD download")
+
+    cleaned_product_id = clean_filename(product_id)
+    logger.debug(f"path set to {selenium_download_dir}")
+
+    download_button = select_dwg_format(driver)
+    if download_button is None:
+        return None
+
+    files_before = os.listdir(selenium_download_dir)
+    logger.debug(f"Files in directory before the click {files_before}")
+
+    timeout_seconds = 30
+    # the watcher is armed before the click so the file creation event can't be missed
+    with DownloadWatcher(selenium_download_dir) as download_watcher:
+        try:
+            download_button.click()
+            logger.info("Button clicked")
+
+        except (ElementClickInterceptedException, Exception) as e:
+            logger.warning(f"Error clicking: {e}")
+            return None
+
+        logger.info(f"Waiting for the file at '{selenium_download_dir}'...")
+        with metrics.span("cad_wait"):
+            downloaded_file_name = download_watcher.wait_for_new_file(files_before, timeout_seconds)
+
+    if not downloaded_file_name:
+        logger.warning(f"Timeout {timeout_seconds}s ")
+        return None
+
+    # moved from the browser's folder to the product's assets folder
+    product_asset_subdir = os.path.join(ASSETS_BASE_DIR, cleaned_product_id)
+    os.makedirs(product_asset_subdir, exist_ok=True)
+    full_downloaded_path = os.path.join(product_asset_subdir, downloaded_file_name)
+    try:
+        os.replace(os.path.join(selenium_download_dir, downloaded_file_name), full_downloaded_path)
+    except OSError as e:
+        logger.warning(f"Error moving the CAD download {downloaded_file_name}: {e}")
+        return None
+    logger.info(f"CAD downloaded: {downloaded_file_name}")
+    try:
+        # products sharing a drawing keep a single copy on disk
+        get_blob_store().dedupe_file(full_downloaded_path)
+    except OSError as e:
+        logger.warning(f"Error adding CAD to the asset store: {e}")
+    relative_path = os.path.join(os.path.basename(ASSETS_BASE_DIR), cleaned_product_id, downloaded_file_name).replace('\\', '/')
+    return relative_path
\ No newline at end of file
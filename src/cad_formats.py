@@ -0,0 +1,45 @@
+import re
+import json
+import logging
+from typing import Dict, List, Any
+from urllib.parse import urlparse
+
+# local imports
+from utils import CAD_DOWNLOAD_ALL_FORMATS
+
+logger = logging.getLogger(__name__)
+
+# CAD formats listed in the Drawings dropdown's data source, read from the static html, the rendered
+# page or an archived snapshot
+
+# init('<product id>', '', 'ng-init', '<formats json>', '<drawings json>') on the #drawings section
+NG_INIT_FORMATS_RE = re.compile(r"init\(\s*'[^']*'\s*,\s*'[^']*'\s*,\s*'[^']*'\s*,\s*'(\[.*?\])'", re.DOTALL)
+
+
+def parse_cad_formats(ng_init: str | None) -> List[Dict[str, Any]]:
+    # reads the CAD formats listed in the dropdown's data source (name, file name, url, 2D/3D)
+    if not ng_init:
+        return []
+    match = NG_INIT_FORMATS_RE.search(ng_init)
+    if not match:
+        return []
+    try:
+        formats = json.loads(match.group(1))
+    except ValueError as e:
+        logger.debug(f"Error parsing CAD formats: {e}")
+        return []
+    return [{
+        "name": f.get("name"),
+        "file_name": f.get("value"),
+        "url": f.get("url"),
+        "filetype": f.get("filetype"),
+    } for f in formats if isinstance(f, dict)]
+
+
+def select_cad_formats(formats: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # the first DWG format (the one the interactive flow downloads) first, then optionally every other format
+    downloadable = [f for f in formats if f.get("url") and urlparse(f["url"]).scheme in ("http", "https")]
+    dwg = [f for f in downloadable if "DWG" in (f.get("name") or "").upper()][:1]
+    if not CAD_DOWNLOAD_ALL_FORMATS:
+        return dwg
+    return dwg + [f for f in downloadable if f not in dwg]
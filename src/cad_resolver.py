@@ -0,0 +1,117 @@
+import json
+import time
+import logging
+from typing import TYPE_CHECKING, Dict, List, Any
+
+import requests
+
+# local imports
+from cad_formats import parse_cad_formats, select_cad_formats
+from http_extraction import get_http_session
+from metrics import metrics
+from rate_limiter import get_rate_limiter
+from utils import CAD_URL_SOURCE, CAD_PROBE_TIMEOUT_SECONDS
+
+if TYPE_CHECKING:
+    from selenium.webdriver.remote.webdriver import WebDriver
+
+logger = logging.getLogger(__name__)
+
+CAD_CAPTURE_TIMEOUT_SECONDS = 15
+
+
+def cad_formats_from_driver(driver: "WebDriver") -> List[Dict[str, Any]]:
+    ng_init = driver.execute_script(
+        "var section = document.getElementById('drawings');"
+        "return section ? section.getAttribute('ng-init') : null;")
+    return parse_cad_formats(ng_init)
+
+
+def _drain_performance_log(driver: "WebDriver") -> List[Dict[str, Any]]:
+    messages = []
+    for entry in driver.get_log("performance"):
+        try:
+            messages.append(json.loads(entry["message"])["message"])
+        except (KeyError, ValueError):
+            continue
+    return messages
+
+
+def capture_cad_download(driver: "WebDriver", download_dir: str) -> Dict[str, Any] | None:
+    # runs the dropdown flow but denies the download, reading the URL chrome was about to fetch
+    # from the Page.downloadWillBegin event in the performance log
+    # driver_pool (and undetected_chromedriver) and selenium are only needed here, not by the HTTP extraction
+    from driver_pool import set_download_dir
+    from cad_browser import select_dwg_format
+
+    download_button = select_dwg_format(driver)
+    if download_button is None:
+        return None
+
+    _drain_performance_log(driver)
+    driver.execute_cdp_cmd("Page.setDownloadBehavior", {"behavior": "deny"})
+    captured = None
+    try:
+        download_button.click()
+        end_time = time.monotonic() + CAD_CAPTURE_TIMEOUT_SECONDS
+        while captured is None and time.monotonic() < end_time:
+            for message in _drain_performance_log(driver):
+                if message.get("method") == "Page.downloadWillBegin":
+                    params = message.get("params", {})
+                    captured = {
+                        "name": "DWG",
+                        "file_name": params.get("suggestedFilename"),
+                        "url": params.get("url"),
+                    }
+                    break
+            else:
+                time.sleep(0.2)
+    finally:
+        set_download_dir(driver, download_dir)
+
+    if not captured or not captured["url"]:
+        logger.warning("CAD download request not captured")
+        return None
+
+    # the request is replayed outside the browser with the page's cookies
+    cookies = "; ".join(f"{c['name']}={c['value']}" for c in driver.get_cookies())
+    captured["headers"] = {"Cookie": cookies, "Referer": driver.current_url}
+    logger.info(f"CAD URL captured: {captured['url']}")
+    return captured
+
+
+def probe_cad_url(url: str) -> bool:
+    # whether the data source URL serves a file. Only the headers are read, the body is left unread
+    try:
+        with get_rate_limiter().request(url) as slot, metrics.span("cad_probe"), \
+                get_http_session().get(url, stream=True, timeout=CAD_PROBE_TIMEOUT_SECONDS) as response:
+            slot.observe_response(response)
+            content_type = response.headers.get("Content-Type", "")
+            return response.ok and not content_type.startswith("text/html")
+    except requests.exceptions.RequestException as e:
+        logger.info(f"CAD data source URL {url} not reachable: {e}")
+        return False
+
+
+def resolve_cad_downloads(driver: "WebDriver | None", download_dir: str,
+                          cad_formats: List[Dict[str, Any]] | None = None, probe: bool = True) -> List[Dict[str, Any]]:
+    # resolves the CAD files to direct URLs. The first item is the DWG used for product_data['assets']['cad'].
+    # Without a driver only the data source parsed from the static html can be used. probe=False skips
+    # the data source probe of "auto", when it already failed for this product
+    if cad_formats is None and driver is not None:
+        cad_formats = cad_formats_from_driver(driver)
+    selected = select_cad_formats(cad_formats or [])
+
+    if CAD_URL_SOURCE == "data_source":
+        return selected
+    if CAD_URL_SOURCE == "auto" and probe and selected and probe_cad_url(selected[0]["url"]):
+        return selected
+
+    if driver is None:
+        return []
+    with metrics.span("cad_capture"):
+        captured = capture_cad_download(driver, download_dir)
+    if not captured:
+        return []
+    # the other formats can only come from the data source
+    return [captured] + selected[1:]
@@ -0,0 +1,332 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator, Tuple
+
+# local imports
+from utils import DATA_OUTPUT_DIR, JSONL_OUTPUT_PATH, CATALOG_INDEX_PATH
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    product_id TEXT NOT NULL UNIQUE,
+    name TEXT,
+    description TEXT,
+    hp REAL,
+    voltage TEXT,
+    rpm INTEGER,
+    frame TEXT COLLATE NOCASE,
+    data TEXT NOT NULL,
+    source_path TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_hp ON products (hp);
+CREATE INDEX IF NOT EXISTS products_rpm ON products (rpm);
+CREATE INDEX IF NOT EXISTS products_frame ON products (frame);
+CREATE TABLE IF NOT EXISTS voltages (
+    product_id INTEGER NOT NULL,
+    volts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS voltages_volts ON voltages (volts, product_id);
+CREATE INDEX IF NOT EXISTS voltages_product ON voltages (product_id);
+CREATE TABLE IF NOT EXISTS specs (
+    product_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS specs_name_value ON specs (name, value);
+CREATE INDEX IF NOT EXISTS specs_product ON specs (product_id);
+CREATE TABLE IF NOT EXISTS bom (
+    product_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    part_number TEXT NOT NULL COLLATE NOCASE,
+    description TEXT,
+    quantity
+);
+CREATE INDEX IF NOT EXISTS bom_part_number ON bom (part_number);
+CREATE INDEX IF NOT EXISTS bom_product ON bom (product_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(description, specs, bom, tokenize = 'unicode61');
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    offset INTEGER NOT NULL DEFAULT 0,
+    product_id TEXT
+);
+"""
+
+PRODUCT_COLUMNS = "p.product_id, p.name, p.description, p.hp, p.voltage, p.rpm, p.frame, p.source_path"
+
+
+def parse_volts(voltage: str | None) -> List[float]:
+    # "230/460.0 V @ 60 HZ" -> [230.0, 460.0]
+    if not voltage:
+        return []
+    return [float(v) for v in re.findall(r'\d+(?:\.\d+)?', voltage.split('@', 1)[0])]
+
+
+def _to_float(value: Any) -> float | None:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value: Any) -> int | None:
+    number = _to_float(value)
+    return int(number) if number is not None else None
+
+
+def _fts_query(text: str) -> str:
+    # every word must match, quoted so user input can't break the FTS syntax. word* stays a prefix query
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    return " ".join(terms)
+
+
+class CatalogIndex:
+    # SQLite index over the scraped products: top level fields, specs, BOM lines and a full-text
+    # index of descriptions, spec values and BOM descriptions. Updated incrementally from the
+    # product JSON files (by mtime/size) and the JSON Lines output (by offset)
+
+    def __init__(self, path: str = CATALOG_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- building ---
+
+    def _delete_product(self, conn: sqlite3.Connection, row_id: int):
+        for table in ("voltages", "specs", "bom"):
+            conn.execute(f"DELETE FROM {table} WHERE product_id = ?", (row_id,))
+        conn.execute("DELETE FROM products_fts WHERE rowid = ?", (row_id,))
+        conn.execute("DELETE FROM products WHERE id = ?", (row_id,))
+
+    def _index_product(self, conn: sqlite3.Connection, product_data: Dict[str, Any], source_path: str):
+        product_id = product_data.get('product_id')
+        if not product_id:
+            return
+        existing = conn.execute("SELECT id FROM products WHERE product_id = ?", (product_id,)).fetchone()
+        if existing:
+            self._delete_product(conn, existing["id"])
+
+        specs = product_data.get('specs') or {}
+        bom = product_data.get('bom') or []
+        row_id = conn.execute(
+            "INSERT INTO products (product_id, name, description, hp, voltage, rpm, frame, data, source_path, indexed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (product_id, product_data.get('name'), product_data.get('description'), _to_float(product_data.get('hp')),
+             product_data.get('voltage'), _to_int(product_data.get('rpm')), product_data.get('frame'),
+             json.dumps(product_data, ensure_ascii=False), source_path, time.time())).lastrowid
+        conn.executemany("INSERT INTO voltages (product_id, volts) VALUES (?, ?)",
+                         [(row_id, volts) for volts in set(parse_volts(product_data.get('voltage')))])
+        conn.executemany("INSERT INTO specs (product_id, name, value) VALUES (?, ?, ?)",
+                         [(row_id, name, value) for name, value in specs.items()])
+        conn.executemany("INSERT INTO bom (product_id, position, part_number, description, quantity) VALUES (?, ?, ?, ?, ?)",
+                         [(row_id, position, entry.get('part_number'), entry.get('description'), entry.get('quantity'))
+                          for position, entry in enumerate(bom) if entry.get('part_number')])
+        conn.execute("INSERT INTO products_fts (rowid, description, specs, bom) VALUES (?, ?, ?, ?)",
+                     (row_id, product_data.get('description') or "",
+                      " ".join(f"{name} {value}" for name, value in specs.items()),
+                      " ".join(f"{e.get('part_number', '')} {e.get('description') or ''}" for e in bom)))
+
+    def _update_json_files(self, conn: sqlite3.Connection, directory: str) -> Tuple[int, int]:
+        # one product per <product_id>.json, reindexed when its mtime or size changed
+        known = {row["path"]: row for row in conn.execute("SELECT * FROM sources WHERE kind = 'json'")}
+        indexed, removed = 0, 0
+        seen = set()
+        for entry in os.scandir(directory):
+            if not entry.is_file() or not entry.name.endswith('.json'):
+                continue
+            seen.add(entry.path)
+            stat = entry.stat()
+            source = known.get(entry.path)
+            if source and source["mtime_ns"] == stat.st_mtime_ns and source["size"] == stat.st_size:
+                continue
+            try:
+                with open(entry.path, encoding='utf-8') as f:
+                    product_data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Error reading {entry.path}: {e}")
+                continue
+            if not isinstance(product_data, dict) or 'product_id' not in product_data:
+                continue
+            self._index_product(conn, product_data, entry.path)
+            conn.execute("INSERT OR REPLACE INTO sources (path, kind, mtime_ns, size, offset, product_id) VALUES (?, 'json', ?, ?, 0, ?)",
+                         (entry.path, stat.st_mtime_ns, stat.st_size, product_data['product_id']))
+            indexed += 1
+
+        # products whose file was deleted leave the index
+        for path, source in known.items():
+            if path not in seen and os.path.dirname(path) == directory:
+                product = conn.execute("SELECT id FROM products WHERE product_id = ? AND source_path = ?",
+                                       (source["product_id"], path)).fetchone()
+                if product:
+                    self._delete_product(conn, product["id"])
+                conn.execute("DELETE FROM sources WHERE path = ?", (path,))
+                removed += 1
+        return indexed, removed
+
+    def _update_jsonl(self, conn: sqlite3.Connection, path: str) -> int:
+        # the JSON Lines output is append-only, only the lines after the last indexed offset are read
+        if not os.path.exists(path):
+            return 0
+        stat = os.stat(path)
+        source = conn.execute("SELECT * FROM sources WHERE path = ?", (path,)).fetchone()
+        offset = source["offset"] if source else 0
+        if stat.st_size < offset:
+            # truncated or rewritten
+            offset = 0
+
+        indexed = 0
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # a line still being written
+                    break
+                offset += len(line)
+                try:
+                    product_data = json.loads(line)
+                except ValueError:
+                    continue
+                self._index_product(conn, product_data, path)
+                indexed += 1
+        conn.execute("INSERT OR REPLACE INTO sources (path, kind, mtime_ns, size, offset, product_id) "
+                     "VALUES (?, 'jsonl', ?, ?, ?, NULL)", (path, stat.st_mtime_ns, stat.st_size, offset))
+        return indexed
+
+    def update(self, json_dir: str = DATA_OUTPUT_DIR, jsonl_path: str = JSONL_OUTPUT_PATH) -> Dict[str, Any]:
+        # indexes the new and changed products only
+        start = time.monotonic()
+        with self._connect() as conn:
+            indexed, removed = self._update_json_files(conn, json_dir) if os.path.isdir(json_dir) else (0, 0)
+            indexed += self._update_jsonl(conn, jsonl_path)
+            total = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        result = {"indexed": indexed, "removed": removed, "products": total,
+                  "elapsed_seconds": round(time.monotonic() - start, 3)}
+        logger.info(f"Catalog index updated: {result}")
+        return result
+
+    def rebuild(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            for table in ("voltages", "specs", "bom", "products_fts", "products", "sources"):
+                conn.execute(f"DELETE FROM {table}")
+        return self.update()
+
+    # --- queries ---
+
+    def _query(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def search(self, text: str, limit: int = 50) -> List[Dict[str, Any]]:
+        # full-text search on descriptions, spec values and BOM descriptions, best matches first
+        query = _fts_query(text)
+        if not query:
+            return []
+        return self._query(f"SELECT {PRODUCT_COLUMNS} FROM products_fts f JOIN products p ON p.id = f.rowid "
+                           "WHERE products_fts MATCH ? ORDER BY f.rank LIMIT ?", (query, limit))
+
+    def find(self, hp: float | None = None, voltage: float | None = None, rpm: int | None = None,
+             frame: str | None = None, specs: Dict[str, str] | None = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        # products matching every given field, e.g. find(voltage=460, rpm=1800, frame="256T")
+        conditions, params = [], []
+        if hp is not None:
+            conditions.append("p.hp = ?")
+            params.append(hp)
+        if rpm is not None:
+            conditions.append("p.rpm = ?")
+            params.append(rpm)
+        if frame is not None:
+            conditions.append("p.frame = ?")
+            params.append(frame)
+        if voltage is not None:
+            conditions.append("EXISTS (SELECT 1 FROM voltages v WHERE v.product_id = p.id AND v.volts = ?)")
+            params.append(voltage)
+        for name, value in (specs or {}).items():
+            conditions.append("EXISTS (SELECT 1 FROM specs s WHERE s.product_id = p.id AND s.name = ? AND s.value = ?)")
+            params.extend([name, value])
+        where = " AND ".join(conditions) or "1"
+        return self._query(f"SELECT {PRODUCT_COLUMNS} FROM products p WHERE {where} ORDER BY p.product_id LIMIT ?",
+                           (*params, limit))
+
+    def where_used(self, part_number: str, prefix: bool = False, limit: int = 1000) -> List[Dict[str, Any]]:
+        # reverse BOM lookup: the products whose BOM lists the part
+        operator, value = ("LIKE", part_number.replace('%', r'\%').replace('_', r'\_') + '%') if prefix else ("=", part_number)
+        escape = r" ESCAPE '\'" if prefix else ""
+        return self._query(
+            f"SELECT {PRODUCT_COLUMNS}, b.part_number, b.description AS part_description, b.quantity "
+            f"FROM bom b JOIN products p ON p.id = b.product_id "
+            f"WHERE b.part_number {operator} ?{escape} ORDER BY p.product_id LIMIT ?", (value, limit))
+
+    def get(self, product_id: str) -> Dict[str, Any] | None:
+        rows = self._query("SELECT data FROM products WHERE product_id = ?", (product_id,))
+        return json.loads(rows[0]["data"]) if rows else None
+
+
+def _print_rows(rows: List[Dict[str, Any]], elapsed: float):
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    print(f"{len(rows)} results in {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexes and queries the scraped products")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index new and changed products")
+    build.add_argument("--full", action="store_true", help="rebuild the index from scratch")
+    search = commands.add_parser("search", help="full-text search")
+    search.add_argument("text")
+    search.add_argument("--limit", type=int, default=50)
+    find = commands.add_parser("find", help="products matching the given fields")
+    find.add_argument("--hp", type=float)
+    find.add_argument("--voltage", type=float)
+    find.add_argument("--rpm", type=int)
+    find.add_argument("--frame")
+    find.add_argument("--spec", action="append", default=[], metavar="NAME=VALUE")
+    find.add_argument("--limit", type=int, default=1000)
+    where_used = commands.add_parser("where-used", help="products whose BOM lists a part")
+    where_used.add_argument("part_number")
+    where_used.add_argument("--prefix", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    index = CatalogIndex()
+    start = time.monotonic()
+    if args.command == "build":
+        print(json.dumps(index.rebuild() if args.full else index.update()))
+    elif args.command == "search":
+        _print_rows(index.search(args.text, args.limit), time.monotonic() - start)
+    elif args.command == "find":
+        spec_filters = dict(spec.split("=", 1) for spec in args.spec)
+        _print_rows(index.find(args.hp, args.voltage, args.rpm, args.frame, spec_filters, args.limit),
+                    time.monotonic() - start)
+    elif args.command == "where-used":
+        _print_rows(index.where_used(args.part_number, args.prefix), time.monotonic() - start)
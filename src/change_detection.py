@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterable, Iterator
+from urllib.parse import urljoin
+
+import lxml.html
+import requests
+
+# local imports
+from snapshot_store import get_snapshot_store
+from metrics import metrics
+from rate_limiter import get_rate_limiter
+from utils import (BASE_URL, DATA_OUTPUT_DIR, CATALOG_INDEX_PATH, FINGERPRINT_DB_PATH, HTTP_TIMEOUT_SECONDS,
+                   clean_filename)
+
+logger = logging.getLogger(__name__)
+
+# delta runs: one cheap request per product tells whether its page changed since the last scrape,
+# by the HTTP validators (ETag/Last-Modified, a 304 costs no body) or else by a hash of the text and
+# links of its specs, parts and drawings panes. Only new and changed products get the full scrape,
+# and the fields that changed are recorded
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    product_id TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    checked_at REAL NOT NULL,
+    changed_at REAL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id TEXT NOT NULL,
+    detected_at REAL NOT NULL,
+    fields TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_product_id ON changes (product_id);
+"""
+
+# attributes that carry content: asset links and the CAD formats' data source
+FINGERPRINT_ATTRIBUTES = ("href", "src", "ng-init")
+TOP_LEVEL_FIELDS = ("name", "description", "hp", "voltage", "rpm", "frame")
+
+
+class FingerprintStore:
+    # last known fingerprint of every product and the history of its changes
+
+    def __init__(self, path: str = FINGERPRINT_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # short-lived connections, fingerprints are read from scraper threads and worker processes
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, product_id: str) -> Dict[str, Any] | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM fingerprints WHERE product_id = ?", (product_id,)).fetchone()
+        return dict(row) if row else None
+
+    def record_check(self, product_id: str, etag: str | None, last_modified: str | None, content_hash: str | None):
+        # validators and hash of the page as last scraped (or found unchanged)
+        with self._connect() as conn:
+            conn.execute("INSERT INTO fingerprints (product_id, etag, last_modified, content_hash, checked_at) "
+                         "VALUES (?, ?, ?, ?, ?) ON CONFLICT(product_id) DO UPDATE SET "
+                         "etag = COALESCE(excluded.etag, etag), last_modified = COALESCE(excluded.last_modified, last_modified), "
+                         "content_hash = COALESCE(excluded.content_hash, content_hash), checked_at = excluded.checked_at",
+                         (product_id, etag, last_modified, content_hash, time.time()))
+
+    def record_change(self, product_id: str, fields: List[str]):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT INTO changes (product_id, detected_at, fields) VALUES (?, ?, ?)",
+                         (product_id, now, json.dumps(fields)))
+            conn.execute("UPDATE fingerprints SET changed_at = ? WHERE product_id = ?", (now, product_id))
+
+    def changes(self, product_ids: Iterable[str] | None = None, limit: int = 100) -> List[Dict[str, Any]]:
+        # most recent first
+        with self._connect() as conn:
+            if product_ids is None:
+                rows = conn.execute("SELECT * FROM changes ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = []
+                for p_id in product_ids:
+                    rows.extend(conn.execute("SELECT * FROM changes WHERE product_id = ? ORDER BY id DESC LIMIT ?",
+                                             (p_id, limit)).fetchall())
+        return [{**dict(row), "fields": json.loads(row["fields"])} for row in rows]
+
+
+def fingerprint_fragments(panes: Dict[str, str], assets: List[str]) -> str | None:
+    # sha256 of the panes' whitespace-normalized text and content attributes. Markup, ids and
+    # classes are left out, so a page re-rendered the same way hashes the same
+    if not panes:
+        return None
+    digest = hashlib.sha256()
+    for name, html in sorted(panes.items()) + [("assets", fragment) for fragment in assets]:
+        try:
+            root = lxml.html.fragment_fromstring(html, create_parent="div")
+        except (ValueError, lxml.etree.ParserError):
+            continue
+        digest.update(name.encode('utf-8') + b"\0")
+        digest.update(" ".join(root.text_content().split()).encode('utf-8') + b"\0")
+        for element in root.iter():
+            for attribute in FINGERPRINT_ATTRIBUTES:
+                value = element.get(attribute)
+                if value:
+                    digest.update(f"{attribute}={value}".encode('utf-8') + b"\0")
+    return digest.hexdigest()
+
+
+def snapshot_fingerprint(product_id: str) -> str | None:
+    # fingerprint of the archived snapshot, for products scraped before their first delta run. Only
+    # snapshots of the static html compare with the fetched page: panes archived from the rendered DOM
+    # hash differently and would report every browser-scraped product as changed
+    snapshot = get_snapshot_store().load(product_id)
+    if snapshot is None or snapshot.get("source") != "http":
+        return None
+    return fingerprint_fragments(snapshot.get("panes") or {}, snapshot.get("assets") or [])
+
+
+def check_product(product_id: str) -> Dict[str, Any]:
+    # whether the product must be scraped again. reason: new, not_modified, unchanged, changed,
+    # or unknown when the page couldn't be fetched or parsed (then it is scraped, to be safe).
+    # When a page was fetched, "fetched" holds (html, final url) so the scrape doesn't fetch it again
+    # imported here, the change history is also read by commands that never fetch (cli.py changes)
+    from http_extraction import get_http_session, pane_fragments
+
+    check: Dict[str, Any] = {"changed": True, "reason": "new", "etag": None, "last_modified": None, "content_hash": None,
+                             "fetched": None}
+    stored = get_fingerprint_store().get(product_id) or {}
+    known_hash = stored.get("content_hash") or snapshot_fingerprint(product_id)
+
+    full_url = urljoin(BASE_URL, product_id)
+    headers = {}
+    if stored.get("etag"):
+        headers["If-None-Match"] = stored["etag"]
+    if stored.get("last_modified"):
+        headers["If-Modified-Since"] = stored["last_modified"]
+    try:
+        with get_rate_limiter().request(full_url) as slot, metrics.span("change_check"):
+            response = get_http_session().get(full_url, headers=headers, timeout=HTTP_TIMEOUT_SECONDS)
+            slot.observe_response(response)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Error checking {full_url} for changes: {e}")
+        return {**check, "reason": "unknown" if known_hash else "new"}
+
+    check["etag"] = response.headers.get("ETag")
+    check["last_modified"] = response.headers.get("Last-Modified")
+    if response.status_code == 304:
+        return {**check, "changed": False, "reason": "not_modified", "content_hash": known_hash}
+
+    metrics.increment("page_bytes", len(response.content))
+    check["fetched"] = (response.text, response.url)
+    try:
+        fragments = pane_fragments(lxml.html.fromstring(response.text))
+        check["content_hash"] = fingerprint_fragments(fragments["panes"], fragments["assets"])
+    except Exception as e:
+        logger.warning(f"Error fingerprinting {product_id}: {e}")
+    if not known_hash:
+        return check
+    if not check["content_hash"]:
+        return {**check, "reason": "unknown"}
+    if check["content_hash"] == known_hash:
+        return {**check, "changed": False, "reason": "unchanged"}
+    return {**check, "reason": "changed"}
+
+
+def previous_product_data(product_id: str) -> Dict[str, Any] | None:
+    # the product as saved by the last scrape: its JSON file, or the catalog index for JSON Lines output
+    json_filepath = os.path.join(DATA_OUTPUT_DIR, f"{clean_filename(product_id)}.json")
+    try:
+        with open(json_filepath, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.debug(f"Error reading {json_filepath}: {e}")
+    if not os.path.exists(CATALOG_INDEX_PATH):
+        return None
+    from catalog_index import CatalogIndex
+    try:
+        return CatalogIndex().get(product_id)
+    except sqlite3.Error:
+        return None
+
+
+def diff_products(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    # names of the fields that differ: top level fields, specs.<label>, bom and assets.<type>
+    fields = [field for field in TOP_LEVEL_FIELDS if old.get(field) != new.get(field)]
+    old_specs, new_specs = old.get('specs') or {}, new.get('specs') or {}
+    fields += [f"specs.{label}" for label in sorted(set(old_specs) | set(new_specs))
+               if old_specs.get(label) != new_specs.get(label)]
+    if (old.get('bom') or []) != (new.get('bom') or []):
+        fields.append("bom")
+    old_assets, new_assets = old.get('assets') or {}, new.get('assets') or {}
+    fields += [f"assets.{asset_type}" for asset_type in ("image", "manual", "cad")
+               if old_assets.get(asset_type) != new_assets.get(asset_type)]
+    return fields
+
+
+def record_scrape(product_id: str, check: Dict[str, Any] | None, previous: Dict[str, Any] | None,
+                  product_data: Dict[str, Any]) -> List[str]:
+    # called once a changed or new product was scraped and saved: stores its new fingerprint
+    # and the fields that changed
+    store = get_fingerprint_store()
+    check = check or {}
+    content_hash = check.get("content_hash") or snapshot_fingerprint(product_id)
+    store.record_check(product_id, check.get("etag"), check.get("last_modified"), content_hash)
+    fields = diff_products(previous, product_data) if previous else ["new"]
+    if fields:
+        store.record_change(product_id, fields)
+        logger.info(f"{product_id} changed: {', '.join(fields[:10])}" + (" ..." if len(fields) > 10 else ""))
+    return fields
+
+
+_fingerprint_store: FingerprintStore | None = None
+_fingerprint_store_lock = threading.Lock()
+
+
+def get_fingerprint_store() -> FingerprintStore:
+    # one store instance per process
+    global _fingerprint_store
+    with _fingerprint_store_lock:
+        if _fingerprint_store is None:
+            _fingerprint_store = FingerprintStore()
+        return _fingerprint_store
@@ -0,0 +1,223 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from typing import List
+
+# local imports
+from utils import DATA_OUTPUT_DIR, OUTPUT_FORMAT, ensure_output_dirs
+
+logger = logging.getLogger(__name__)
+
+# single entry point with one subcommand per operation. Each command imports what it needs when it runs,
+# so the ones that never open a browser (verify, export, rederive...) skip selenium, undetected_chromedriver
+# and pyarrow and start in a fraction of a second
+
+
+def cmd_scrape(args: argparse.Namespace) -> int:
+    from scrape_runner import run_scrape
+    from job_store import JobStore
+    from output_sinks import create_sink
+    from id_sources import product_id_source
+    from utils import (PROJECT_ROOT, USE_JOB_STORE, SCRAPE_WORKERS, SCRAPE_MODE, UPDATE_CATALOG_INDEX, VERIFY_ASSETS,
+                       GENERATE_IMAGE_VARIANTS)
+
+    logger.info("PIPELINE: Starting the scraping pipeline")
+    logger.info(f"project root: {PROJECT_ROOT}")
+    ensure_output_dirs()
+
+    # ids are streamed and deduplicated lazily, the scrape starts with the first one.
+    # Without any source the PRODUCT_IDS list of main.py is used
+    static_ids = None
+    if not args.id_files and not args.crawl:
+        from main import PRODUCT_IDS
+        static_ids = PRODUCT_IDS
+    product_ids = product_id_source(args.id_files, crawl=args.crawl, static_ids=static_ids)
+
+    # re-running after a crash resumes from the job store, skipping the products already saved
+    job_store = JobStore() if USE_JOB_STORE else None
+    sink = create_sink(args.format)
+    try:
+        run_scrape(product_ids, sink.write, workers=args.workers or SCRAPE_WORKERS,
+                   mode=args.mode or SCRAPE_MODE, job_store=job_store, delta=args.delta)
+    finally:
+        sink.close()
+
+    # assets are verified through the products' JSON files, misnamed ones are only reported
+    if VERIFY_ASSETS and args.format == "json":
+        from asset_verifier import verify_assets
+        verify_assets()
+    if GENERATE_IMAGE_VARIANTS and args.format == "json":
+        from image_variants import generate_image_variants
+        generate_image_variants()
+
+    # parquet output isn't indexed, it is queried directly
+    if UPDATE_CATALOG_INDEX and args.format != "parquet":
+        from catalog_index import CatalogIndex
+        CatalogIndex().update()
+
+    logger.info("PIPELINE: Scraping concluded for all files.")
+    return 0
+
+
+def cmd_download_assets(args: argparse.Namespace) -> int:
+    from asset_verifier import verify_assets, rename_misnamed
+    from asset_manifest import get_asset_manifest
+    from redownload import redownload_assets
+
+    ensure_output_dirs()
+    # only the assets verification rejects are downloaded again, then checked once more.
+    # Valid files under the wrong extension are renamed
+    product_ids = args.product_ids or None
+    verify_assets(product_ids)
+    rename_misnamed(product_ids)
+    targets = get_asset_manifest().queued(product_ids)
+    if not targets:
+        logger.info("No asset queued for re-download")
+        return 0
+    redownload_assets(targets)
+    verify_assets(list(targets))
+    return 1 if get_asset_manifest().queued(list(targets)) else 0
+
+
+def cmd_rederive(args: argparse.Namespace) -> int:
+    from output_sinks import JsonFileSink, read_json_products
+
+    ensure_output_dirs()
+    sink = JsonFileSink()
+    if args.from_snapshots:
+        # specs and BOM parsed again from the archived panes
+        from reextract import reextract_all
+        summary = reextract_all(sink.write, args.product_ids or None, args.workers)
+        return 1 if summary["failed"] else 0
+
+    # only hp, rpm, voltage, frame and description, recomputed from the saved specs
+    from product_fields import derive_product_fields
+    count = 0
+    for _, product_data in read_json_products(product_ids=args.product_ids or None):
+        derive_product_fields(product_data)
+        sink.write(product_data['product_id'], product_data)
+        count += 1
+    logger.info(f"Derived fields recomputed for {count} products")
+    return 0
+
+
+def cmd_verify(args: argparse.Namespace) -> int:
+    from asset_verifier import verify_assets
+    from asset_manifest import get_asset_manifest
+    from utils import VERIFY_WORKERS
+
+    product_ids = args.product_ids or None
+    verify_assets(product_ids, full=args.full, workers=args.workers or VERIFY_WORKERS)
+    queue = get_asset_manifest().queued(product_ids)
+    for p_id, asset_types in queue.items():
+        print(f"{p_id}: {', '.join(asset_types)}")
+    print(f"{sum(len(asset_types) for asset_types in queue.values())} assets queued for re-download "
+          f"(python src/cli.py download-assets)")
+    return 1 if queue else 0
+
+
+def cmd_images(args: argparse.Namespace) -> int:
+    from image_variants import generate_image_variants
+    from utils import IMAGE_VARIANT_WORKERS
+
+    summary = generate_image_variants(args.product_ids or None, force=args.force,
+                                      workers=args.workers or IMAGE_VARIANT_WORKERS)
+    return 1 if summary["failed"] else 0
+
+
+def cmd_changes(args: argparse.Namespace) -> int:
+    from change_detection import get_fingerprint_store
+
+    for change in get_fingerprint_store().changes(args.product_ids or None, args.limit):
+        detected_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(change["detected_at"]))
+        print(f"{detected_at}  {change['product_id']}: {', '.join(change['fields'])}")
+    return 0
+
+
+def cmd_export(args: argparse.Namespace) -> int:
+    from output_sinks import read_json_products, JsonLinesSink, ParquetSink
+
+    if args.format == "jsonl":
+        output = args.output or os.path.join(DATA_OUTPUT_DIR, "export", "products.jsonl")
+        sink = JsonLinesSink(output)
+        # an export replaces the previous one
+        sink.truncate()
+    else:
+        output = args.output or os.path.join(DATA_OUTPUT_DIR, "export", "parquet")
+        if os.path.isdir(output) and os.listdir(output):
+            logger.error(f"{output} isn't empty, remove it or choose another --output")
+            return 1
+        sink = ParquetSink(output)
+
+    count = 0
+    try:
+        for _, product_data in read_json_products(product_ids=args.product_ids or None):
+            sink.write(product_data['product_id'], product_data)
+            count += 1
+    finally:
+        sink.close()
+    logger.info(f"Exported {count} products to {output}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Baldor product scraper")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scrape = subparsers.add_parser("scrape", help="scrape products with the browser")
+    scrape.add_argument("id_files", nargs="*", help="files with one product id per line, - reads stdin")
+    scrape.add_argument("--crawl", action="store_true", help="discover product ids by crawling the catalog")
+    scrape.add_argument("--workers", type=int, default=None)
+    scrape.add_argument("--mode", choices=["thread", "process"], default=None)
+    scrape.add_argument("--format", default=OUTPUT_FORMAT, choices=["json", "jsonl", "parquet"])
+    scrape.add_argument("--delta", action="store_true", help="only scrape the products whose page changed")
+    scrape.set_defaults(handler=cmd_scrape)
+
+    download = subparsers.add_parser("download-assets",
+                                     help="download the assets verification rejects again, with the URLs of the snapshots")
+    download.add_argument("product_ids", nargs="*", help="only these products (default: every saved product)")
+    download.set_defaults(handler=cmd_download_assets)
+
+    rederive = subparsers.add_parser("rederive", help="recompute the derived fields of the saved products")
+    rederive.add_argument("product_ids", nargs="*", help="only these products (default: every saved product)")
+    rederive.add_argument("--from-snapshots", action="store_true",
+                          help="parse specs and BOM again from the archived snapshots")
+    rederive.add_argument("--workers", type=int, default=None, help="processes used with --from-snapshots")
+    rederive.set_defaults(handler=cmd_rederive)
+
+    verify = subparsers.add_parser("verify", help="check the asset files of the saved products")
+    verify.add_argument("product_ids", nargs="*", help="only these products (default: every saved product)")
+    verify.add_argument("--full", action="store_true", help="also hash the files verified before and unchanged since")
+    verify.add_argument("--workers", type=int, default=None, help="hashing processes")
+    verify.set_defaults(handler=cmd_verify)
+
+    images = subparsers.add_parser("images", help="build the resized and re-encoded copies of the product images")
+    images.add_argument("product_ids", nargs="*", help="only these products (default: every saved product)")
+    images.add_argument("--force", action="store_true", help="also rebuild the variants of unchanged images")
+    images.add_argument("--workers", type=int, default=None, help="processes")
+    images.set_defaults(handler=cmd_images)
+
+    changes = subparsers.add_parser("changes", help="list the changes found by delta runs, most recent first")
+    changes.add_argument("product_ids", nargs="*", help="only these products")
+    changes.add_argument("--limit", type=int, default=100)
+    changes.set_defaults(handler=cmd_changes)
+
+    export = subparsers.add_parser("export", help="export the saved products to jsonl or parquet")
+    export.add_argument("product_ids", nargs="*", help="only these products (default: every saved product)")
+    export.add_argument("--format", default="jsonl", choices=["jsonl", "parquet"])
+    export.add_argument("--output", default=None, help="jsonl file or parquet directory")
+    export.set_defaults(handler=cmd_export)
+    return parser
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
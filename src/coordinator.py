@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Any, Callable, Iterable
+
+# local imports
+from job_store import JobStore, product_stages
+from metrics import metrics
+from utils import COORDINATOR_HOST, COORDINATOR_PORT, LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# coordinator of distributed runs. Product ids are queued in the job store and leased over plain HTTP
+# to workers (worker.py) on any number of nodes. Workers scrape, then push the product data and the
+# manifest of the asset files they wrote. Endpoints, all JSON:
+#   POST /lease      {"worker", "count"}                      -> {"product_ids", "lease_seconds", "done"}
+#   POST /heartbeat  {"worker", "product_ids"}                -> {"lost"}
+#   POST /result     {"worker", "product_id", "status", ...}  -> {"accepted"}
+#   GET  /status                                              -> job counts and workers
+
+ENQUEUE_BATCH_SIZE = 500
+DONE_POLL_SECONDS = 1.0
+# the coordinator keeps answering for a while after the run, so idle workers learn it is over
+DONE_GRACE_SECONDS = 10
+
+
+class Coordinator:
+
+    def __init__(self, product_ids: Iterable[str], on_result: Callable[[str, Dict[str, Any]], str | None],
+                 job_store: JobStore | None = None, host: str = COORDINATOR_HOST, port: int = COORDINATOR_PORT,
+                 lease_seconds: float = LEASE_SECONDS):
+        self.product_ids = product_ids
+        self.on_result = on_result
+        self.job_store = job_store or JobStore()
+        self.lease_seconds = lease_seconds
+        self.summary: Dict[str, Any] = {"total": 0, "ok": 0, "failed": 0, "timeout": 0, "rejected": 0,
+                                        "failures": []}
+        self.workers: Dict[str, Dict[str, Any]] = {}
+        self.feeding_done = threading.Event()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _feed(self):
+        # ids are queued in batches as they are streamed, so workers start before a crawl finishes
+        batch: List[str] = []
+        queued = 0
+        try:
+            for p_id in self.product_ids:
+                batch.append(p_id)
+                if len(batch) >= ENQUEUE_BATCH_SIZE:
+                    queued += self.job_store.enqueue(batch)
+                    batch = []
+            if batch:
+                queued += self.job_store.enqueue(batch)
+        except Exception as e:
+            logger.error(f"Error reading product ids: {e}", exc_info=True)
+        finally:
+            logger.info(f"Queued {queued} new products")
+            self.feeding_done.set()
+
+    def is_done(self) -> bool:
+        return self.feeding_done.is_set() and self.job_store.remaining() == 0
+
+    def _seen(self, worker_id: str, **counts):
+        with self._lock:
+            worker = self.workers.setdefault(worker_id, {"ok": 0, "failed": 0, "leased": 0})
+            worker["last_seen"] = time.time()
+            for name, value in counts.items():
+                worker[name] += value
+
+    # --- endpoints ---
+
+    def lease(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        worker_id = request["worker"]
+        product_ids = self.job_store.lease(worker_id, int(request.get("count", 1)), self.lease_seconds)
+        self._seen(worker_id, leased=len(product_ids))
+        if product_ids:
+            logger.debug(f"Leased {product_ids} to {worker_id}")
+        return {"product_ids": product_ids, "lease_seconds": self.lease_seconds,
+                "done": not product_ids and self.is_done()}
+
+    def heartbeat(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        worker_id = request["worker"]
+        self._seen(worker_id)
+        lost = self.job_store.heartbeat(worker_id, request.get("product_ids") or [], self.lease_seconds)
+        if lost:
+            logger.warning(f"{worker_id} lost the lease of {lost}")
+        return {"lost": lost}
+
+    def result(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        worker_id = request["worker"]
+        p_id = request["product_id"]
+        status = request["status"]
+        if not self.job_store.finish_lease(p_id, worker_id):
+            # the lease expired and the product went back to the queue, its next result is the one kept
+            logger.warning(f"Rejected the result of {p_id} from {worker_id}, it no longer holds the lease")
+            with self._lock:
+                self.summary["rejected"] += 1
+            return {"accepted": False}
+
+        if request.get("metrics"):
+            metrics.merge(request["metrics"])
+        data = request.get("data")
+        error = request.get("error")
+        if status == "ok" and data:
+            try:
+                output_path = self.on_result(p_id, data)
+                self.job_store.mark_done(p_id, output_path, product_stages(data), request.get("manifest"))
+            except Exception as e:
+                logger.error(f"Error handling result of {p_id}: {e}", exc_info=True)
+                status, error = "failed", f"result handler: {e}"
+                self.job_store.mark_failed(p_id, error, product_stages(data))
+        else:
+            status = status if status in ("failed", "timeout") else "failed"
+            error = error or "no data returned"
+            self.job_store.mark_failed(p_id, f"{status}: {error}")
+
+        with self._lock:
+            self.summary["total"] += 1
+            self.summary[status] += 1
+            if status != "ok":
+                self.summary["failures"].append({"product_id": p_id, "status": status, "error": error,
+                                                 "worker": worker_id})
+        self._seen(worker_id, **{"ok" if status == "ok" else "failed": 1})
+        logger.info(f"{p_id} {status} on {worker_id}" + (f": {error}" if status != "ok" else ""))
+        return {"accepted": True}
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            workers = {worker_id: dict(worker) for worker_id, worker in self.workers.items()}
+            summary = {key: value for key, value in self.summary.items() if key != "failures"}
+        return {"jobs": self.job_store.counts(), "feeding_done": self.feeding_done.is_set(),
+                "summary": summary, "workers": workers}
+
+    # --- serving ---
+
+    def start(self) -> "Coordinator":
+        # leases held by workers survive a coordinator restart, only unleased running products are reset
+        self.job_store.recover_interrupted()
+        metrics.reset()
+        threading.Thread(target=self._feed, name="coordinator-feed", daemon=True).start()
+        threading.Thread(target=self._server.serve_forever, name="coordinator", daemon=True).start()
+        logger.info(f"Coordinator serving {self.url}, {self.lease_seconds}s leases")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def wait(self) -> Dict[str, Any]:
+        # blocks until every queued product is done or failed. Workers polling after that are told to exit
+        start = time.monotonic()
+        while not self.is_done():
+            time.sleep(DONE_POLL_SECONDS)
+        elapsed = time.monotonic() - start
+        summary = dict(self.summary)
+        summary["elapsed_seconds"] = round(elapsed, 2)
+        summary["products_per_minute"] = round(summary["total"] / elapsed * 60, 2) if elapsed > 0 else 0.0
+        summary["jobs"] = self.job_store.counts()
+        summary["workers"] = self.status()["workers"]
+        logger.info(f"Distributed run finished: {summary['ok']} ok, {summary['failed']} failed, "
+                    f"{summary['timeout']} timed out, {summary['rejected']} rejected in {elapsed:.1f}s "
+                    f"({summary['products_per_minute']} products/min). Jobs: {summary['jobs']}")
+        return summary
+
+    def _handler_class(self):
+        coordinator = self
+        endpoints = {"/lease": self.lease, "/heartbeat": self.heartbeat, "/result": self.result}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def do_GET(self):
+                if self.path == "/status":
+                    self._send(200, coordinator.status())
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                endpoint = endpoints.get(self.path)
+                if endpoint is None:
+                    self._send(404, {"error": "not found"})
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    response = endpoint(request)
+                except (ValueError, KeyError, TypeError) as e:
+                    self._send(400, {"error": f"bad request: {e}"})
+                    return
+                except Exception as e:
+                    logger.error(f"Error handling {self.path}: {e}", exc_info=True)
+                    self._send(500, {"error": str(e)})
+                    return
+                self._send(200, response)
+
+            def _send(self, status: int, payload: Dict[str, Any]):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def start_local_workers(coordinator_url: str, count: int, threads: int) -> List[subprocess.Popen]:
+    # worker processes on this machine, e.g. to try a distributed run without other nodes
+    # the per-host request rate is split between them
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py"), coordinator_url,
+               "--threads", str(threads), "--rate-share", str(1 / max(1, count))]
+    return [subprocess.Popen(command) for _ in range(count)]
+
+
+if __name__ == "__main__":
+    from output_sinks import create_sink
+    from id_sources import product_id_source
+    from utils import OUTPUT_FORMAT, ensure_output_dirs
+
+    parser = argparse.ArgumentParser(description="Serves product ids to scraping workers on other nodes")
+    parser.add_argument("id_files", nargs="*", help="files with product ids or URLs, '-' for stdin")
+    parser.add_argument("--crawl", action="store_true", help="discover product ids by crawling the catalog")
+    parser.add_argument("--host", default=COORDINATOR_HOST)
+    parser.add_argument("--port", type=int, default=COORDINATOR_PORT)
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+    parser.add_argument("--local-workers", type=int, default=0, help="also start this many worker processes here")
+    parser.add_argument("--worker-threads", type=int, default=1, help="browsers per local worker process")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not args.id_files and not args.crawl:
+        parser.error("give id files or --crawl")
+    ensure_output_dirs()
+    product_ids = product_id_source(args.id_files, crawl=args.crawl)
+    sink = create_sink(OUTPUT_FORMAT)
+    coordinator = Coordinator(product_ids, sink.write, host=args.host, port=args.port,
+                              lease_seconds=args.lease_seconds).start()
+    local_workers = start_local_workers(coordinator.url, args.local_workers, args.worker_threads)
+    try:
+        summary = coordinator.wait()
+        # the workers' metrics were merged with their results
+        from scrape_runner import write_metrics_report
+        write_metrics_report(summary)
+        # workers exit on their next lease request
+        deadline = time.monotonic() + DONE_GRACE_SECONDS
+        for worker in local_workers:
+            try:
+                worker.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                pass
+        time.sleep(max(0.0, deadline - time.monotonic()))
+    finally:
+        for worker in local_workers:
+            if worker.poll() is None:
+                worker.terminate()
+        coordinator.stop()
+        sink.close()
@@ -1,13 +1,15 @@
 import logging
-import re
 from typing import Dict, List, Any
 from selenium.webdriver.remote.webdriver import WebDriver
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
 from urllib.parse import urljoin 
 
 # local imports
 from selenium_utils import safe_find_element, safe_find_elements, click_tab
+from product_fields import resolve_bom_indices, build_bom_entry, build_bom_from_rows
+from metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -93,23 +95,8 @@ def extract_bom(driver: WebDriver) -> List[Dict[str, Any]]:
         logger.debug("Warning: BOM table headers not found. Using default headers")
         headers = ["Part Number", "Description", "Quantity"]
 
-    part_number_idx, description_idx, quantity_idx = -1, -1, -1
     try:
-        try: part_number_idx = headers.index("Part Number")
-        except ValueError: pass
-        if part_number_idx == -1: part_number_idx = 0
-
-        try: description_idx = headers.index("Description")
-        except ValueError: pass
-        if description_idx == -1 and len(headers) > 1: description_idx = 1
-
-        for i, h in enumerate(headers):
-             if "Quantity" in h:
-                 quantity_idx = i
-                 break
-        if quantity_idx == -1 and len(headers) > 2:
-            quantity_idx = 2
-
+        part_number_idx, description_idx, quantity_idx = resolve_bom_indices(headers)
 
         valid_indices = [idx for idx in [part_number_idx, description_idx, quantity_idx] if idx != -1]
         if not valid_indices:
@@ -124,21 +111,9 @@ def extract_bom(driver: WebDriver) -> List[Dict[str, Any]]:
                     description = cells[description_idx].text.strip() if description_idx != -1 else ""
                     quantity_text = cells[quantity_idx].text.strip() if quantity_idx != -1 else ""
 
-                    quantity: Any = quantity_text
-                    if quantity_text:
-                        try:
-                            num_match = re.match(r'^\s*(\d+\.?\d*)\s*', quantity_text)
-                            if num_match:
-                                quantity = float(num_match.group(1))
-                        except ValueError:
-                            logger.debug(f"Error converting '{quantity_text}' to float")
-
-                    if part_number:
-                         bom_data.append({
-                             "part_number": part_number,
-                             "description": description,
-                             "quantity": quantity
-                         })
+                    bom_entry = build_bom_entry(part_number, description, quantity_text)
+                    if bom_entry:
+                         bom_data.append(bom_entry)
                     else:
                          logger.debug(f"Warning: register without part number '{row.text}'. Skipping")
 
@@ -186,4 +161,157 @@ def extract_static_asset_urls(driver: WebDriver) -> Dict[str, str | None]:
          logger.debug("  PDFs element not found.")
 
     logger.info("Static URLs extracted")
-    return asset_urls
\ No newline at end of file
+    return asset_urls
+
+# --- DOM snapshot extraction ---
+# each pane is read with a single execute_script instead of one WebDriver call per element
+
+SNAPSHOT_HELPERS_JS = """
+var clean = function(el) { return el ? el.textContent.replace(/\\s+/g, ' ').trim() : ''; };
+"""
+
+SPECS_SNAPSHOT_JS = SNAPSHOT_HELPERS_JS + """
+var pane = document.querySelector('.pane[data-tab="specs"]');
+if (!pane) { return null; }
+var table = pane.querySelector('.detail-table.product-overview');
+var pairs = [];
+if (table) {
+    table.querySelectorAll('.col.span_1_of_2 > div').forEach(function(div) {
+        var label = div.querySelector('span.label');
+        var value = div.querySelector('span.value');
+        if (label && value) { pairs.push([clean(label), clean(value)]); }
+    });
+}
+return {has_table: !!table, pairs: pairs};
+"""
+
+BOM_SNAPSHOT_JS = SNAPSHOT_HELPERS_JS + """
+var pane = document.querySelector('.pane[data-tab="parts"]');
+if (!pane) { return null; }
+var table = pane.querySelector('.data-table');
+if (!table) { return {has_table: false, headers: [], rows: []}; }
+var headers = [];
+table.querySelectorAll('thead th').forEach(function(th) {
+    var text = clean(th);
+    if (text) { headers.push(text); }
+});
+var rows = [];
+table.querySelectorAll('tbody tr').forEach(function(tr) {
+    var cells = [];
+    tr.querySelectorAll('td').forEach(function(td) { cells.push(clean(td)); });
+    rows.push(cells);
+});
+return {has_table: true, headers: headers, rows: rows};
+"""
+
+ASSET_URLS_SNAPSHOT_JS = """
+var image = document.querySelector('.product-image');
+var manual = document.getElementById('infoPacket');
+return {
+    page_url: window.location.href,
+    image: image ? image.getAttribute('src') : null,
+    manual: manual ? manual.getAttribute('href') : null
+};
+"""
+
+# outerHTML of the panes archived by snapshot_store, plus the image and manual elements
+PANES_HTML_JS = """
+var panes = {};
+arguments[0].forEach(function(name) {
+    var pane = document.querySelector('.pane[data-tab="' + name + '"]');
+    if (pane) { panes[name] = pane.outerHTML; }
+});
+var assets = [];
+document.querySelectorAll('.product-image, #infoPacket').forEach(function(el) { assets.push(el.outerHTML); });
+return {page_url: window.location.href, panes: panes, assets: assets};
+"""
+
+# same wait as the element-by-element extraction gives the table to render
+PANE_WAIT_SECONDS = 10
+
+
+def _record_snapshot(calls_saved: int):
+    # calls_saved is the number of WebDriver commands the element-by-element extraction would have issued
+    metrics.increment("webdriver_calls_saved", max(0, calls_saved))
+
+
+def _run_pane_snapshot(driver: WebDriver, tab_name: str, script: str) -> Dict[str, Any] | None:
+    # panes are in the DOM even when their tab is hidden, the tab is only clicked if the table isn't there.
+    # Lazily rendered panes are polled until their table shows up, the last snapshot is returned on timeout
+    snapshot = driver.execute_script(script)
+    if snapshot and snapshot.get('has_table'):
+        return snapshot
+    if not click_tab(driver, tab_name) and snapshot is None:
+        return None
+
+    last = {"snapshot": snapshot}
+
+    def table_rendered(driver: WebDriver):
+        last["snapshot"] = driver.execute_script(script)
+        return last["snapshot"] if last["snapshot"] and last["snapshot"].get('has_table') else False
+
+    try:
+        return WebDriverWait(driver, PANE_WAIT_SECONDS).until(table_rendered)
+    except TimeoutException:
+        return last["snapshot"]
+
+
+def extract_specs_snapshot(driver: WebDriver) -> Dict[str, str]:
+    # same result as extract_specs with one round trip
+    specs_data: Dict[str, str] = {}
+    logger.info("Extracting specs (DOM snapshot)")
+    snapshot = _run_pane_snapshot(driver, 'specs', SPECS_SNAPSHOT_JS)
+
+    if not snapshot or not snapshot.get('has_table'):
+        logger.warning("Specs table not found")
+        return specs_data
+
+    for label, value in snapshot['pairs']:
+        if label:
+            specs_data[label] = value
+
+    # find table + wait/find rows + 2 finds and 2 texts per row
+    _record_snapshot(3 + 4 * len(snapshot['pairs']) - 1)
+    logger.info(f"Extracted {len(specs_data)} spec itens.")
+    return specs_data
+
+
+def extract_bom_snapshot(driver: WebDriver) -> List[Dict[str, Any]]:
+    # same result as extract_bom with one round trip
+    logger.info("Extracting BOM (DOM snapshot)")
+    snapshot = _run_pane_snapshot(driver, 'parts', BOM_SNAPSHOT_JS)
+
+    if not snapshot or not snapshot.get('has_table'):
+        logger.info("BOM table not found")
+        return []
+
+    headers = snapshot['headers']
+    rows = snapshot['rows']
+    logger.debug(f"BOM headers found: {headers}")
+    bom_data = build_bom_from_rows(headers, rows)
+
+    # find table + wait/find rows + headers (find + 2 texts each) + rows (find cells + 3 texts each)
+    _record_snapshot(3 + 1 + 2 * len(headers) + 4 * len(rows) - 1)
+    return bom_data
+
+
+def extract_panes_html(driver: WebDriver, pane_names) -> Dict[str, Any]:
+    # rendered html of the given panes in one round trip, for the snapshot archive
+    return driver.execute_script(PANES_HTML_JS, list(pane_names))
+
+
+def extract_static_asset_urls_snapshot(driver: WebDriver) -> Dict[str, str | None]:
+    # same result as extract_static_asset_urls with one round trip
+    logger.info("Extracting static URLs (DOM snapshot)")
+    snapshot = driver.execute_script(ASSET_URLS_SNAPSHOT_JS)
+    page_url = snapshot['page_url']
+    asset_urls: Dict[str, str | None] = {
+        'image': urljoin(page_url, snapshot['image']) if snapshot.get('image') else None,
+        'manual': urljoin(page_url, snapshot['manual']) if snapshot.get('manual') else None,
+    }
+    logger.info(f"  Image URL found: {asset_urls['image']}")
+    logger.info(f"  PDF Manual URL found: {asset_urls['manual']}")
+
+    # 2 finds, 2 get_attribute and 2 current_url
+    _record_snapshot(6 - 1)
+    return asset_urls
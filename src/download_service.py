@@ -0,0 +1,102 @@
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Any, Callable
+
+# local imports
+from asset_downloader import download_asset_with_requests
+from utils import USER_AGENT, DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE, DOWNLOAD_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadService:
+    # downloads assets in background threads over a shared keep-alive session, so the
+    # browser can move on to the next product while large PDFs are still streaming.
+    # submit() blocks once max_queued downloads are pending
+
+    def __init__(self, workers: int = DOWNLOAD_WORKERS, max_queued: int = DOWNLOAD_QUEUE_SIZE,
+                 chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="downloader")
+        self._slots = threading.BoundedSemaphore(max_queued)
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({'User-Agent': USER_AGENT})
+
+    def submit(self, asset_url: str | None, product_id: str, asset_type: str,
+               file_name: str | None = None, extra_headers: Dict[str, str] | None = None) -> Future:
+        # queues a download. The future resolves to the relative asset path or None
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(download_asset_with_requests, asset_url, product_id, asset_type,
+                                           self._session, self.chunk_size, file_name, extra_headers)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def when_done(self, product_data: Dict[str, Any], callback: Callable[[Dict[str, Any]], None]):
+        # calls callback(product_data) once every pending download of the product has finished,
+        # with the resolved paths joined back into product_data['assets']
+        pending = _pending_downloads(product_data['assets'])
+        if not pending:
+            callback(product_data)
+            return
+
+        remaining = [len(pending)]
+        lock = threading.Lock()
+
+        def on_download_done(_):
+            with lock:
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished:
+                resolve_assets(product_data)
+                try:
+                    callback(product_data)
+                except Exception as e:
+                    logger.error(f"Error handling downloads of {product_data.get('product_id')}: {e}", exc_info=True)
+
+        for future in pending:
+            future.add_done_callback(on_download_done)
+
+    def close(self):
+        # waits for the queued downloads and their callbacks
+        self._executor.shutdown(wait=True)
+        self._session.close()
+
+
+def _pending_downloads(assets: Dict[str, Any]) -> List[Future]:
+    # assets may hold futures directly or one level down (e.g. the extra CAD formats)
+    pending = []
+    for value in assets.values():
+        if isinstance(value, Future):
+            pending.append(value)
+        elif isinstance(value, dict):
+            pending.extend(_pending_downloads(value))
+    return pending
+
+
+def _resolve(assets: Dict[str, Any], product_id: str | None):
+    for asset_type, value in assets.items():
+        if isinstance(value, Future):
+            try:
+                assets[asset_type] = value.result()
+            except Exception as e:
+                logger.warning(f"Error downloading '{asset_type}' of {product_id}: {e}")
+                assets[asset_type] = None
+        elif isinstance(value, dict):
+            _resolve(value, product_id)
+
+
+def resolve_assets(product_data: Dict[str, Any]) -> Dict[str, Any]:
+    # waits for the pending downloads of a product and replaces them with their results
+    _resolve(product_data['assets'], product_data.get('product_id'))
+    return product_data
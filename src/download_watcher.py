@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import select
+import ctypes
+import ctypes.util
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# chrome writes downloads as .crdownload and renames them when complete
+PARTIAL_SUFFIXES = ('.crdownload', '.tmp', '.part')
+
+# inotify flags, see <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+POLL_INTERVAL_SECONDS = 0.1
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+
+
+class DownloadWatcher:
+    # waits for a completed download in a directory. Uses inotify events on linux and
+    # falls back to fast polling elsewhere. Enter it before triggering the download so no event is missed
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._fd = None
+
+    def __enter__(self):
+        if _libc is not None:
+            fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0 and _libc.inotify_add_watch(fd, os.fsencode(self.directory),
+                                                    IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) >= 0:
+                self._fd = fd
+            elif fd >= 0:
+                os.close(fd)
+        if self._fd is None:
+            logger.debug("inotify unavailable, polling the download directory")
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def completed_new_files(self, files_before: List[str]) -> List[str]:
+        # chrome may reserve the final name while the .crdownload is still being written
+        files_now = os.listdir(self.directory)
+        if any(f.endswith(PARTIAL_SUFFIXES) and f not in files_before for f in files_now):
+            return []
+        return [f for f in files_now if f not in files_before]
+
+    def wait_for_new_file(self, files_before: List[str], timeout: float) -> str | None:
+        # returns the name of the first completed file not in files_before, or None on timeout
+        end_time = time.monotonic() + timeout
+        while True:
+            new_files = self.completed_new_files(files_before)
+            if new_files:
+                return new_files[0]
+
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                return None
+
+            if self._fd is not None:
+                readable, _, _ = select.select([self._fd], [], [], remaining)
+                if readable:
+                    try:
+                        os.read(self._fd, 64 * 1024)
+                    except BlockingIOError:
+                        pass
+            else:
+                time.sleep(min(POLL_INTERVAL_SECONDS, remaining))
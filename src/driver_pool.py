@@ -0,0 +1,284 @@
+import time
+import queue
+import logging
+import threading
+import undetected_chromedriver as uc
+from urllib.parse import urlparse
+from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.common.exceptions import WebDriverException
+
+# local imports
+from metrics import metrics, instrument_driver
+from rate_limiter import get_rate_limiter
+from startup_cache import cached_driver, clone_profile, remove_profile, record_startup
+from resource_governor import get_resource_governor
+from utils import (BASE_URL, DRIVER_POOL_SIZE, CAD_DOWNLOAD_MODE, CAD_URL_SOURCE, LEAN_BROWSER,
+                   LEAN_BLOCKED_URL_PATTERNS, CONSENT_COOKIES, USE_STARTUP_CACHE, USE_RESOURCE_GOVERNOR)
+
+# the consent cookie stored in the template profile outlives the browser that set it
+PROFILE_COOKIE_LIFETIME_SECONDS = 365 * 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+
+def performance_log_enabled() -> bool:
+    return CAD_DOWNLOAD_MODE == "direct" and CAD_URL_SOURCE in ("network", "auto")
+
+
+def chrome_options() -> uc.ChromeOptions:
+    # a new object per launch, uc refuses to reuse one
+    options = uc.ChromeOptions()
+    prefs = {
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "plugins.always_open_pdf_externally": True
+    }
+    if LEAN_BROWSER:
+        # a fixed window size keeps the layout (and element clickability) stable without a display
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--mute-audio")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        prefs["profile.managed_default_content_settings.images"] = 2
+    else:
+        options.add_argument("--start-maximized")
+
+    options.add_experimental_option("prefs", prefs)
+
+    if performance_log_enabled():
+        # page events only, used to capture the CAD download request
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": False, "enablePage": True})
+    return options
+
+
+def warm_profile(user_data_dir: str):
+    # prepares the template profile cloned for every browser: the consent cookie is stored
+    # and the catalog's scripts and styles land in the http cache
+    driver_info = cached_driver()
+    driver = uc.Chrome(options=chrome_options(), headless=LEAN_BROWSER, user_data_dir=user_data_dir,
+                       driver_executable_path=driver_info["path"] if driver_info else None)
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        expires = time.time() + PROFILE_COOKIE_LIFETIME_SECONDS
+        for cookie in CONSENT_COOKIES:
+            driver.execute_cdp_cmd("Network.setCookie", {**cookie, "url": BASE_URL, "expires": expires})
+        with get_rate_limiter().request(BASE_URL):
+            driver.get(BASE_URL)
+    finally:
+        # quitting flushes the cookies and the cache to the profile directory
+        driver.quit()
+
+
+def create_driver() -> WebDriver:
+    # boots a new chrome instance. The download directory is set per product via CDP.
+    # With the startup cache, chrome runs on the cached chromedriver and a copy of the template profile
+    driver_info, profile_dir = None, None
+    if USE_STARTUP_CACHE:
+        driver_info = cached_driver()
+        profile_dir = clone_profile(warm_profile)
+
+    logger.debug("booting undetected_chromedriver")
+    start = time.monotonic()
+    try:
+        with metrics.span("driver_boot"):
+            driver = uc.Chrome(options=chrome_options(), headless=LEAN_BROWSER, user_data_dir=profile_dir,
+                               driver_executable_path=driver_info["path"] if driver_info else None)
+    except Exception:
+        remove_profile(profile_dir)
+        raise
+    record_startup(driver_info, time.monotonic() - start)
+    # uc keeps a profile it was given, it is removed by quit_driver
+    driver.profile_dir = profile_dir
+    return instrument_driver(driver)
+
+
+def set_download_dir(driver: WebDriver, download_dir: str):
+    # points chrome's downloads to the given directory without relaunching the browser
+    driver.execute_cdp_cmd("Page.setDownloadBehavior", {
+        "behavior": "allow",
+        "downloadPath": download_dir,
+    })
+    logger.debug(f"Download directory set to {download_dir}")
+
+
+def apply_lean_profile(driver: WebDriver):
+    # blocks non-essential requests and presets the consent cookie. Called after every reset,
+    # since clearing the cookies also drops the consent
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URL_PATTERNS})
+    for cookie in CONSENT_COOKIES:
+        driver.execute_cdp_cmd("Network.setCookie", {**cookie, "url": BASE_URL})
+
+
+def reset_driver(driver: WebDriver):
+    # clears the state left by the previous product so each page starts clean
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+
+    driver.get("about:blank")
+    if performance_log_enabled():
+        # chromedriver buffers the log until it is read
+        driver.get_log("performance")
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    parsed_base = urlparse(BASE_URL)
+    driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+        "origin": f"{parsed_base.scheme}://{parsed_base.netloc}",
+        "storageTypes": "local_storage,session_storage",
+    })
+    if LEAN_BROWSER:
+        apply_lean_profile(driver)
+    logger.debug("Browser state reset (cookies, consent overlay, storage)")
+
+
+def is_driver_alive(driver: WebDriver) -> bool:
+    # a crashed browser or chromedriver fails on any command
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+def quit_driver(driver: WebDriver):
+    logger.debug("Closing browser")
+    try:
+        driver.quit()
+        logger.info("Browser closed")
+    except Exception as e:
+        logger.warning(f"Error closing browser: {e}", exc_info=True)
+    remove_profile(getattr(driver, "profile_dir", None))
+
+
+class DriverPool:
+    # keeps up to `size` warm browsers alive across products.
+    # Browsers are booted lazily and crashed sessions are replaced on acquire.
+    # With the resource governor, browsers are recycled when they grow too big or have served
+    # too many products, and new ones wait for memory before booting
+
+    def __init__(self, size: int = DRIVER_POOL_SIZE):
+        self.size = size
+        self.governor = get_resource_governor() if USE_RESOURCE_GOVERNOR else None
+        self._idle: queue.Queue = queue.Queue()
+        self._busy: set = set()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def acquire(self, download_dir: str | None = None, timeout: float | None = None) -> WebDriver:
+        # returns a clean browser, waiting for one to be released if all are busy
+        if self._closed:
+            raise RuntimeError("Driver pool is closed")
+
+        for attempt in range(2):
+            driver = self._take(timeout)
+            try:
+                if not is_driver_alive(driver):
+                    logger.warning("Pooled browser crashed, replacing it")
+                    self._quit(driver)
+                    driver = self._boot(timeout)
+                reset_driver(driver)
+                if download_dir:
+                    set_download_dir(driver, download_dir)
+                with self._lock:
+                    self._busy.add(driver)
+                return driver
+            except Exception as e:
+                logger.warning(f"Error preparing pooled browser, replacing it: {e}")
+                self.discard(driver)
+                if attempt:
+                    raise
+
+    def release(self, driver: WebDriver, broken: bool = False):
+        # returns a browser to the pool. Broken browsers are quit and replaced on the next acquire
+        with self._lock:
+            self._busy.discard(driver)
+        if broken or self._closed:
+            self.discard(driver)
+            return
+        reason = self.governor.recycle_reason(driver) if self.governor else None
+        if reason:
+            logger.info(f"Recycling browser ({reason}): {self.governor.stats()}")
+            metrics.increment("browser_recycles", reason=reason)
+            self.discard(driver)
+            return
+        self._idle.put(driver)
+
+    def discard(self, driver: WebDriver):
+        with self._lock:
+            self._busy.discard(driver)
+        self._quit(driver)
+        self._forget()
+
+    def _quit(self, driver: WebDriver):
+        quit_driver(driver)
+        if self.governor:
+            self.governor.unregister(driver)
+
+    def _boot(self, timeout: float | None) -> WebDriver:
+        # waits for the governor's admission, so browsers are only started when memory allows
+        if not self.governor:
+            return create_driver()
+        self.governor.admit(timeout)
+        try:
+            driver = create_driver()
+        except Exception:
+            self.governor.cancel_admission()
+            raise
+        self.governor.register(driver)
+        return driver
+
+    def abort(self):
+        # kills the browsers currently in use so blocked WebDriver calls fail fast.
+        # Their owners still release them, which replaces them on the next acquire
+        with self._lock:
+            busy = list(self._busy)
+        for driver in busy:
+            logger.warning("Aborting in-use browser")
+            quit_driver(driver)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(driver)
+
+    def _take(self, timeout: float | None) -> WebDriver:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                can_boot = self._created < self.size
+                if can_boot:
+                    self._created += 1
+
+            if can_boot:
+                try:
+                    return self._boot(None if deadline is None else max(0.0, deadline - time.monotonic()))
+                except Exception:
+                    self._forget()
+                    raise
+
+            # wakes up periodically so slots freed by discarded browsers are noticed
+            wait = 1.0 if deadline is None else min(1.0, deadline - time.monotonic())
+            if wait <= 0:
+                raise TimeoutError(f"No browser available in the pool after {timeout}s")
+            try:
+                return self._idle.get(timeout=wait)
+            except queue.Empty:
+                continue
+
+    def _forget(self):
+        with self._lock:
+            self._created = max(0, self._created - 1)
@@ -0,0 +1,398 @@
+import re
+import json
+import html
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Any
+from urllib.parse import urlparse, unquote, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# local stand-in for the baldor catalog. Reproduces the markup the scraper depends on (tabs, specs and
+# parts panes, product image, manual link, adroll consent overlay, kendo CAD dropdown and #cadDownload)
+# and serves deterministic assets, with a configurable latency per request
+
+PRODUCT_PATH_RE = re.compile(r"^/catalog/([^/]+)$")
+ASSET_PATH_RE = re.compile(r"^/assets/([^/]+)/(image\.jpg|image\.png|manual\.pdf|cad/[^/]+)$")
+CATALOG_PAGE_SIZE = 50
+
+ASSET_CONTENT_TYPES = {
+    "image.jpg": "image/jpeg",
+    "image.png": "image/png",
+    "manual.pdf": "application/pdf",
+    "cad": "application/octet-stream",
+}
+CAD_MAGIC = b"AC1018"
+# product images are flat gray, big enough for every width of the image variants
+FIXTURE_IMAGE_SIZE = (1024, 768)
+
+CAD_FORMATS = [
+    ("2D AutoCAD DWG >=2000", "2D", "DWG"),
+    ("2D AutoCAD DXF >=2000", "2D", "DXF"),
+    ("3D ACIS", "3D", "sat"),
+    ("3D IGES", "3D", "IGS"),
+]
+
+PAGE_SCRIPT = """
+document.querySelectorAll('nav ul li[data-tab]').forEach(function(tab) {
+    tab.addEventListener('click', function() {
+        var name = tab.getAttribute('data-tab');
+        document.querySelectorAll('nav ul li[data-tab], .pane[data-tab]').forEach(function(el) {
+            el.classList.toggle('active', el.getAttribute('data-tab') === name);
+        });
+    });
+});
+
+if (document.cookie.indexOf('__adroll_consent=') === -1) {
+    setTimeout(function() {
+        var notice = document.createElement('div');
+        notice.className = 'adroll_consent_notice';
+        notice.style.cssText = 'position:fixed;left:0;right:0;bottom:0;height:200px;background:#fff;z-index:1000';
+        notice.innerHTML = '<button id="adroll_consent_accept">Allow All</button>';
+        document.body.appendChild(notice);
+        document.getElementById('adroll_consent_accept').addEventListener('click', function() {
+            document.cookie = '__adroll_consent=allow_all; path=/';
+            notice.style.display = 'none';
+        });
+    }, OVERLAY_DELAY_MS);
+}
+
+var formats = JSON.parse(document.getElementById('drawings').getAttribute('data-formats'));
+var selected = null;
+var list = document.querySelector('.k-animation-container');
+var button = document.getElementById('cadDownload');
+document.querySelector('.pane[data-tab="drawings"] .k-dropdown-wrap .k-input').addEventListener('click', function() {
+    list.style.display = 'block';
+    list.setAttribute('aria-hidden', 'false');
+});
+list.querySelectorAll('li[role="option"]').forEach(function(item, index) {
+    item.addEventListener('click', function() {
+        selected = formats[index];
+        document.querySelector('.pane[data-tab="drawings"] .k-dropdown-wrap .k-input').textContent = item.textContent;
+        list.style.display = 'none';
+        list.setAttribute('aria-hidden', 'true');
+        button.setAttribute('aria-disabled', 'false');
+    });
+});
+button.addEventListener('click', function() {
+    if (selected) { window.location.href = selected.url; }
+});
+"""
+
+
+def product_specs(product_id: str) -> Dict[str, str]:
+    # deterministic specs, including the keys derive_product_fields maps to hp/voltage/rpm/frame
+    seed = int(hashlib.sha256(product_id.encode()).hexdigest()[:8], 16)
+    specs = {
+        "Catalog Number": product_id,
+        "Enclosure": ["TEFC", "ODP", "TENV"][seed % 3],
+        "Frame": f"{56 + seed % 400}T",
+        "Output @ Frequency": f"{1 + seed % 50}.000 HP @ 60 HZ",
+        "Speed": f"{[1200, 1800, 3600][seed % 3]} rpm",
+        "Voltage @ Frequency": "230.0 V @ 60 HZ",
+    }
+    for i in range(30):
+        specs[f"Spec {i:02d}"] = f"value {seed % (i + 7)}"
+    return specs
+
+
+def product_image_name(product_id: str) -> str:
+    # one product in four has a PNG image, so downloads and verification see more than one image format
+    seed = int(hashlib.sha256(product_id.encode()).hexdigest()[:8], 16)
+    return "image.png" if seed % 4 == 3 else "image.jpg"
+
+
+def product_bom(product_id: str, rows: int) -> List[List[str]]:
+    return [[f"{product_id}-P{i:03d}", f"Part {i} of {product_id}", f"{1 + i % 4}.000 EA"] for i in range(rows)]
+
+
+def cad_formats(base_url: str, product_id: str) -> List[Dict[str, Any]]:
+    return [{
+        "cad": "",
+        "filetype": filetype,
+        "value": f"{product_id}.{extension}",
+        "name": name,
+        "version": "",
+        "url": f"{base_url}/assets/{product_id}/cad/{product_id}.{extension}",
+    } for name, filetype, extension in CAD_FORMATS]
+
+
+def render_product_page(base_url: str, product_id: str, bom_rows: int, overlay_delay_ms: int) -> str:
+    specs = list(product_specs(product_id).items())
+    half = (len(specs) + 1) // 2
+    columns = "".join(
+        '<div class="col span_1_of_2">' + "".join(
+            f'<div><span class="label">{html.escape(label)}</span><span class="value">{html.escape(value)}</span></div>'
+            for label, value in column) + '</div>'
+        for column in (specs[:half], specs[half:]))
+    bom = "".join("<tr>" + "".join(f"<td>{html.escape(cell)}</td>" for cell in row) + "</tr>"
+                  for row in product_bom(product_id, bom_rows))
+    formats = cad_formats(base_url, product_id)
+    formats_json = html.escape(json.dumps(formats, indent=2))
+    options = "".join(f'<li role="option">{html.escape(f["name"])}</li>' for f in formats)
+    script = PAGE_SCRIPT.replace("OVERLAY_DELAY_MS", str(overlay_delay_ms))
+    pid = html.escape(product_id)
+
+    return f"""<!DOCTYPE html>
+<html><head><title>{pid}</title></head>
+<body>
+<div id="catalog-detail">
+  <div class="product-description">{pid} fixture product</div>
+  <img class="product-image" src="/assets/{pid}/{product_image_name(product_id)}">
+  <a id="infoPacket" href="/assets/{pid}/manual.pdf">Product Information Packet</a>
+  <nav><ul>
+    <li data-tab="specs" class="active">Specs</li>
+    <li data-tab="parts">Parts</li>
+    <li data-tab="drawings">Drawings</li>
+  </ul></nav>
+  <div class="pane active" data-tab="specs">
+    <div class="detail-table product-overview">{columns}</div>
+  </div>
+  <div class="pane" data-tab="parts">
+    <table class="data-table">
+      <thead><tr><th>Part Number</th><th>Description</th><th>Quantity</th></tr></thead>
+      <tbody>{bom}</tbody>
+    </table>
+  </div>
+  <div class="pane" data-tab="drawings">
+    <div class="section cadfiles" id="drawings" data-formats="{formats_json}"
+         ng-init="init('{pid}', '', 'ng-init', '{formats_json}', '[]')">
+      <span class="k-widget k-dropdown"><span class="k-dropdown-wrap"><span class="k-input">Select Format</span></span></span>
+      <div class="k-animation-container" aria-hidden="true" style="display:none"><ul role="listbox">{options}</ul></div>
+      <button class="k-button" id="cadDownload" type="button" aria-disabled="true">Download</button>
+    </div>
+  </div>
+</div>
+<style>.pane {{ display: none; }} .pane.active {{ display: block; }}</style>
+<script>{script}</script>
+</body></html>"""
+
+
+def fixture_product_ids(count: int) -> List[str]:
+    return [f"FIX{i:04d}" for i in range(count)]
+
+
+def render_catalog_page(query: str, catalog_size: int) -> str:
+    # /catalog/ links the category pages, /catalog/?page=N links up to CATALOG_PAGE_SIZE products
+    ids = fixture_product_ids(catalog_size)
+    page = parse_qs(query).get("page")
+    if page is None:
+        pages = (len(ids) + CATALOG_PAGE_SIZE - 1) // CATALOG_PAGE_SIZE
+        links = "".join(f'<li><a href="/catalog/?page={n}">Category {n}</a></li>' for n in range(pages))
+    else:
+        start = int(page[0]) * CATALOG_PAGE_SIZE
+        links = "".join(f'<li><a href="/catalog/{p_id}">{p_id}</a></li>' for p_id in ids[start:start + CATALOG_PAGE_SIZE])
+    return f"<!DOCTYPE html><html><body><ul>{links}</ul></body></html>"
+
+
+def _padding(seed: bytes, size: int) -> bytes:
+    return (seed * (size // len(seed) + 1))[:max(0, size)]
+
+
+def _jpeg_segment(marker: int, payload: bytes) -> bytes:
+    return struct.pack(">BBH", 0xFF, marker, len(payload) + 2) + payload
+
+
+def jpeg_body(seed: bytes, size: int) -> bytes:
+    # baseline grayscale JPEG of a single shade. With one DC difference in the first block and zero in the
+    # others, every block is two bits under two tiny Huffman tables. Padded with comment segments
+    width, height = FIXTURE_IMAGE_SIZE
+    blocks = ((width + 7) // 8) * ((height + 7) // 8)
+    dc = 32 + seed[0] % 64
+    category = dc.bit_length()
+    bits = "10" + format(dc, f"0{category}b") + "0" + "00" * (blocks - 1)
+    bits += "1" * (-len(bits) % 8)
+    scan = int(bits, 2).to_bytes(len(bits) // 8, "big").replace(b"\xff", b"\xff\x00")
+
+    head = b"\xff\xd8" + _jpeg_segment(0xE0, b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00")
+    tables = (_jpeg_segment(0xDB, b"\x00" + b"\x08" * 64)
+              + _jpeg_segment(0xC0, struct.pack(">BHHB", 8, height, width, 1) + b"\x01\x11\x00")
+              + _jpeg_segment(0xC4, b"\x00" + bytes([1, 1] + [0] * 14) + bytes([0, category])
+                              + b"\x10" + bytes([1] + [0] * 15) + b"\x00")
+              + _jpeg_segment(0xDA, b"\x01\x01\x00\x00\x3f\x00"))
+    comments = b""
+    missing = size - len(head) - len(tables) - len(scan) - 2
+    while missing > 4:
+        chunk = min(missing - 4, 65533)
+        comments += _jpeg_segment(0xFE, _padding(seed, chunk))
+        missing -= chunk + 4
+    return head + comments + tables + scan + b"\xff\xd9"
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def png_body(seed: bytes, size: int) -> bytes:
+    # grayscale PNG of a single shade, padded with a tEXt chunk
+    width, height = FIXTURE_IMAGE_SIZE
+    row = b"\x00" + bytes([160 + seed[0] % 64]) * width
+    head = b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+    tail = _png_chunk(b"IDAT", zlib.compress(row * height)) + _png_chunk(b"IEND", b"")
+    missing = size - len(head) - len(tail) - 12 - len(b"Comment\x00")
+    text = _png_chunk(b"tEXt", b"Comment\x00" + _padding(seed.hex().encode(), missing)) if missing > 0 else b""
+    return head + text + tail
+
+
+def pdf_body(product_id: str, seed: bytes, size: int) -> bytes:
+    # one page PDF with a valid xref table, padded with comment lines after the header
+    title = product_id.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    content = f"BT /F1 24 Tf 72 720 Td (Product Information Packet {title}) Tj ET".encode("latin-1", "replace")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    body = b"%PDF-1.4\n"
+    line = b"%" + seed.hex().encode() + b"\n"
+    padding_lines = max(0, size - 600 - sum(len(obj) for obj in objects)) // len(line)
+    body += line * padding_lines
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(body))
+        body += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(body)
+    body += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    body += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    body += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return body
+
+
+def asset_body(product_id: str, asset_name: str, size: int) -> bytes:
+    # deterministic per product and valid for its file type: decodable images and PDF with their end
+    # markers, so asset verification and the image variants work offline. Padded to about size bytes
+    seed = hashlib.sha256(f"{product_id}/{asset_name}".encode()).digest()
+    if asset_name == "image.jpg":
+        return jpeg_body(seed, size)
+    if asset_name == "image.png":
+        return png_body(seed, size)
+    if asset_name == "manual.pdf":
+        return pdf_body(product_id, seed, size)
+    return CAD_MAGIC + _padding(seed, size - len(CAD_MAGIC))
+
+
+class FixtureSite:
+    # serves the fixture catalog on localhost in a background thread. base_url is the BASE_URL to scrape
+
+    def __init__(self, port: int = 0, latency_ms: int = 0, asset_kb: int = 256, bom_rows: int = 12,
+                 overlay_delay_ms: int = 300, catalog_size: int = 100):
+        self.latency_ms = latency_ms
+        self.catalog_size = catalog_size
+        self.asset_kb = asset_kb
+        self.bom_rows = bom_rows
+        self.overlay_delay_ms = overlay_delay_ms
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def root_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.root_url}/catalog/"
+
+    def start(self) -> "FixtureSite":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fixture-site", daemon=True)
+        self._thread.start()
+        logger.info(f"Fixture site serving {self.base_url} ({self.latency_ms}ms latency)")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def do_GET(self):
+                with site._lock:
+                    site.requests += 1
+                if site.latency_ms:
+                    time.sleep(site.latency_ms / 1000)
+
+                url = urlparse(self.path)
+                path = unquote(url.path)
+                product = PRODUCT_PATH_RE.match(path)
+                asset = ASSET_PATH_RE.match(path)
+                if path == "/catalog/":
+                    body = render_catalog_page(url.query, site.catalog_size).encode("utf-8")
+                    self._send(200, body, "text/html; charset=utf-8")
+                elif product:
+                    body = render_product_page(site.root_url, product.group(1), site.bom_rows,
+                                               site.overlay_delay_ms).encode("utf-8")
+                    self._send(200, body, "text/html; charset=utf-8")
+                elif asset:
+                    self._send_asset(asset.group(1), asset.group(2))
+                else:
+                    self._send(404, b"not found", "text/plain")
+
+            def _send_asset(self, product_id: str, asset_name: str):
+                body = asset_body(product_id, asset_name, site.asset_kb * 1024)
+                etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, b"", None, {"ETag": etag})
+                    return
+                kind = "cad" if asset_name.startswith("cad/") else asset_name
+                headers = {"ETag": etag}
+                if kind == "cad":
+                    headers["Content-Disposition"] = f'attachment; filename="{asset_name[4:]}"'
+                self._send(200, body, ASSET_CONTENT_TYPES[kind], headers)
+
+            def _send(self, status: int, body: bytes, content_type: str | None,
+                      headers: Dict[str, str] | None = None):
+                self.send_response(status)
+                if content_type:
+                    self.send_header("Content-Type", content_type)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serves the local Baldor-like fixture catalog")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--asset-kb", type=int, default=256)
+    parser.add_argument("--bom-rows", type=int, default=12)
+    parser.add_argument("--catalog-size", type=int, default=100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    site = FixtureSite(args.port, args.latency_ms, args.asset_kb, args.bom_rows,
+                       catalog_size=args.catalog_size).start()
+    print(f"export BALDOR_BASE_URL={site.base_url}")
+    try:
+        site._thread.join()
+    except KeyboardInterrupt:
+        site.stop()
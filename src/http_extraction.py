@@ -0,0 +1,166 @@
+import logging
+import threading
+import requests
+import lxml.html
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Any
+from urllib.parse import urljoin
+
+# local imports
+from product_fields import build_bom_from_rows
+from cad_formats import parse_cad_formats
+from snapshot_store import SNAPSHOT_PANES
+from metrics import metrics
+from rate_limiter import get_rate_limiter
+from utils import BASE_URL, USER_AGENT, HTTP_POOL_SIZE, HTTP_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_session_local = threading.local()
+
+
+def _has_class(class_name: str) -> str:
+    # xpath predicate equivalent to the css ".class_name" selector
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+def get_http_session() -> requests.Session:
+    # one keep-alive session per thread, sharing pooled connections to the same host
+    session = getattr(_session_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({'User-Agent': USER_AGENT})
+        _session_local.session = session
+    return session
+
+
+def _clean_text(element) -> str:
+    # collapses whitespace the same way the rendered text seen by selenium does
+    return " ".join(element.text_content().split())
+
+
+def fetch_product_html(product_id: str) -> tuple[str, str] | None:
+    # fetches the raw product page. Returns (html, final url) or None
+    full_url = urljoin(BASE_URL, product_id)
+    try:
+        with get_rate_limiter().request(full_url) as slot, metrics.span("http_fetch"):
+            response = get_http_session().get(full_url, timeout=HTTP_TIMEOUT_SECONDS)
+            slot.observe_response(response)
+        response.raise_for_status()
+        metrics.increment("page_bytes", len(response.content))
+        return response.text, response.url
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Error fetching {full_url} over HTTP: {e}")
+        return None
+
+
+def parse_specs(root) -> Dict[str, str]:
+    specs_data: Dict[str, str] = {}
+    # .pane[data-tab="specs"] .detail-table.product-overview .col.span_1_of_2 > div
+    spec_divs = root.xpath(f"//*[{_has_class('pane')} and @data-tab='specs']"
+                           f"//*[{_has_class('detail-table')} and {_has_class('product-overview')}]"
+                           f"//*[{_has_class('col')} and {_has_class('span_1_of_2')}]/div")
+    for spec_div in spec_divs:
+        labels = spec_div.xpath(f".//span[{_has_class('label')}]")
+        values = spec_div.xpath(f".//span[{_has_class('value')}]")
+        if not labels or not values:
+            continue
+        label = _clean_text(labels[0])
+        if label:
+            specs_data[label] = _clean_text(values[0])
+    return specs_data
+
+
+def parse_bom(parts_pane) -> List[Dict[str, Any]]:
+    bom_tables = parts_pane.xpath(f".//*[{_has_class('data-table')}]")
+    if not bom_tables:
+        return []
+    bom_table = bom_tables[0]
+    headers = [_clean_text(th) for th in bom_table.xpath(".//thead//th")]
+    headers = [h for h in headers if h]
+    rows = [[_clean_text(td) for td in tr.xpath("./td")] for tr in bom_table.xpath(".//tbody/tr")]
+    return build_bom_from_rows(headers, rows)
+
+
+def parse_static_asset_urls(root, page_url: str) -> Dict[str, str | None]:
+    asset_urls: Dict[str, str | None] = {
+        'image': None,
+        'manual': None,
+    }
+    images = root.xpath(f"//*[{_has_class('product-image')}]/@src")
+    if images and images[0]:
+        asset_urls['image'] = urljoin(page_url, images[0])
+    manuals = root.xpath("//*[@id='infoPacket']/@href")
+    if manuals and manuals[0]:
+        asset_urls['manual'] = urljoin(page_url, manuals[0])
+    return asset_urls
+
+
+def pane_fragments(root) -> Dict[str, Any]:
+    # html of the archived panes and of the image/manual elements, see snapshot_store
+    panes = {}
+    for name in SNAPSHOT_PANES:
+        found = root.xpath(f"//*[{_has_class('pane')} and @data-tab='{name}']")
+        if found:
+            panes[name] = lxml.html.tostring(found[0], encoding='unicode')
+    assets = [lxml.html.tostring(element, encoding='unicode')
+              for element in root.xpath(f"//*[{_has_class('product-image')}] | //*[@id='infoPacket']")]
+    return {"panes": panes, "assets": assets}
+
+
+def parse_product_html(html: str, page_url: str) -> Dict[str, Any] | None:
+    # parses specs, BOM and static asset urls from the static html.
+    # Returns None when the page is incomplete (bot challenge, missing pane or empty specs)
+    return parse_product_tree(lxml.html.fromstring(html), page_url)
+
+
+def parse_product_tree(root, page_url: str) -> Dict[str, Any] | None:
+    # same as parse_product_html on an already parsed document
+    if not root.xpath("//*[@id='catalog-detail']"):
+        logger.info("Static HTML has no product detail (possible bot challenge)")
+        return None
+
+    specs = parse_specs(root)
+    if not specs:
+        logger.info("Static HTML has no specs")
+        return None
+
+    tabs = root.xpath("//nav//ul/li/@data-tab")
+    parts_panes = root.xpath(f"//*[{_has_class('pane')} and @data-tab='parts']")
+    if 'parts' in tabs and not parts_panes:
+        logger.info("Static HTML is missing the parts pane")
+        return None
+
+    ng_init = root.xpath("//*[@id='drawings']/@ng-init")
+    return {
+        "specs": specs,
+        "bom": parse_bom(parts_panes[0]) if parts_panes else [],
+        "asset_urls": parse_static_asset_urls(root, page_url),
+        "cad_formats": parse_cad_formats(ng_init[0]) if ng_init else [],
+    }
+
+
+def extract_product_via_http(product_id: str, fetched: tuple[str, str] | None = None) -> Dict[str, Any] | None:
+    # browserless extraction. None means the caller should fall back to selenium.
+    # fetched is (html, final url) of a page already downloaded, e.g. by the delta check
+    fetched = fetched or fetch_product_html(product_id)
+    if not fetched:
+        return None
+    html, page_url = fetched
+    try:
+        with metrics.span("http_parse"):
+            root = lxml.html.fromstring(html)
+            extracted = parse_product_tree(root, page_url)
+            if extracted:
+                extracted["page_url"] = page_url
+                extracted["snapshot"] = pane_fragments(root)
+    except Exception as e:
+        logger.warning(f"Error parsing static HTML of {product_id}: {e}")
+        return None
+
+    if extracted:
+        logger.info(f"Extracted {len(extracted['specs'])} spec itens and {len(extracted['bom'])} BOM registers over HTTP")
+    return extracted
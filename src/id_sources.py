@@ -0,0 +1,137 @@
+import re
+import sys
+import hashlib
+import logging
+import itertools
+import lxml.html
+from collections import deque
+from typing import Iterable, Iterator, List
+from urllib.parse import urljoin, urlparse, urldefrag
+
+# local imports
+from http_extraction import get_http_session
+from rate_limiter import get_rate_limiter
+from utils import BASE_URL, HTTP_TIMEOUT_SECONDS, CRAWL_START_URLS, CRAWL_MAX_PAGES
+
+logger = logging.getLogger(__name__)
+
+# product ids are streamed lazily, so a run over the whole catalog starts with the first id
+
+ID_KEY_BYTES = 8
+
+
+def id_key(product_id: str) -> bytes:
+    # compact fixed-size key, a set of 100k keys stays a few MB whatever the id lengths
+    return hashlib.blake2b(product_id.encode('utf-8'), digest_size=ID_KEY_BYTES).digest()
+
+
+def dedupe_ids(product_ids: Iterable[str]) -> Iterator[str]:
+    seen = set()
+    duplicates = 0
+    for product_id in product_ids:
+        key = id_key(product_id)
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        yield product_id
+    if duplicates:
+        logger.info(f"Skipped {duplicates} duplicated product ids")
+
+
+def iter_ids_from_lines(lines: Iterable[str]) -> Iterator[str]:
+    # one id per line, the first comma/whitespace separated field. Blank lines and # comments are skipped
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        product_id = re.split(r'[,\s]', line, 1)[0].strip()
+        if product_id:
+            yield product_id
+
+
+def iter_ids_from_file(path: str) -> Iterator[str]:
+    # "-" reads stdin
+    if path == "-":
+        yield from iter_ids_from_lines(sys.stdin)
+        return
+    with open(path, encoding='utf-8') as f:
+        yield from iter_ids_from_lines(f)
+
+
+def _product_id_from_url(url: str, catalog_path: str) -> str | None:
+    # <BASE_URL><product id>, a single path segment under the catalog
+    parsed = urlparse(url)
+    if parsed.query or not parsed.path.startswith(catalog_path):
+        return None
+    rest = parsed.path[len(catalog_path):]
+    if re.fullmatch(r'[A-Za-z0-9][\w\-\.]*', rest):
+        return rest
+    return None
+
+
+def crawl_catalog_ids(start_urls: List[str] | None = None, max_pages: int = CRAWL_MAX_PAGES,
+                      follow_products: bool = False) -> Iterator[str]:
+    # breadth-first crawl of the catalog/category pages on the BASE_URL host, yielding the product ids
+    # linked from them as soon as each page is parsed. Only pages under the catalog or a start url's path
+    # are followed. Product pages are not fetched unless follow_products is set (they link related products)
+    base = urlparse(BASE_URL)
+    catalog_path = base.path if base.path.endswith('/') else base.path + '/'
+    frontier = deque(start_urls or CRAWL_START_URLS or [BASE_URL])
+    allowed_paths = tuple({catalog_path.rstrip('/')} | {urlparse(url).path.rstrip('/') for url in frontier})
+    queued = {id_key(urldefrag(url)[0]) for url in frontier}
+    session = get_http_session()
+    pages = 0
+
+    while frontier and pages < max_pages:
+        url = frontier.popleft()
+        try:
+            with get_rate_limiter().request(url) as slot:
+                response = session.get(url, timeout=HTTP_TIMEOUT_SECONDS)
+                slot.observe_response(response)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Error crawling {url}: {e}")
+            continue
+        pages += 1
+        if 'html' not in response.headers.get('Content-Type', 'text/html'):
+            continue
+
+        try:
+            root = lxml.html.fromstring(response.content)
+        except Exception as e:
+            logger.debug(f"Error parsing {url}: {e}")
+            continue
+
+        for href in root.xpath("//a/@href"):
+            link = urldefrag(urljoin(response.url, href))[0]
+            parsed = urlparse(link)
+            if parsed.scheme not in ("http", "https") or parsed.netloc != base.netloc:
+                continue
+
+            product_id = _product_id_from_url(link, catalog_path)
+            if product_id:
+                yield product_id
+                if not follow_products:
+                    continue
+            elif not parsed.path.startswith(allowed_paths):
+                continue
+
+            key = id_key(link)
+            if key not in queued:
+                queued.add(key)
+                frontier.append(link)
+
+    logger.info(f"Catalog crawl visited {pages} pages ({len(frontier)} left in the frontier)")
+
+
+def product_id_source(paths: Iterable[str] = (), crawl: bool = False,
+                      static_ids: Iterable[str] | None = None) -> Iterator[str]:
+    # chains the given ids, files (or stdin) and the catalog crawl into one deduplicated stream
+    sources = []
+    if static_ids:
+        sources.append(iter(static_ids))
+    sources.extend(iter_ids_from_file(path) for path in paths)
+    if crawl:
+        sources.append(crawl_catalog_ids())
+    return dedupe_ids(itertools.chain.from_iterable(sources))
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Iterable, Tuple
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:
+    # variants are skipped without Pillow
+    Image = None
+
+# local imports
+from blob_store import hash_file
+from output_sinks import read_json_products, JsonFileSink
+from utils import (DATA_OUTPUT_DIR, IMAGE_VARIANT_WIDTHS, IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY,
+                   IMAGE_VARIANT_WORKERS)
+
+logger = logging.getLogger(__name__)
+
+# resized and re-encoded copies of the product images for the storefront, next to the source image:
+# assets/<id>/image_320w.webp, image_full.webp... recorded in product_data['assets']['image_variants']
+# as {"320w_webp": path, ...}. A sidecar image_variants.json holds the source's sha256, so unchanged
+# images are skipped on later runs
+
+FORMAT_EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp", "avif": ".avif", "png": ".png"}
+SAVE_OPTIONS = {
+    "jpeg": {"optimize": True, "progressive": True},
+    "webp": {"method": 4},
+    "avif": {},
+    "png": {"optimize": True},
+}
+SIDECAR_NAME = "image_variants.json"
+VARIANT_CHUNK_SIZE = 8
+# under this many images the variants are built in this process, starting a pool would cost more
+POOL_MIN_IMAGES = 4
+
+
+def _settings() -> Dict[str, Any]:
+    # a change of settings rebuilds every variant
+    return {"widths": list(IMAGE_VARIANT_WIDTHS), "formats": list(IMAGE_VARIANT_FORMATS),
+            "quality": IMAGE_VARIANT_QUALITY}
+
+
+def _read_sidecar(sidecar_path: str) -> Dict[str, Any] | None:
+    try:
+        with open(sidecar_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(image, file_path: str, output_format: str):
+    # written aside and moved in place, a storefront never serves a half-written file
+    if output_format == "jpeg" and image.mode in ("RGBA", "LA"):
+        # transparent PNG/GIF sources are flattened on white
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    image.save(tmp_path, format=output_format.upper(), quality=IMAGE_VARIANT_QUALITY,
+               **SAVE_OPTIONS.get(output_format, {}))
+    os.replace(tmp_path, file_path)
+
+
+def build_variants(task: Tuple[str, str, bool]) -> Dict[str, Any]:
+    # runs in a worker process. task: product id, source image path relative to the output dir, force
+    product_id, relative_path, force = task
+    result: Dict[str, Any] = {"product_id": product_id, "status": "failed", "variants": None}
+    source_path = os.path.join(DATA_OUTPUT_DIR, relative_path)
+    asset_dir = os.path.dirname(source_path)
+    sidecar_path = os.path.join(asset_dir, SIDECAR_NAME)
+    try:
+        sha256, _ = hash_file(source_path)
+    except OSError as e:
+        logger.warning(f"Error reading the image of {product_id}: {e}")
+        return result
+
+    sidecar = _read_sidecar(sidecar_path)
+    if (not force and sidecar and sidecar.get("source_sha256") == sha256 and sidecar.get("settings") == _settings()
+            and all(os.path.exists(os.path.join(DATA_OUTPUT_DIR, path)) for path in sidecar["variants"].values())):
+        return {**result, "status": "unchanged", "variants": sidecar["variants"]}
+
+    start = time.perf_counter()
+    try:
+        with Image.open(source_path) as image:
+            source_format = (image.format or "").lower()
+            # camera photos are stored rotated with an EXIF orientation, palette and CMYK images
+            # are converted so they resize with a proper filter
+            current = ImageOps.exif_transpose(image)
+            if current.mode not in ("RGB", "RGBA", "L", "LA"):
+                current = current.convert("RGBA" if "transparency" in current.info or current.mode == "PA" else "RGB")
+            # largest first, each width is resized from the previous one instead of the full source
+            widths = sorted(IMAGE_VARIANT_WIDTHS, key=lambda width: width or current.width, reverse=True)
+            variants = {}
+            source_width = current.width
+            for width in widths:
+                if width and width >= source_width:
+                    # no upscaled or same-size copies under a width label, the full size variant covers it
+                    continue
+                if width:
+                    current = current.resize((width, max(1, round(current.height * width / current.width))),
+                                             Image.LANCZOS)
+                label = f"{width}w" if width else "full"
+                for output_format in IMAGE_VARIANT_FORMATS:
+                    if width is None and output_format == source_format:
+                        # the source itself
+                        continue
+                    file_name = f"image_{label}{FORMAT_EXTENSIONS.get(output_format, '.' + output_format)}"
+                    try:
+                        _save(current, os.path.join(asset_dir, file_name), output_format)
+                    except (OSError, KeyError, ValueError) as e:
+                        logger.warning(f"Error encoding {file_name} of {product_id}: {e}")
+                        continue
+                    variants[f"{label}_{output_format}"] = os.path.relpath(
+                        os.path.join(asset_dir, file_name), DATA_OUTPUT_DIR).replace('\\', '/')
+    except (OSError, UnidentifiedImageError, ValueError) as e:
+        logger.warning(f"Error opening the image of {product_id} ({relative_path}): {e}")
+        return result
+
+    # variants dropped from the settings since the last build
+    for stale_path in set((sidecar or {}).get("variants", {}).values()) - set(variants.values()):
+        try:
+            os.remove(os.path.join(DATA_OUTPUT_DIR, stale_path))
+        except OSError:
+            pass
+    with open(sidecar_path, 'w', encoding='utf-8') as f:
+        json.dump({"source": relative_path, "source_format": source_format, "source_sha256": sha256,
+                   "settings": _settings(), "variants": variants}, f, indent=2)
+    logger.debug(f"{len(variants)} image variants of {product_id} in {time.perf_counter() - start:.2f}s")
+    return {**result, "status": "built", "variants": variants}
+
+
+def generate_image_variants(product_ids: Iterable[str] | None = None, force: bool = False,
+                            workers: int | None = IMAGE_VARIANT_WORKERS) -> Dict[str, Any]:
+    # builds the variants of every saved product's image (or the given ones) across worker processes
+    # and records them in the products' JSON files
+    summary: Dict[str, Any] = {"built": 0, "unchanged": 0, "failed": 0}
+    if Image is None:
+        logger.warning("Image variants need Pillow: pip install pillow")
+        return summary
+
+    start = time.monotonic()
+    product_ids = list(product_ids) if product_ids is not None else None
+    tasks = []
+    recorded: Dict[str, Any] = {}
+    for _, product_data in read_json_products(product_ids=product_ids):
+        assets = product_data.get('assets') or {}
+        if isinstance(assets.get('image'), str):
+            tasks.append((product_data['product_id'], assets['image'], force))
+            recorded[product_data['product_id']] = assets.get('image_variants')
+
+    if len(tasks) < POOL_MIN_IMAGES or workers == 1:
+        results: List[Dict[str, Any]] = [build_variants(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            results = list(executor.map(build_variants, tasks, chunksize=VARIANT_CHUNK_SIZE))
+
+    # only the products whose variants changed are written again
+    changed = {}
+    for result in results:
+        summary[result["status"]] += 1
+        if result["variants"] is not None and result["variants"] != recorded[result["product_id"]]:
+            changed[result["product_id"]] = result["variants"]
+    sink = JsonFileSink()
+    for _, product_data in read_json_products(product_ids=list(changed)):
+        product_data['assets']['image_variants'] = changed[product_data['product_id']]
+        sink.write(product_data['product_id'], product_data)
+
+    elapsed = time.monotonic() - start
+    summary["elapsed_seconds"] = round(elapsed, 2)
+    logger.info(f"Image variants: {summary['built']} images processed, {summary['unchanged']} unchanged, "
+                f"{summary['failed']} failed in {elapsed:.1f}s")
+    return summary
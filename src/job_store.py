@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterable, Iterator
+
+# local imports
+from utils import JOB_STORE_PATH, JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    product_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    next_attempt_at REAL,
+    last_error TEXT,
+    stages TEXT,
+    output_path TEXT,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    manifest TEXT
+);
+CREATE INDEX IF NOT EXISTS products_status ON products (status);
+"""
+
+# columns added after the first release, created on stores that predate them
+ADDED_COLUMNS = {"lease_owner": "TEXT", "lease_expires_at": "REAL", "manifest": "TEXT"}
+
+# pending -> running -> done | failed. Failed products are retried with exponential backoff.
+# In distributed runs (coordinator.py) a running product is leased to a worker until lease_expires_at
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+def product_stages(product_data: Dict[str, Any]) -> Dict[str, Any]:
+    # per-stage outcome of a scraped product
+    assets = product_data.get('assets') or {}
+    return {
+        "specs": len(product_data.get('specs') or {}),
+        "bom": len(product_data.get('bom') or []),
+        "image": bool(assets.get('image')),
+        "manual": bool(assets.get('manual')),
+        "cad": bool(assets.get('cad')),
+    }
+
+
+class JobStore:
+    # durable record of every product's scraping state, so an interrupted run can be resumed
+
+    def __init__(self, path: str = JOB_STORE_PATH, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 backoff_seconds: float = JOB_RETRY_BACKOFF_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(products)")}
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE products ADD COLUMN {column} {column_type}")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # short-lived connections, the store is written from download threads and worker processes
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def recover_interrupted(self) -> int:
+        # products left running by a crashed run go back to pending without losing their attempt count.
+        # Products leased to remote workers keep running until their lease expires
+        with self._connect() as conn:
+            count = conn.execute("UPDATE products SET status = ?, updated_at = ? WHERE status = ? AND lease_expires_at IS NULL",
+                                 (PENDING, time.time(), RUNNING)).rowcount
+        if count:
+            logger.info(f"Resuming {count} products interrupted in a previous run")
+        return count
+
+    def claim(self, product_id: str, refresh_after: float | None = None) -> bool:
+        # marks the product as running if it still needs to be scraped. Done products, failed products
+        # waiting for their backoff and products out of attempts are skipped. With refresh_after (delta runs),
+        # products done longer than that many seconds ago are claimed again
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO products (product_id, status, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                         (product_id, PENDING, now, now))
+            row = conn.execute("SELECT status, attempts, next_attempt_at, finished_at FROM products WHERE product_id = ?",
+                               (product_id,)).fetchone()
+            if row["status"] == DONE and refresh_after is not None and (row["finished_at"] or 0) < now - refresh_after:
+                conn.execute("UPDATE products SET status = ?, attempts = 1, started_at = ?, updated_at = ? "
+                             "WHERE product_id = ?", (RUNNING, now, now, product_id))
+                return True
+            if row["status"] in (DONE, RUNNING):
+                return False
+            if row["status"] == FAILED:
+                if row["attempts"] >= self.max_attempts:
+                    return False
+                if row["next_attempt_at"] and row["next_attempt_at"] > now:
+                    return False
+            conn.execute("UPDATE products SET status = ?, attempts = attempts + 1, started_at = ?, updated_at = ? "
+                         "WHERE product_id = ?", (RUNNING, now, now, product_id))
+        return True
+
+    def mark_done(self, product_id: str, output_path: str | None, stages: Dict[str, Any] | None = None,
+                  manifest: Dict[str, Any] | None = None):
+        # manifest: the asset files a remote worker wrote, with their size and sha256
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE products SET status = ?, finished_at = ?, updated_at = ?, last_error = NULL, "
+                         "next_attempt_at = NULL, lease_owner = NULL, lease_expires_at = NULL, stages = ?, "
+                         "output_path = ?, manifest = ? WHERE product_id = ?",
+                         (DONE, now, now, json.dumps(stages) if stages else None, output_path,
+                          json.dumps(manifest) if manifest else None, product_id))
+
+    def mark_unchanged(self, product_id: str):
+        # a delta run found the product unchanged: done again, keeping the output and stages of its last scrape
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE products SET status = ?, finished_at = ?, updated_at = ?, last_error = NULL, "
+                         "next_attempt_at = NULL, lease_owner = NULL, lease_expires_at = NULL WHERE product_id = ?",
+                         (DONE, now, now, product_id))
+
+    def mark_failed(self, product_id: str, error: str | None, stages: Dict[str, Any] | None = None):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT attempts FROM products WHERE product_id = ?", (product_id,)).fetchone()
+            attempts = row["attempts"] if row else 1
+            next_attempt_at = now + self.backoff_seconds * 2 ** max(0, attempts - 1)
+            conn.execute("UPDATE products SET status = ?, finished_at = ?, updated_at = ?, last_error = ?, "
+                         "next_attempt_at = ?, lease_owner = NULL, lease_expires_at = NULL, stages = ? "
+                         "WHERE product_id = ?",
+                         (FAILED, now, now, error, next_attempt_at, json.dumps(stages) if stages else None, product_id))
+
+    def get(self, product_id: str) -> Dict[str, Any] | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM products WHERE product_id = ?", (product_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["stages"] = json.loads(job["stages"]) if job["stages"] else None
+        job["manifest"] = json.loads(job["manifest"]) if job["manifest"] else None
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return {row["status"]: row["total"] for row in
+                    conn.execute("SELECT status, COUNT(*) AS total FROM products GROUP BY status")}
+
+    # --- leases, used by the coordinator of distributed runs ---
+
+    def enqueue(self, product_ids: Iterable[str]) -> int:
+        # adds the products not in the store yet as pending
+        now = time.time()
+        with self._connect() as conn:
+            return conn.executemany("INSERT OR IGNORE INTO products (product_id, status, created_at, updated_at) "
+                                    "VALUES (?, ?, ?, ?)", [(p_id, PENDING, now, now) for p_id in product_ids]).rowcount
+
+    def _expire_leases(self, conn: sqlite3.Connection, now: float) -> int:
+        # products of workers that stopped heartbeating go back to the queue, or fail when out of attempts
+        conn.execute("UPDATE products SET status = ?, last_error = 'lease expired', finished_at = ?, updated_at = ?, "
+                     "lease_owner = NULL, lease_expires_at = NULL WHERE status = ? AND lease_expires_at < ? "
+                     "AND attempts >= ?", (FAILED, now, now, RUNNING, now, self.max_attempts))
+        count = conn.execute("UPDATE products SET status = ?, last_error = 'lease expired', updated_at = ?, "
+                             "lease_owner = NULL, lease_expires_at = NULL WHERE status = ? AND lease_expires_at < ?",
+                             (PENDING, now, RUNNING, now)).rowcount
+        if count:
+            logger.warning(f"Re-queued {count} products whose lease expired")
+        return count
+
+    def lease(self, worker_id: str, count: int, lease_seconds: float) -> List[str]:
+        # hands out up to count products to the worker: pending ones, then failed ones due for a retry.
+        # The write transaction makes concurrent leases from several threads or processes exclusive
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire_leases(conn, now)
+            rows = conn.execute("SELECT product_id FROM products WHERE status = ? OR (status = ? AND attempts < ? "
+                                "AND (next_attempt_at IS NULL OR next_attempt_at <= ?)) "
+                                "ORDER BY status = ? DESC, created_at LIMIT ?",
+                                (PENDING, FAILED, self.max_attempts, now, PENDING, count)).fetchall()
+            product_ids = [row["product_id"] for row in rows]
+            conn.executemany("UPDATE products SET status = ?, attempts = attempts + 1, started_at = ?, updated_at = ?, "
+                             "lease_owner = ?, lease_expires_at = ? WHERE product_id = ?",
+                             [(RUNNING, now, now, worker_id, now + lease_seconds, p_id) for p_id in product_ids])
+        return product_ids
+
+    def heartbeat(self, worker_id: str, product_ids: List[str], lease_seconds: float) -> List[str]:
+        # extends the worker's leases and returns the products it no longer holds
+        now = time.time()
+        lost = []
+        with self._connect() as conn:
+            for p_id in product_ids:
+                extended = conn.execute("UPDATE products SET lease_expires_at = ?, updated_at = ? "
+                                        "WHERE product_id = ? AND status = ? AND lease_owner = ?",
+                                        (now + lease_seconds, now, p_id, RUNNING, worker_id)).rowcount
+                if not extended:
+                    lost.append(p_id)
+        return lost
+
+    def finish_lease(self, product_id: str, worker_id: str) -> bool:
+        # called before a worker's result is saved. Pins the product to the worker so the lease can't expire
+        # while it is written. False when the product was re-queued or leased to another worker meanwhile
+        with self._connect() as conn:
+            return conn.execute("UPDATE products SET lease_expires_at = NULL, updated_at = ? "
+                                "WHERE product_id = ? AND status = ? AND lease_owner = ?",
+                                (time.time(), product_id, RUNNING, worker_id)).rowcount == 1
+
+    def remaining(self) -> int:
+        # products still pending or leased
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM products WHERE status IN (?, ?)", (PENDING, RUNNING)).fetchone()[0]
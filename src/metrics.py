@@ -0,0 +1,168 @@
+import os
+import json
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Any, Tuple, Iterator
+
+if TYPE_CHECKING:
+    # selenium takes a quarter of a second to import, commands that never start a browser skip it
+    from selenium.webdriver.remote.webdriver import WebDriver
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = "baldor"
+QUANTILES = (0.5, 0.95)
+
+
+def percentile(values: List[float], q: float) -> float:
+    # nearest-rank percentile, values must be sorted
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def _label_text(labels: Dict[str, str]) -> str:
+    return ",".join(f'{name}="{str(value)}"' for name, value in labels.items())
+
+
+class Metrics:
+    # collects stage durations (spans), counters and gauges for a run. One instance per process,
+    # process workers hand their samples to the runner with drain()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        # times the block, including when it raises
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds)
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        # current value of something (rate, queue depth), the last value wins
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+            self._counters = {}
+            self._gauges = {}
+
+    def drain(self) -> Dict[str, Any]:
+        # returns the raw samples and counters recorded so far and starts over
+        with self._lock:
+            drained = {
+                "samples": self._samples,
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, list(labels), value] for (name, labels), value in self._gauges.items()],
+            }
+            self._samples = {}
+            self._counters = {}
+        return drained
+
+    def merge(self, drained: Dict[str, Any]):
+        with self._lock:
+            for stage, values in drained["samples"].items():
+                self._samples.setdefault(stage, []).extend(values)
+            for name, labels, value in drained["counters"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, value in drained.get("gauges", []):
+                self._gauges[(name, tuple(tuple(label) for label in labels))] = value
+
+    def report(self) -> Dict[str, Any]:
+        # per stage count, total, mean, p50, p95 and max in seconds, plus the counters
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        stages = {}
+        for stage, values in sorted(samples.items()):
+            total = sum(values)
+            stages[stage] = {
+                "count": len(values),
+                "total": round(total, 4),
+                "mean": round(total / len(values), 4),
+                "p50": round(percentile(values, 0.5), 4),
+                "p95": round(percentile(values, 0.95), 4),
+                "max": round(values[-1], 4),
+            }
+        return {
+            "stages": stages,
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(counters.items())],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                       for (name, labels), value in sorted(gauges.items())],
+        }
+
+    def write_json(self, path: str, extra: Dict[str, Any] | None = None):
+        report = self.report()
+        if extra:
+            report.update(extra)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    def write_prometheus(self, path: str):
+        # text exposition format, e.g. for node_exporter's textfile collector. Written atomically
+        report = self.report()
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Duration of each scraping stage",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary",
+        ]
+        for stage, stats in report["stages"].items():
+            for q in QUANTILES:
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{stats[f"p{round(q * 100)}"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {stats["total"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+
+        typed = set()
+        series = [(f"{PROMETHEUS_PREFIX}_{c['name']}_total", "counter", c) for c in report["counters"]]
+        series += [(f"{PROMETHEUS_PREFIX}_{g['name']}", "gauge", g) for g in report["gauges"]]
+        for metric, metric_type, sample in series:
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} {metric_type}")
+                typed.add(metric)
+            labels = _label_text(sample["labels"])
+            lines.append(f"{metric}{{{labels}}} {sample['value']}" if labels else f"{metric} {sample['value']}")
+
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+
+
+def instrument_driver(driver: "WebDriver") -> "WebDriver":
+    # counts every WebDriver command sent by this browser (find_element, execute_script, get...)
+    execute = driver.execute
+
+    def counted_execute(driver_command, params=None):
+        command = driver_command if isinstance(driver_command, str) else "bidi"
+        metrics.increment("webdriver_commands", command=command)
+        return execute(driver_command, params)
+
+    driver.execute = counted_execute
+    return driver
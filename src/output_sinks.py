@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Any, Iterable, Iterator, Tuple
+
+# local imports
+from utils import (DATA_OUTPUT_DIR, JSONL_OUTPUT_PATH, JSONL_FSYNC_EVERY, JSONL_FSYNC_SECONDS,
+                   PARQUET_OUTPUT_DIR, PARQUET_ROW_GROUP_SIZE, clean_filename)
+
+# pyarrow is optional and slow to import, it is loaded by the first ParquetSink
+pa = None
+pq = None
+
+logger = logging.getLogger(__name__)
+
+# every sink exposes write(product_id, product_data) -> output path, usable as run_scrape's on_result,
+# and close(). write may be called from several threads
+
+
+def _load_pyarrow() -> bool:
+    global pa, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            return False
+        pa, pq = pyarrow, pyarrow.parquet
+    return True
+
+
+def read_json_products(directory: str = DATA_OUTPUT_DIR,
+                       product_ids: Iterable[str] | None = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # (path, product data) of the products saved by JsonFileSink, all of them or only the given ones
+    if product_ids is None:
+        if not os.path.isdir(directory):
+            return
+        paths = sorted(entry.path for entry in os.scandir(directory) if entry.is_file() and entry.name.endswith('.json'))
+    else:
+        paths = [os.path.join(directory, f"{clean_filename(p_id)}.json") for p_id in product_ids]
+    for json_filepath in paths:
+        try:
+            with open(json_filepath, encoding='utf-8') as f:
+                product_data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Error reading {json_filepath}: {e}")
+            continue
+        if isinstance(product_data, dict) and product_data.get('product_id'):
+            yield json_filepath, product_data
+
+
+class JsonFileSink:
+    # one pretty-printed <product_id>.json per product
+
+    def __init__(self, directory: str = DATA_OUTPUT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, p_id: str, scraped_data: Dict[str, Any]) -> str:
+        json_filepath = os.path.join(self.directory, f"{clean_filename(p_id)}.json")
+        logger.info(f"Saving structured data as {json_filepath}")
+        try:
+            with open(json_filepath, 'w', encoding='utf-8') as f:
+                json.dump(scraped_data, f, indent=2, ensure_ascii=False)
+            logger.info("Data saved successfully")
+        except IOError as e:
+            logger.error(f"Error saving {json_filepath}: {e}")
+            raise
+        return json_filepath
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    # appends one compact JSON object per line to a single file. Every line is flushed to the OS
+    # right away, and fsync (the expensive part) runs every fsync_every lines or fsync_seconds
+
+    def __init__(self, path: str = JSONL_OUTPUT_PATH, fsync_every: int = JSONL_FSYNC_EVERY,
+                 fsync_seconds: float = JSONL_FSYNC_SECONDS):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_seconds = fsync_seconds
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, p_id: str, scraped_data: Dict[str, Any]) -> str:
+        line = json.dumps(scraped_data, ensure_ascii=False, separators=(',', ':')) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_seconds:
+                self._sync()
+        logger.debug(f"{p_id} appended to {self.path}")
+        return self.path
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def truncate(self):
+        # drops everything written so far (used by the parquet spool once its rows are committed)
+        with self._lock:
+            self._file.truncate(0)
+            self._file.seek(0)
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+
+def _column_name(spec_label: str) -> str:
+    return "spec_" + re.sub(r'\W+', '_', spec_label).strip('_').lower()
+
+
+def flatten_product(product_data: Dict[str, Any]) -> Dict[str, Any]:
+    # one row per product: top level fields, asset paths and one column per spec
+    assets = product_data.get('assets') or {}
+    row = {
+        "product_id": product_data.get('product_id'),
+        "name": product_data.get('name'),
+        "description": product_data.get('description'),
+        "hp": product_data.get('hp'),
+        "voltage": product_data.get('voltage'),
+        "rpm": product_data.get('rpm'),
+        "frame": product_data.get('frame'),
+        "asset_manual": assets.get('manual'),
+        "asset_cad": assets.get('cad'),
+        "asset_image": assets.get('image'),
+    }
+    for label, value in (product_data.get('specs') or {}).items():
+        row[_column_name(label)] = value
+    return row
+
+
+def flatten_bom(product_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # child table keyed by product_id. Quantities that aren't numbers are kept in quantity_text
+    rows = []
+    for position, entry in enumerate(product_data.get('bom') or []):
+        quantity = entry.get('quantity')
+        numeric = isinstance(quantity, (int, float))
+        rows.append({
+            "product_id": product_data.get('product_id'),
+            "position": position,
+            "part_number": entry.get('part_number'),
+            "description": entry.get('description'),
+            "quantity": float(quantity) if numeric else None,
+            "quantity_text": None if numeric or quantity is None else str(quantity),
+        })
+    return rows
+
+
+class ParquetSink:
+    # columnar export: products/part-*.parquet (specs flattened into spec_* columns) and
+    # bom/part-*.parquet (one row per BOM line). Rows are spooled to a JSON Lines file and
+    # written as a new part every row_group_size products, so a crash loses nothing:
+    # a leftover spool is committed on the next start. Spec columns may differ between parts,
+    # read them with pyarrow.dataset and a unified schema (or pandas.concat)
+
+    def __init__(self, directory: str = PARQUET_OUTPUT_DIR, row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+        if not _load_pyarrow():
+            raise RuntimeError("Parquet output needs pyarrow: pip install pyarrow")
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        for table in ("products", "bom"):
+            os.makedirs(os.path.join(directory, table), exist_ok=True)
+
+        spool_path = os.path.join(directory, "_spool.jsonl")
+        if os.path.exists(spool_path):
+            with open(spool_path, encoding='utf-8') as f:
+                leftover = [json.loads(line) for line in f if line.strip()]
+            if leftover:
+                logger.info(f"Committing {len(leftover)} products spooled by a previous run")
+                self._write_part(leftover)
+        self._spool = JsonLinesSink(spool_path)
+        self._spool.truncate()
+
+    def write(self, p_id: str, scraped_data: Dict[str, Any]) -> str:
+        with self._lock:
+            self._spool.write(p_id, scraped_data)
+            self._pending.append(scraped_data)
+            if len(self._pending) >= self.row_group_size:
+                self._flush()
+        return self.directory
+
+    def _flush(self):
+        if not self._pending:
+            return
+        self._write_part(self._pending)
+        self._pending = []
+        self._spool.truncate()
+
+    def _next_part(self) -> int:
+        parts = [f for f in os.listdir(os.path.join(self.directory, "products")) if f.endswith(".parquet")]
+        return len(parts)
+
+    def _write_part(self, products: List[Dict[str, Any]]):
+        part = self._next_part()
+        product_rows = [flatten_product(p) for p in products]
+        bom_rows = [row for p in products for row in flatten_bom(p)]
+
+        # spec columns are strings, missing specs are null
+        columns = list(dict.fromkeys(column for row in product_rows for column in row))
+        product_table = pa.table({column: pa.array([row.get(column) for row in product_rows], type=pa.string())
+                                  for column in columns})
+        bom_table = pa.table({
+            "product_id": pa.array([r["product_id"] for r in bom_rows], type=pa.string()),
+            "position": pa.array([r["position"] for r in bom_rows], type=pa.int32()),
+            "part_number": pa.array([r["part_number"] for r in bom_rows], type=pa.string()),
+            "description": pa.array([r["description"] for r in bom_rows], type=pa.string()),
+            "quantity": pa.array([r["quantity"] for r in bom_rows], type=pa.float64()),
+            "quantity_text": pa.array([r["quantity_text"] for r in bom_rows], type=pa.string()),
+        })
+
+        # the bom part is written first, a products part always has its bom part
+        for table_name, table in (("bom", bom_table), ("products", product_table)):
+            path = os.path.join(self.directory, table_name, f"part-{part:05d}.parquet")
+            tmp_path = f"{path}.tmp"
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+        logger.info(f"Wrote parquet part {part} ({len(product_rows)} products, {len(bom_rows)} BOM lines)")
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._spool.close()
+
+
+def create_sink(output_format: str):
+    if output_format == "json":
+        return JsonFileSink()
+    if output_format == "jsonl":
+        return JsonLinesSink()
+    if output_format == "parquet":
+        return ParquetSink()
+    raise ValueError(f"Unknown output format '{output_format}'")
@@ -1,7 +1,6 @@
 import time
 import os
 import logging
-import undetected_chromedriver as uc
 import re 
 from selenium.webdriver.remote.webdriver import WebDriver
 from selenium.common.exceptions import WebDriverException
@@ -10,135 +9,148 @@ from urllib.parse import urljoin
 
 # local imports
 from selenium_utils import handle_cookie_overlay
-from data_extraction import extract_specs, extract_bom, extract_static_asset_urls
-from asset_downloader import download_asset_with_requests, download_cad_interactively
-from utils import BASE_URL, DATA_OUTPUT_DIR, ASSETS_BASE_DIR, clean_filename
+from driver_pool import DriverPool
+from metrics import metrics
+from rate_limiter import get_rate_limiter
+from snapshot_store import get_snapshot_store, SNAPSHOT_PANES
+from data_extraction import (extract_specs, extract_bom, extract_static_asset_urls,
+                             extract_specs_snapshot, extract_bom_snapshot, extract_static_asset_urls_snapshot,
+                             extract_panes_html)
+from asset_downloader import download_asset_with_requests
+from cad_browser import download_cad_interactively
+from http_extraction import extract_product_via_http
+from download_service import DownloadService
+from cad_resolver import resolve_cad_downloads
+from product_fields import derive_product_fields, new_product_data
+from utils import (BASE_URL, DATA_OUTPUT_DIR, ASSETS_BASE_DIR, USE_HTTP_EXTRACTION, EXTRACTION_MODE,
+                   CAD_DOWNLOAD_MODE, CAD_URL_SOURCE, CAD_DOWNLOAD_ALL_FORMATS, LEAN_BROWSER,
+                   RATE_LIMIT_SLOW_PAGE_SECONDS, ARCHIVE_SNAPSHOTS, BROWSER_DOWNLOAD_SUBDIR, clean_filename)
 
 logger = logging.getLogger(__name__)
 
-def scrape_product_page(product_id: str):
+def _load_product_page(driver: WebDriver, full_url: str):
+    logger.debug(f"loading {full_url}")
+    # a page load counts as one request to the host, and is slow only past RATE_LIMIT_SLOW_PAGE_SECONDS
+    with get_rate_limiter().request(full_url, slow_seconds=RATE_LIMIT_SLOW_PAGE_SECONDS), metrics.span("page_load"):
+        driver.get(full_url)
+    logger.info("Page loaded")
+
+    if not LEAN_BROWSER:
+        # the lean profile blocks the consent script, so the overlay never renders
+        with metrics.span("cookie_overlay"):
+            handle_cookie_overlay(driver)
+
+def _acquire_driver(driver_pool: DriverPool, download_dir: str) -> WebDriver:
+    # the download folder is only created for the products that open a browser
+    os.makedirs(download_dir, exist_ok=True)
+    return driver_pool.acquire(download_dir)
+
+def scrape_product_page(product_id: str, driver_pool: DriverPool | None = None,
+                        download_service: DownloadService | None = None, fetched: tuple[str, str] | None = None):
+    # scrapes a product with a browser from the pool. Without a pool a single-use browser is booted.
+    # With a download service the image and manual are downloaded in the background and
+    # product_data['assets'] holds their futures until they are resolved. fetched is the
+    # (html, final url) of the page when it was already downloaded
     full_url = urljoin(BASE_URL, product_id) 
 
-    # inicialize an expected structure
-    product_data: Dict[str, Any] = {
-        "product_id": product_id,
-        "name": product_id,
-        "description": None,
-        "specs": {},
-        "hp": None,
-        "voltage": None,
-        "rpm": None,
-        "frame": None,
-        "bom": [],
-        "assets": {
-            "manual": None,
-            "cad": None,
-            "image": None,
-        }
-    }
+    product_data = new_product_data(product_id)
     driver = None
+    broken_driver = False
+    own_pool = driver_pool is None
+    if own_pool:
+        driver_pool = DriverPool(size=1)
 
     logger.info(f"Scraping {product_id} from {full_url}")
 
-    selenium_download_dir_for_this_product = os.path.join(ASSETS_BASE_DIR, product_id)
-    os.makedirs(selenium_download_dir_for_this_product, exist_ok=True)
+    # the image and manual are written to the product's folder in the background while chrome downloads,
+    # so chrome gets a folder of its own and the CAD wait only ever sees the browser's files
+    selenium_download_dir_for_this_product = os.path.join(ASSETS_BASE_DIR, clean_filename(product_id),
+                                                          BROWSER_DOWNLOAD_SUBDIR)
 
     try:
-        options = uc.ChromeOptions()
-        options.headless = False
-        options.add_argument("--start-maximized")
-
-        options.add_experimental_option(
-            "prefs", {
-                "download.default_directory": selenium_download_dir_for_this_product,
-                "download.prompt_for_download": False,
-                "download.directory_upgrade": True,
-                "plugins.always_open_pdf_externally": True
-            }
-        )
-
-        logger.debug("booting undetected_chromedriver")
-        driver = uc.Chrome(options=options)
-        logger.info("webdriver booted")
-
-        logger.debug(f"loading {full_url}")
-        driver.get(full_url)
-        logger.info("Page loaded")
-
-        handle_cookie_overlay(driver)
-
-        all_specs = extract_specs(driver)
-        product_data['specs'] = all_specs
-
-        spec_key_mapping_for_toplevel = {
-            "Output @ Frequency": "hp",
-            "Voltage @ Frequency": "voltage",
-            "Speed": "rpm",
-            "Frame": "frame"
-        }
-        for html_key, json_key in spec_key_mapping_for_toplevel.items():
-            if html_key in product_data['specs']:
-                value = product_data['specs'][html_key]
-
-                if json_key == 'hp':
-                     match = re.search(r'^\s*(\d*\.?\d+)', value)
-                     if match:
-                          try:
-                              hp_float = float(match.group(1))
-                              product_data['hp'] = str(hp_float)
-                          except ValueError:
-                              logger.warning(f"Error converting HP '{match.group(1)}' from '{value}' to float")
-                              product_data['hp'] = value
-                     else:
-                          logger.warning(f"Error extracting int HP from '{value}'.")
-                          product_data['hp'] = value
-
-                elif json_key == 'rpm':
-                     match = re.search(r'^\s*(\d+)', value)
-                     if match:
-                          product_data['rpm'] = match.group(1)
-                     else:
-                          logger.warning(f"Error extracting int RPM from '{value}'.")
-                          product_data['rpm'] = value
-                else:
-                    product_data[json_key] = value
-
-        description_parts = []
-        if 'Enclosure' in all_specs: description_parts.append(all_specs['Enclosure'])
-        if product_data.get('hp') is not None and product_data['hp'] != '':
-             description_parts.append(f"{product_data['hp']} HP")
-        if product_data.get('rpm') is not None and product_data['rpm'] != '':
-             description_parts.append(f"{product_data['rpm']} RPM")
-        if 'Frame' in all_specs: description_parts.append(all_specs['Frame'])
-
-        product_data['description'] = ", ".join(description_parts) if description_parts else None
-        if product_data['description']:
-             logger.info(f"Description: {product_data['description']}")
+        static_data = extract_product_via_http(product_id, fetched) if USE_HTTP_EXTRACTION else None
+
+        if static_data:
+            all_specs = static_data['specs']
+            product_data['bom'] = static_data['bom']
+            static_asset_urls = static_data['asset_urls']
+            if ARCHIVE_SNAPSHOTS:
+                snapshot = static_data['snapshot']
+                get_snapshot_store().save(product_id, static_data['page_url'], snapshot['panes'], snapshot['assets'], "http")
         else:
-             logger.warning("Error building description from specs")
-
-        product_data['bom'] = extract_bom(driver)
+            if USE_HTTP_EXTRACTION:
+                logger.info("Static HTML incomplete, falling back to browser extraction")
+            driver = _acquire_driver(driver_pool, selenium_download_dir_for_this_product)
+            _load_product_page(driver, full_url)
+            use_snapshot = EXTRACTION_MODE == "snapshot"
+            with metrics.span("specs"):
+                all_specs = extract_specs_snapshot(driver) if use_snapshot else extract_specs(driver)
+            with metrics.span("bom"):
+                product_data['bom'] = extract_bom_snapshot(driver) if use_snapshot else extract_bom(driver)
+            with metrics.span("asset_urls"):
+                static_asset_urls = extract_static_asset_urls_snapshot(driver) if use_snapshot else extract_static_asset_urls(driver)
+            if ARCHIVE_SNAPSHOTS:
+                # the panes were rendered (and clicked) by the extraction above
+                snapshot = extract_panes_html(driver, SNAPSHOT_PANES)
+                get_snapshot_store().save(product_id, snapshot['page_url'], snapshot['panes'], snapshot['assets'], "browser")
 
-        static_asset_urls = extract_static_asset_urls(driver)
+        product_data['specs'] = all_specs
+        derive_product_fields(product_data)
 
         logger.info("Downloading static assets via requests")
         downloaded_asset_paths = {}
 
-        downloaded_asset_paths['image'] = download_asset_with_requests(static_asset_urls.get('image'), product_id, 'image')
-        downloaded_asset_paths['manual'] = download_asset_with_requests(static_asset_urls.get('manual'), product_id, 'manual')
-
-        downloaded_asset_paths['cad'] = download_cad_interactively(driver, product_id, selenium_download_dir_for_this_product)
+        def download(asset_url, asset_type, file_name=None, extra_headers=None):
+            # in the background when a download service is given, inline otherwise
+            if download_service:
+                return download_service.submit(asset_url, product_id, asset_type, file_name, extra_headers)
+            return download_asset_with_requests(asset_url, product_id, asset_type,
+                                                file_name=file_name, extra_headers=extra_headers)
+
+        downloaded_asset_paths['image'] = download(static_asset_urls.get('image'), 'image')
+        downloaded_asset_paths['manual'] = download(static_asset_urls.get('manual'), 'manual')
+
+        cad_downloads = []
+        if CAD_DOWNLOAD_MODE == "direct" and CAD_URL_SOURCE != "network" and static_data:
+            # the dropdown's data source is in the static html, the browser is only opened when its URL
+            # doesn't answer ("auto")
+            cad_downloads = resolve_cad_downloads(None, selenium_download_dir_for_this_product, static_data['cad_formats'])
+
+        if not cad_downloads:
+            if driver is None:
+                driver = _acquire_driver(driver_pool, selenium_download_dir_for_this_product)
+                _load_product_page(driver, full_url)
+            if CAD_DOWNLOAD_MODE == "direct":
+                cad_downloads = resolve_cad_downloads(driver, selenium_download_dir_for_this_product,
+                                                      probe=static_data is None)
+
+        if cad_downloads:
+            logger.info(f"Downloading {len(cad_downloads)} CAD file(s) via requests")
+            cad_paths = {
+                cad['name']: download(cad['url'], 'cad', cad.get('file_name'), cad.get('headers'))
+                for cad in cad_downloads
+            }
+            downloaded_asset_paths['cad'] = cad_paths[cad_downloads[0]['name']]
+            if CAD_DOWNLOAD_ALL_FORMATS:
+                downloaded_asset_paths['cad_formats'] = cad_paths
+        else:
+            if CAD_DOWNLOAD_MODE == "direct":
+                logger.info("CAD URL not resolved, falling back to the browser download")
+            downloaded_asset_paths['cad'] = download_cad_interactively(driver, product_id, selenium_download_dir_for_this_product)
 
         product_data['assets'] = {
             "manual": downloaded_asset_paths.get('manual'),
             "cad": downloaded_asset_paths.get('cad'),
             "image": downloaded_asset_paths.get('image'),
         }
+        if 'cad_formats' in downloaded_asset_paths:
+            product_data['assets']['cad_formats'] = downloaded_asset_paths['cad_formats']
 
         return product_data
 
     except WebDriverException as e:
         logger.error(f"WebDriver error during scraping {product_id}: {e}", exc_info=True)
+        broken_driver = True
         return None
     except Exception as e:
         logger.error(f"Error during scraping {product_id}: {e}", exc_info=True)
@@ -146,9 +158,6 @@ def scrape_product_page(product_id: str):
 
     finally:
         if driver:
-            logger.debug("Closing browser")
-            try:
-                driver.quit()
-                logger.info("Browser closed")
-            except Exception as e:
-                 logger.warning(f"Error closing browser: {e}", exc_info=True)
\ No newline at end of file
+            driver_pool.release(driver, broken=broken_driver)
+        if own_pool:
+            driver_pool.close()
\ No newline at end of file
@@ -0,0 +1,161 @@
+import os
+import re
+import logging
+from typing import Dict, List, Any, Tuple
+
+# local imports
+from utils import DATA_OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+# product data structure and the fields derived from the specs, shared by the scraper and the
+# offline commands (re-extraction, re-deriving fields) without pulling in selenium
+
+def derive_product_fields(product_data: Dict[str, Any]):
+    # fills the top level hp/voltage/rpm/frame fields and the description from the specs
+    all_specs = product_data['specs']
+
+    spec_key_mapping_for_toplevel = {
+        "Output @ Frequency": "hp",
+        "Voltage @ Frequency": "voltage",
+        "Speed": "rpm",
+        "Frame": "frame"
+    }
+    for html_key, json_key in spec_key_mapping_for_toplevel.items():
+        if html_key in product_data['specs']:
+            value = product_data['specs'][html_key]
+
+            if json_key == 'hp':
+                 match = re.search(r'^\s*(\d*\.?\d+)', value)
+                 if match:
+                      try:
+                          hp_float = float(match.group(1))
+                          product_data['hp'] = str(hp_float)
+                      except ValueError:
+                          logger.warning(f"Error converting HP '{match.group(1)}' from '{value}' to float")
+                          product_data['hp'] = value
+                 else:
+                      logger.warning(f"Error extracting int HP from '{value}'.")
+                      product_data['hp'] = value
+
+            elif json_key == 'rpm':
+                 match = re.search(r'^\s*(\d+)', value)
+                 if match:
+                      product_data['rpm'] = match.group(1)
+                 else:
+                      logger.warning(f"Error extracting int RPM from '{value}'.")
+                      product_data['rpm'] = value
+            else:
+                product_data[json_key] = value
+
+    description_parts = []
+    if 'Enclosure' in all_specs: description_parts.append(all_specs['Enclosure'])
+    if product_data.get('hp') is not None and product_data['hp'] != '':
+         description_parts.append(f"{product_data['hp']} HP")
+    if product_data.get('rpm') is not None and product_data['rpm'] != '':
+         description_parts.append(f"{product_data['rpm']} RPM")
+    if 'Frame' in all_specs: description_parts.append(all_specs['Frame'])
+
+    product_data['description'] = ", ".join(description_parts) if description_parts else None
+    if product_data['description']:
+         logger.info(f"Description: {product_data['description']}")
+    else:
+         logger.warning("Error building description from specs")
+
+def new_product_data(product_id: str) -> Dict[str, Any]:
+    # inicialize an expected structure
+    return {
+        "product_id": product_id,
+        "name": product_id,
+        "description": None,
+        "specs": {},
+        "hp": None,
+        "voltage": None,
+        "rpm": None,
+        "frame": None,
+        "bom": [],
+        "assets": {
+            "manual": None,
+            "cad": None,
+            "image": None,
+        }
+    }
+
+
+ASSET_TYPES = ("image", "manual", "cad")
+
+
+def missing_assets(product_data: Dict[str, Any]) -> List[str]:
+    # asset types with no path, or whose file is missing or empty
+    assets = product_data.get('assets') or {}
+    missing = []
+    for asset_type in ASSET_TYPES:
+        relative_path = assets.get(asset_type)
+        file_path = os.path.join(DATA_OUTPUT_DIR, relative_path) if isinstance(relative_path, str) else None
+        if not file_path or not os.path.isfile(file_path) or os.path.getsize(file_path) == 0:
+            missing.append(asset_type)
+    return missing
+
+
+def resolve_bom_indices(headers: List[str]) -> Tuple[int, int, int]:
+    # maps the BOM table headers to the Part Number, Description and Quantity column indices
+    part_number_idx, description_idx, quantity_idx = -1, -1, -1
+
+    try: part_number_idx = headers.index("Part Number")
+    except ValueError: pass
+    if part_number_idx == -1: part_number_idx = 0
+
+    try: description_idx = headers.index("Description")
+    except ValueError: pass
+    if description_idx == -1 and len(headers) > 1: description_idx = 1
+
+    for i, h in enumerate(headers):
+         if "Quantity" in h:
+             quantity_idx = i
+             break
+    if quantity_idx == -1 and len(headers) > 2:
+        quantity_idx = 2
+
+    return part_number_idx, description_idx, quantity_idx
+
+
+def build_bom_entry(part_number: str, description: str, quantity_text: str) -> Dict[str, Any] | None:
+    # builds a BOM register, converting the quantity to float when possible
+    if not part_number:
+        return None
+
+    quantity: Any = quantity_text
+    if quantity_text:
+        try:
+            num_match = re.match(r'^\s*(\d+\.?\d*)\s*', quantity_text)
+            if num_match:
+                quantity = float(num_match.group(1))
+        except ValueError:
+            logger.debug(f"Error converting '{quantity_text}' to float")
+
+    return {
+        "part_number": part_number,
+        "description": description,
+        "quantity": quantity
+    }
+
+
+def build_bom_from_rows(headers: List[str], rows: List[List[str]]) -> List[Dict[str, Any]]:
+    # builds the BOM from already extracted cell texts, applying the same header mapping as extract_bom
+    bom_data: List[Dict[str, Any]] = []
+    part_number_idx, description_idx, quantity_idx = resolve_bom_indices(headers)
+    valid_indices = [idx for idx in [part_number_idx, description_idx, quantity_idx] if idx != -1]
+
+    for cells in rows:
+        if len(cells) <= max(valid_indices):
+            continue
+        part_number = cells[part_number_idx] if part_number_idx != -1 else ""
+        description = cells[description_idx] if description_idx != -1 else ""
+        quantity_text = cells[quantity_idx] if quantity_idx != -1 else ""
+
+        bom_entry = build_bom_entry(part_number, description, quantity_text)
+        if bom_entry:
+            bom_data.append(bom_entry)
+        else:
+            logger.debug(f"Warning: register without part number '{' '.join(cells)}'. Skipping")
+    return bom_data
@@ -0,0 +1,196 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator
+from urllib.parse import urlparse
+
+# local imports
+from metrics import metrics
+from utils import (RATE_LIMIT_ENABLED, RATE_LIMIT_RPS, RATE_LIMIT_MIN_RPS, RATE_LIMIT_MAX_RPS, RATE_LIMIT_BURST,
+                   RATE_LIMIT_MAX_CONCURRENCY, RATE_LIMIT_SLOW_SECONDS, RATE_LIMIT_INCREASE_RPS,
+                   RATE_LIMIT_DECREASE_FACTOR)
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class HostLimiter:
+    # token bucket plus a concurrency cap for one host. The rate follows AIMD: every healthy response
+    # adds increase_rps, a throttling status (429/503), an error or a slow response multiplies it
+    # by decrease_factor. A Retry-After header pauses the host
+
+    def __init__(self, host: str, rate: float = RATE_LIMIT_RPS, min_rate: float = RATE_LIMIT_MIN_RPS,
+                 max_rate: float = RATE_LIMIT_MAX_RPS, burst: int = RATE_LIMIT_BURST,
+                 max_concurrency: int = RATE_LIMIT_MAX_CONCURRENCY):
+        self.host = host
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.increase_rps = RATE_LIMIT_INCREASE_RPS
+        self.decrease_factor = RATE_LIMIT_DECREASE_FACTOR
+        self.tokens = float(burst)
+        self.in_flight = 0
+        self.waiting = 0
+        self.paused_until = 0.0
+        self._last_refill = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, timeout: float | None = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+            self._publish()
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self.paused_until:
+                        wait = self.paused_until - now
+                    elif self.in_flight >= self.max_concurrency:
+                        # woken up by release
+                        wait = 1.0
+                    elif self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return
+                    else:
+                        wait = (1 - self.tokens) / self.rate
+
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise TimeoutError(f"No request slot for {self.host} after {timeout}s")
+                        wait = min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self.waiting -= 1
+                self._publish()
+
+    def release(self, throttled: bool = False, retry_after: float | None = None):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self.tokens = min(self.tokens, 0.0)
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                metrics.increment("rate_limit_backoffs", host=self.host)
+                logger.info(f"Backing off {self.host}: {self.rate:.2f} req/s"
+                            + (f", paused {retry_after:.0f}s" if retry_after else ""))
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase_rps)
+            self._publish()
+            self._cond.notify_all()
+
+    def _publish(self):
+        metrics.set_gauge("rate_limit_rps", round(self.rate, 3), host=self.host)
+        metrics.set_gauge("rate_limit_in_flight", self.in_flight, host=self.host)
+        metrics.set_gauge("rate_limit_queue_depth", self.waiting, host=self.host)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"rate": round(self.rate, 3), "in_flight": self.in_flight, "waiting": self.waiting}
+
+
+class RequestSlot:
+    # handed to the caller while it holds a slot, to report how the request went
+
+    def __init__(self, slow_seconds: float):
+        self.slow_seconds = slow_seconds
+        self.observed = False
+        self.throttled = False
+        self.retry_after: float | None = None
+
+    def observe(self, status_code: int | None = None, elapsed: float | None = None,
+                retry_after: str | None = None):
+        self.observed = True
+        if status_code in THROTTLE_STATUS_CODES:
+            self.throttled = True
+            try:
+                self.retry_after = float(retry_after) if retry_after else None
+            except ValueError:
+                # http-date Retry-After values are ignored
+                self.retry_after = None
+        elif elapsed is not None and elapsed > self.slow_seconds:
+            self.throttled = True
+
+    def observe_response(self, response):
+        # requests response: status, time to the response headers and Retry-After
+        self.observe(response.status_code, response.elapsed.total_seconds(), response.headers.get("Retry-After"))
+
+
+class RateLimiter:
+    # one HostLimiter per host, shared by every thread of the process
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self.share = 1.0
+        self._hosts: Dict[str, HostLimiter] = {}
+        self._lock = threading.Lock()
+
+    def scale(self, share: float):
+        # process workers each get a share of the configured rate and concurrency
+        self.share = share
+
+    def host_limiter(self, host: str) -> HostLimiter:
+        with self._lock:
+            limiter = self._hosts.get(host)
+            if limiter is None:
+                limiter = HostLimiter(host, rate=RATE_LIMIT_RPS * self.share,
+                                      min_rate=RATE_LIMIT_MIN_RPS * self.share,
+                                      max_rate=RATE_LIMIT_MAX_RPS * self.share,
+                                      burst=max(1, round(RATE_LIMIT_BURST * self.share)),
+                                      max_concurrency=max(1, round(RATE_LIMIT_MAX_CONCURRENCY * self.share)))
+                self._hosts[host] = limiter
+            return limiter
+
+    @contextmanager
+    def request(self, url: str, slow_seconds: float = RATE_LIMIT_SLOW_SECONDS,
+                timeout: float | None = None) -> Iterator[RequestSlot]:
+        # holds a slot of the url's host for the duration of the block. Without an observed response,
+        # the block's duration is the latency and an exception (connection error, timeout) counts as throttling
+        slot = RequestSlot(slow_seconds)
+        if not self.enabled:
+            yield slot
+            return
+
+        limiter = self.host_limiter(urlparse(url).netloc)
+        with metrics.span("rate_limit_wait"):
+            limiter.acquire(timeout)
+        start = time.monotonic()
+        try:
+            yield slot
+        except Exception:
+            if not slot.observed:
+                slot.throttled = True
+            raise
+        finally:
+            if not slot.observed and not slot.throttled:
+                slot.observe(elapsed=time.monotonic() - start)
+            limiter.release(slot.throttled, slot.retry_after)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: limiter.stats() for host, limiter in hosts.items()}
+
+
+_rate_limiter: RateLimiter | None = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    # one limiter per process
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
@@ -0,0 +1,90 @@
+import logging
+import threading
+from typing import Dict, List, Any, Iterable
+
+# local imports
+from snapshot_store import get_snapshot_store, snapshot_document
+from http_extraction import parse_product_html
+from cad_formats import select_cad_formats
+from download_service import DownloadService
+from output_sinks import read_json_products, JsonFileSink
+from product_fields import missing_assets
+from utils import DATA_OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+# downloads the assets of already scraped products again, with the URLs read from their archived
+# snapshot, so no browser is needed. The products' JSON files are updated with the new paths
+
+
+def snapshot_asset_urls(product_id: str) -> Dict[str, Any] | None:
+    # image and manual URLs plus the DWG entry of the CAD data source, None without a usable snapshot
+    snapshot = get_snapshot_store().load(product_id)
+    if snapshot is None:
+        return None
+    extracted = parse_product_html(snapshot_document(snapshot), snapshot['page_url'])
+    if not extracted:
+        return None
+    cad_formats = select_cad_formats(extracted['cad_formats'])
+    return {
+        "image": extracted['asset_urls'].get('image'),
+        "manual": extracted['asset_urls'].get('manual'),
+        "cad": cad_formats[0] if cad_formats else None,
+    }
+
+
+def redownload_assets(targets: Dict[str, List[str]] | None = None,
+                      product_ids: Iterable[str] | None = None) -> Dict[str, Any]:
+    # targets maps product ids to the asset types to download again (e.g. the ones verification rejected).
+    # Without targets, every asset missing from a product's JSON or from disk is downloaded
+    summary: Dict[str, Any] = {"products": 0, "downloaded": 0, "failed": 0, "no_url": 0, "failures": []}
+    lock = threading.Lock()
+    service = DownloadService()
+    sink = JsonFileSink()
+
+    def on_done(product_data: Dict[str, Any], asset_types: List[str]):
+        with lock:
+            for asset_type in asset_types:
+                if product_data['assets'].get(asset_type):
+                    summary["downloaded"] += 1
+                else:
+                    summary["failed"] += 1
+                    summary["failures"].append({"product_id": product_data['product_id'], "asset_type": asset_type})
+        sink.write(product_data['product_id'], product_data)
+
+    ids = list(targets) if targets is not None else product_ids
+    try:
+        for _, product_data in read_json_products(DATA_OUTPUT_DIR, ids):
+            p_id = product_data['product_id']
+            asset_types = targets[p_id] if targets is not None else missing_assets(product_data)
+            if not asset_types:
+                continue
+            urls = snapshot_asset_urls(p_id)
+            if urls is None:
+                logger.warning(f"No snapshot of {p_id}, its assets can't be downloaded again")
+                summary["no_url"] += len(asset_types)
+                continue
+
+            assets = product_data.setdefault('assets', {})
+            submitted = []
+            for asset_type in asset_types:
+                if asset_type == "cad":
+                    cad = urls["cad"] or {}
+                    url, file_name = cad.get("url"), cad.get("file_name")
+                else:
+                    url, file_name = urls.get(asset_type), None
+                if not url:
+                    summary["no_url"] += 1
+                    continue
+                assets[asset_type] = service.submit(url, p_id, asset_type, file_name)
+                submitted.append(asset_type)
+            if submitted:
+                summary["products"] += 1
+                logger.info(f"Downloading {submitted} of {p_id} again")
+                service.when_done(product_data, lambda data, submitted=submitted: on_done(data, submitted))
+    finally:
+        service.close()
+
+    logger.info(f"Re-download finished: {summary['downloaded']} downloaded, {summary['failed']} failed, "
+                f"{summary['no_url']} without URL, over {summary['products']} products")
+    return summary
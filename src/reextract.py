@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Callable
+
+# local imports
+from snapshot_store import get_snapshot_store, snapshot_document
+from http_extraction import parse_product_html
+from product_fields import new_product_data, derive_product_fields
+from utils import DATA_OUTPUT_DIR, ASSETS_BASE_DIR, clean_filename
+
+logger = logging.getLogger(__name__)
+
+# rebuilds the product data from the archived pane snapshots, with no browser and no network.
+# Used after a parsing fix (specs, BOM mapping, hp/rpm regexes, description) to refresh the whole catalog
+
+REEXTRACT_CHUNK_SIZE = 32
+
+
+def existing_assets(product_id: str) -> Dict[str, Any]:
+    # assets aren't re-downloaded: the paths come from the product's JSON, or from its assets folder
+    json_filepath = os.path.join(DATA_OUTPUT_DIR, f"{clean_filename(product_id)}.json")
+    if os.path.exists(json_filepath):
+        try:
+            with open(json_filepath, encoding='utf-8') as f:
+                return json.load(f).get('assets') or {}
+        except (OSError, ValueError) as e:
+            logger.debug(f"Error reading {json_filepath}: {e}")
+
+    assets: Dict[str, Any] = {"manual": None, "cad": None, "image": None}
+    cleaned_product_id = clean_filename(product_id)
+    asset_dir = os.path.join(ASSETS_BASE_DIR, cleaned_product_id)
+    if not os.path.isdir(asset_dir):
+        return assets
+    for file_name in sorted(os.listdir(asset_dir)):
+        relative_path = f"{os.path.basename(ASSETS_BASE_DIR)}/{cleaned_product_id}/{file_name}"
+        stem, ext = os.path.splitext(file_name.lower())
+        if stem == "image" and assets["image"] is None:
+            assets["image"] = relative_path
+        elif stem == "manual" and assets["manual"] is None:
+            assets["manual"] = relative_path
+        elif ext == ".dwg" and assets["cad"] is None:
+            assets["cad"] = relative_path
+    return assets
+
+
+def rebuild_product(product_id: str) -> Dict[str, Any] | None:
+    # runs in a worker process, each one with its own connection to the snapshot store
+    snapshot = get_snapshot_store().load(product_id)
+    if snapshot is None:
+        logger.warning(f"No snapshot of {product_id}")
+        return None
+    extracted = parse_product_html(snapshot_document(snapshot), snapshot['page_url'])
+    if not extracted:
+        logger.warning(f"Snapshot of {product_id} has no specs")
+        return None
+
+    product_data = new_product_data(product_id)
+    product_data['specs'] = extracted['specs']
+    product_data['bom'] = extracted['bom']
+    derive_product_fields(product_data)
+    product_data['assets'] = existing_assets(product_id)
+    return product_data
+
+
+def reextract_all(on_result: Callable[[str, Dict[str, Any]], str | None],
+                  product_ids: List[str] | None = None,
+                  workers: int | None = None) -> Dict[str, Any]:
+    # re-extracts every archived product (or the given ones) across worker processes.
+    # on_result is called in this process, e.g. with an output sink's write
+    if product_ids is None:
+        product_ids = get_snapshot_store().product_ids()
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Re-extracting {len(product_ids)} products from snapshots with {workers} processes")
+
+    summary: Dict[str, Any] = {"total": 0, "ok": 0, "failed": 0, "failures": []}
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(rebuild_product, product_ids, chunksize=REEXTRACT_CHUNK_SIZE)
+        for p_id, product_data in zip(product_ids, results):
+            summary["total"] += 1
+            if not product_data:
+                summary["failed"] += 1
+                summary["failures"].append(p_id)
+                continue
+            try:
+                on_result(p_id, product_data)
+                summary["ok"] += 1
+            except Exception as e:
+                logger.error(f"Error handling result of {p_id}: {e}", exc_info=True)
+                summary["failed"] += 1
+                summary["failures"].append(p_id)
+
+    elapsed = time.monotonic() - start
+    summary["elapsed_seconds"] = round(elapsed, 2)
+    summary["products_per_minute"] = round(summary["total"] / elapsed * 60, 2) if elapsed > 0 else 0.0
+    logger.info(f"Re-extraction finished: {summary['ok']} ok, {summary['failed']} failed "
+                f"in {elapsed:.1f}s ({summary['products_per_minute']} products/min)")
+    return summary
+
+
+if __name__ == "__main__":
+    from output_sinks import create_sink
+    from utils import OUTPUT_FORMAT, ensure_output_dirs
+
+    parser = argparse.ArgumentParser(description="Rebuilds the product data from the archived page snapshots")
+    parser.add_argument("product_ids", nargs="*", help="only these products (default: every archived product)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--format", default=OUTPUT_FORMAT, choices=["json", "jsonl", "parquet"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    ensure_output_dirs()
+    sink = create_sink(args.format)
+    try:
+        reextract_all(sink.write, args.product_ids or None, args.workers)
+    finally:
+        sink.close()
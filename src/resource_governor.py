@@ -0,0 +1,212 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Any
+
+try:
+    import psutil
+except ImportError:
+    # falls back to /proc on linux, elsewhere only the page limit applies
+    psutil = None
+
+# local imports
+from metrics import metrics
+from utils import (BROWSER_MAX_PAGES, BROWSER_MAX_RSS_MB, BROWSER_MEMORY_BUDGET_MB, BROWSER_EXPECTED_RSS_MB)
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+ADMISSION_POLL_SECONDS = 1.0
+
+
+def _children(pid: int) -> List[int]:
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def process_tree_rss(pid: int) -> int:
+    # RSS of the process and all its descendants, 0 when it can't be measured
+    if psutil:
+        try:
+            process = psutil.Process(pid)
+            processes = [process] + process.children(recursive=True)
+        except psutil.Error:
+            return 0
+        total = 0
+        for child in processes:
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += _rss_bytes(current)
+        pending.extend(_children(current))
+    return total
+
+
+def total_memory() -> int | None:
+    # physical memory of the machine
+    if psutil:
+        return psutil.virtual_memory().total
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def browser_pids(driver) -> List[int]:
+    # uc starts chrome itself, so chrome's tree and chromedriver's are measured separately
+    pids = []
+    browser_pid = getattr(driver, "browser_pid", None)
+    if browser_pid:
+        pids.append(browser_pid)
+    service_process = getattr(getattr(driver, "service", None), "process", None)
+    if service_process is not None and service_process.pid:
+        pids.append(service_process.pid)
+    return pids
+
+
+class ResourceGovernor:
+    # tracks the RSS and page count of every browser of the process. Pools ask it whether a browser
+    # must be recycled after each product, and wait for its admission before booting a new one
+
+    def __init__(self, max_pages: int = BROWSER_MAX_PAGES, max_rss_mb: float = BROWSER_MAX_RSS_MB,
+                 budget_mb: float | None = BROWSER_MEMORY_BUDGET_MB, expected_rss_mb: float = BROWSER_EXPECTED_RSS_MB):
+        self.max_pages = max_pages
+        self.max_rss = max_rss_mb * MB
+        if budget_mb is None:
+            memory = total_memory()
+            self.budget = memory // 2 if memory else None
+        else:
+            self.budget = budget_mb * MB
+        self.expected_rss = expected_rss_mb * MB
+        self.share = 1.0
+        self._browsers: Dict[int, Dict[str, Any]] = {}
+        self._booting = 0
+        self._cond = threading.Condition()
+
+    def scale(self, share: float):
+        # process workers each get a share of the memory budget
+        self.share = share
+
+    def _budget(self) -> float | None:
+        return self.budget * self.share if self.budget else None
+
+    def _estimate(self) -> float:
+        # RSS expected from a new browser: the mean of the measured ones
+        measured = [browser["rss"] for browser in self._browsers.values() if browser["rss"]]
+        return sum(measured) / len(measured) if measured else self.expected_rss
+
+    def _used(self) -> float:
+        return sum(browser["rss"] or self.expected_rss for browser in self._browsers.values())
+
+    def _publish(self):
+        metrics.set_gauge("browsers_live", len(self._browsers))
+        metrics.set_gauge("browsers_rss_bytes", sum(browser["rss"] for browser in self._browsers.values()))
+
+    def admit(self, timeout: float | None = None):
+        # blocks until a new browser fits in the budget. A process with no browser always gets one
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with metrics.span("browser_admission"), self._cond:
+            while True:
+                budget = self._budget()
+                live = len(self._browsers) + self._booting
+                if budget is None or live == 0 or self._used() + (self._booting + 1) * self._estimate() <= budget:
+                    self._booting += 1
+                    return
+                wait = ADMISSION_POLL_SECONDS
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No memory for a new browser after {timeout}s "
+                                           f"({self._used() / MB:.0f} of {budget / MB:.0f} MiB used)")
+                    wait = min(wait, remaining)
+                logger.debug(f"Waiting for memory: {self._used() / MB:.0f} of {budget / MB:.0f} MiB used")
+                self._cond.wait(wait)
+
+    def cancel_admission(self):
+        # the admitted browser failed to boot
+        with self._cond:
+            self._booting = max(0, self._booting - 1)
+            self._cond.notify_all()
+
+    def register(self, driver):
+        with self._cond:
+            self._booting = max(0, self._booting - 1)
+            self._browsers[id(driver)] = {"pids": browser_pids(driver), "pages": 0, "rss": 0}
+            self._publish()
+
+    def unregister(self, driver):
+        with self._cond:
+            if self._browsers.pop(id(driver), None) is not None:
+                self._publish()
+                self._cond.notify_all()
+
+    def recycle_reason(self, driver) -> str | None:
+        # called when a browser finished a product: counts the page, measures its RSS and
+        # tells whether it should be replaced ("pages" or "memory")
+        with self._cond:
+            browser = self._browsers.get(id(driver))
+            if browser is None:
+                return None
+            browser["pages"] += 1
+            pids = browser["pids"]
+        rss = sum(process_tree_rss(pid) for pid in pids)
+        with self._cond:
+            browser["rss"] = rss
+            self._publish()
+            budget = self._budget()
+            over_budget = budget is not None and self._used() > budget
+        if browser["pages"] >= self.max_pages:
+            return "pages"
+        if rss > self.max_rss or (over_budget and rss > self._estimate()):
+            # over the budget, the browsers bigger than average are recycled first
+            return "memory"
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            budget = self._budget()
+            return {"browsers": len(self._browsers),
+                    "rss_mib": round(sum(browser["rss"] for browser in self._browsers.values()) / MB, 1),
+                    "budget_mib": round(budget / MB, 1) if budget else None}
+
+
+_resource_governor: ResourceGovernor | None = None
+_resource_governor_lock = threading.Lock()
+
+
+def get_resource_governor() -> ResourceGovernor:
+    # one governor per process, shared by its driver pools
+    global _resource_governor
+    with _resource_governor_lock:
+        if _resource_governor is None:
+            _resource_governor = ResourceGovernor()
+        return _resource_governor
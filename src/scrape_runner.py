@@ -0,0 +1,293 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing.util
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Any, Callable, Iterable
+
+# local imports
+from page_interaction import scrape_product_page
+from driver_pool import DriverPool
+from download_service import DownloadService, resolve_assets
+from asset_cache import get_asset_cache
+from job_store import JobStore, product_stages
+from metrics import metrics
+from rate_limiter import get_rate_limiter
+from resource_governor import get_resource_governor
+from change_detection import check_product, previous_product_data, record_scrape, get_fingerprint_store
+from utils import (SCRAPE_WORKERS, SCRAPE_MODE, PRODUCT_TIMEOUT_SECONDS, USE_ASSET_CACHE, METRICS_DIR,
+                   DELTA_RECHECK_AFTER_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+# every worker thread (or process) owns a single-browser pool
+_worker_state = threading.local()
+_worker_pools: List[DriverPool] = []
+_worker_pools_lock = threading.Lock()
+
+# thread workers share the runner's download service, process workers create their own
+_shared_download_service: DownloadService | None = None
+
+
+def _get_worker_pool() -> DriverPool:
+    driver_pool = getattr(_worker_state, "driver_pool", None)
+    if driver_pool is None:
+        driver_pool = DriverPool(size=1)
+        _worker_state.driver_pool = driver_pool
+        with _worker_pools_lock:
+            _worker_pools.append(driver_pool)
+    return driver_pool
+
+
+def _close_worker_pools():
+    with _worker_pools_lock:
+        pools = list(_worker_pools)
+        _worker_pools.clear()
+    for driver_pool in pools:
+        driver_pool.close()
+
+
+def start_worker_services():
+    # download service used by scrape_with_timeout outside of run_scrape (process workers, remote workers)
+    global _shared_download_service
+    _shared_download_service = DownloadService()
+
+
+def close_worker_services():
+    global _shared_download_service
+    _close_worker_pools()
+    if _shared_download_service:
+        _shared_download_service.close()
+        _shared_download_service = None
+
+
+def _init_process_worker(workers: int):
+    # worker processes exit without running atexit hooks, so the browsers are closed by a finalizer.
+    # Each process schedules its own requests with a share of the per-host rate and of the memory budget
+    get_rate_limiter().scale(1 / workers)
+    get_resource_governor().scale(1 / workers)
+    start_worker_services()
+    multiprocessing.util.Finalize(None, close_worker_services, exitpriority=10)
+
+
+def scrape_with_timeout(product_id: str, product_timeout: float, join_downloads: bool = False,
+                        delta: bool = False) -> Dict[str, Any]:
+    # scrapes one product on this worker's browser. When the timeout expires the browser is
+    # killed, which makes the pending WebDriver calls fail and frees the worker.
+    # Asset downloads are left running unless join_downloads is set (futures can't leave a process).
+    # With delta, a product whose page didn't change since its last scrape is reported "unchanged"
+    check = None
+    fetched = None
+    if delta:
+        start = time.monotonic()
+        check = check_product(product_id)
+        # the page fetched by the check is parsed by the scrape, not fetched twice. It stays out of the result
+        fetched = check.pop("fetched")
+        if not check["changed"]:
+            metrics.increment("products", status="unchanged")
+            result = {"product_id": product_id, "status": "unchanged", "data": None, "error": None,
+                      "elapsed": time.monotonic() - start, "check": check}
+            if join_downloads:
+                result["metrics"] = metrics.drain()
+            return result
+
+    driver_pool = _get_worker_pool()
+    timed_out = threading.Event()
+
+    def on_timeout():
+        logger.warning(f"{product_id} exceeded {product_timeout}s, aborting its browser")
+        timed_out.set()
+        driver_pool.abort()
+
+    watchdog = threading.Timer(product_timeout, on_timeout)
+    watchdog.daemon = True
+    start = time.monotonic()
+    watchdog.start()
+    try:
+        with metrics.span("product"):
+            data = scrape_product_page(product_id, driver_pool, _shared_download_service, fetched)
+        error = None
+    except Exception as e:
+        data = None
+        error = str(e)
+    finally:
+        watchdog.cancel()
+
+    if data and join_downloads:
+        resolve_assets(data)
+
+    if timed_out.is_set():
+        status = "timeout"
+    elif data:
+        status = "ok"
+    else:
+        status = "failed"
+
+    metrics.increment("products", status=status)
+    result = {
+        "product_id": product_id,
+        "status": status,
+        "data": data if status == "ok" else None,
+        "error": error,
+        "elapsed": time.monotonic() - start,
+        "check": check,
+    }
+    if join_downloads:
+        # metrics recorded in a worker process travel back with the result
+        result["metrics"] = metrics.drain()
+    return result
+
+
+def run_scrape(product_ids: Iterable[str],
+               on_result: Callable[[str, Dict[str, Any]], str | None],
+               workers: int = SCRAPE_WORKERS,
+               mode: str = SCRAPE_MODE,
+               product_timeout: float = PRODUCT_TIMEOUT_SECONDS,
+               job_store: JobStore | None = None,
+               delta: bool = False) -> Dict[str, Any]:
+    # scrapes the products concurrently. A failing product never stops the batch.
+    # on_result is called for every successful product once its asset downloads are done and
+    # returns the output path. With a job store, products already done (or waiting to be retried) are skipped.
+    # In delta runs only new and changed products are scraped (see change_detection.py), and products done
+    # longer than DELTA_RECHECK_AFTER_SECONDS ago are checked again
+    global _shared_download_service
+    if mode == "process":
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_process_worker,
+                                       initargs=(workers,))
+    elif mode == "thread":
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scraper")
+        _shared_download_service = DownloadService()
+    else:
+        raise ValueError(f"Unknown scrape mode '{mode}'")
+
+    logger.info(f"Scraping with {workers} {mode} workers, {product_timeout}s timeout per product")
+    summary: Dict[str, Any] = {"total": 0, "ok": 0, "failed": 0, "timeout": 0, "skipped": 0, "unchanged": 0,
+                               "failures": []}
+    if delta:
+        summary["changes"] = {}
+    start = time.monotonic()
+    metrics.reset()
+
+    if job_store:
+        job_store.recover_interrupted()
+
+    def claimed(ids: Iterable[str]):
+        for p_id in ids:
+            if job_store and not job_store.claim(p_id, DELTA_RECHECK_AFTER_SECONDS if delta else None):
+                summary["skipped"] += 1
+                continue
+            yield p_id
+
+    def handle_result(p_id: str, data: Dict[str, Any], check: Dict[str, Any] | None = None):
+        # the previous version is read before on_result overwrites it
+        previous = previous_product_data(p_id) if delta else None
+        try:
+            output_path = on_result(p_id, data)
+        except Exception as e:
+            logger.error(f"Error handling result of {p_id}: {e}", exc_info=True)
+            if job_store:
+                job_store.mark_failed(p_id, f"result handler: {e}", product_stages(data))
+            return
+        if job_store:
+            job_store.mark_done(p_id, output_path, product_stages(data))
+        if delta:
+            # the fingerprint is only stored once the new version is saved
+            try:
+                summary["changes"][p_id] = record_scrape(p_id, check, previous, data)
+            except Exception as e:
+                logger.warning(f"Error recording the changes of {p_id}: {e}")
+
+    def collect(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            # only reachable when a worker process dies
+            result = {"product_id": in_flight[future], "status": "failed", "data": None, "error": str(e), "elapsed": None}
+
+        if result.get("metrics"):
+            metrics.merge(result["metrics"])
+        summary["total"] += 1
+        summary[result["status"]] += 1
+        p_id = result["product_id"]
+        check = result.get("check")
+        if result["status"] == "unchanged":
+            logger.info(f"{p_id} unchanged ({check['reason']}), checked in {result['elapsed']:.1f}s")
+            get_fingerprint_store().record_check(p_id, check["etag"], check["last_modified"], check["content_hash"])
+            if job_store:
+                job_store.mark_unchanged(p_id)
+        elif result["status"] == "ok":
+            logger.info(f"{p_id} scraped in {result['elapsed']:.1f}s")
+            if mode == "thread":
+                # the downloads keep running while the worker moves on to the next product
+                _shared_download_service.when_done(result["data"], lambda data: handle_result(p_id, data, check))
+            else:
+                handle_result(p_id, result["data"], check)
+        else:
+            error = result["error"] or "no data returned"
+            logger.error(f"{p_id} {result['status']}: {error}")
+            summary["failures"].append({"product_id": p_id, "status": result["status"], "error": result["error"]})
+            if job_store:
+                job_store.mark_failed(p_id, f"{result['status']}: {error}")
+
+    # ids are submitted lazily, keeping a bounded number of products in flight
+    in_flight: Dict[Any, str] = {}
+    max_in_flight = workers * 2
+    try:
+        for p_id in claimed(product_ids):
+            while len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+                    del in_flight[future]
+            future = executor.submit(scrape_with_timeout, p_id, product_timeout, mode == "process", delta)
+            in_flight[future] = p_id
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                collect(future)
+                del in_flight[future]
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if mode == "thread":
+            _close_worker_pools()
+            _shared_download_service.close()
+            _shared_download_service = None
+
+    elapsed = time.monotonic() - start
+    summary["elapsed_seconds"] = round(elapsed, 2)
+    summary["products_per_minute"] = round(summary["total"] / elapsed * 60, 2) if elapsed > 0 else 0.0
+    logger.info(f"Run finished: {summary['ok']} ok, {summary['failed']} failed, {summary['timeout']} timed out "
+                f"of {summary['total']} in {elapsed:.1f}s ({summary['products_per_minute']} products/min)")
+    if delta:
+        logger.info(f"Delta run: {summary['unchanged']} products unchanged, {len(summary['changes'])} new or changed")
+    if job_store:
+        summary["jobs"] = job_store.counts()
+        logger.info(f"Skipped {summary['skipped']} products already done or waiting for a retry. Jobs: {summary['jobs']}")
+    if USE_ASSET_CACHE:
+        # cumulative over every run sharing the cache
+        summary["asset_cache"] = get_asset_cache().stats()
+        logger.info(f"Asset cache: {summary['asset_cache']}")
+    rate_limits = get_rate_limiter().stats()
+    if rate_limits:
+        summary["rate_limits"] = rate_limits
+        logger.info(f"Per-host request rates: {rate_limits}")
+    write_metrics_report(summary)
+    return summary
+
+
+def write_metrics_report(summary: Dict[str, Any]):
+    # per-run JSON report plus a Prometheus text file overwritten by every run
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        report_path = os.path.join(METRICS_DIR, f"run_{time.strftime('%Y%m%d-%H%M%S')}.json")
+        metrics.write_json(report_path, {"summary": summary})
+        metrics.write_prometheus(os.path.join(METRICS_DIR, "metrics.prom"))
+    except OSError as e:
+        logger.warning(f"Error writing metrics report: {e}")
+        return
+
+    summary["metrics_report"] = report_path
+    for stage, stats in metrics.report()["stages"].items():
+        logger.info(f"Stage {stage}: n={stats['count']} p50={stats['p50']:.3f}s p95={stats['p95']:.3f}s")
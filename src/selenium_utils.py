@@ -28,6 +28,21 @@ def safe_find_elements(driver: WebDriver, by: By, value: str, wait_time: int = 1
     except (TimeoutException, NoSuchElementException):
         return []
 
+def wait_for_tab_active(driver: WebDriver, tab_name: str, wait_time: int = 5) -> bool:
+    # waits until the tab and its pane are marked active instead of sleeping after the click
+    def tab_and_pane_active(driver):
+        return driver.execute_script(
+            "var tab = document.querySelector('nav ul li[data-tab=\"' + arguments[0] + '\"]');"
+            "var pane = document.querySelector('.pane[data-tab=\"' + arguments[0] + '\"]');"
+            "return !!tab && tab.classList.contains('active') && (!pane || pane.classList.contains('active'));",
+            tab_name)
+    try:
+        WebDriverWait(driver, wait_time, poll_frequency=0.1).until(tab_and_pane_active)
+        return True
+    except TimeoutException:
+        logger.debug(f"Tab '{tab_name}' not marked active after {wait_time}s")
+        return False
+
 def click_tab(driver: WebDriver, tab_name: str):
     # clicks on a tab if its not already active
     logger.debug(f"Trying to access tab {tab_name}")
@@ -40,7 +55,7 @@ def click_tab(driver: WebDriver, tab_name: str):
              logger.debug(f"Tab '{tab_name}' not active. Clicking")
              tab_element.click()
              logger.info(f"Tab '{tab_name}' clicked")
-             time.sleep(1)
+             wait_for_tab_active(driver, tab_name)
              return True
         else:
              logger.debug(f"Tab '{tab_name}' is already active. No need to click.")
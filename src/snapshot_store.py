@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator
+
+# local imports
+from utils import SNAPSHOT_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    product_id TEXT PRIMARY KEY,
+    page_url TEXT NOT NULL,
+    source TEXT NOT NULL,
+    captured_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+# panes archived for every product, plus the image and manual link elements that live outside them
+SNAPSHOT_PANES = ("specs", "parts", "drawings")
+SNAPSHOT_COMPRESSION_LEVEL = 6
+
+
+def snapshot_document(snapshot: Dict[str, Any]) -> str:
+    # rebuilds a page the http_extraction parsers accept from the archived fragments
+    panes = snapshot.get("panes") or {}
+    tabs = "".join(f'<li data-tab="{name}"></li>' for name in panes)
+    return ("<html><body><div id=\"catalog-detail\">"
+            f"<nav><ul>{tabs}</ul></nav>"
+            + "".join(snapshot.get("assets") or [])
+            + "".join(panes.values())
+            + "</div></body></html>")
+
+
+class SnapshotStore:
+    # compressed archive of the html of each product's panes, so parsing fixes can be applied
+    # to the whole catalog without a browser or network (see reextract.py)
+
+    def __init__(self, path: str = SNAPSHOT_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # short-lived connections, snapshots are written from scraper threads and read from worker processes
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, product_id: str, page_url: str, panes: Dict[str, str], assets: List[str], source: str):
+        # source is "http" (static html) or "browser" (rendered DOM)
+        data = zlib.compress(json.dumps({"panes": panes, "assets": assets}).encode('utf-8'),
+                             SNAPSHOT_COMPRESSION_LEVEL)
+        try:
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO snapshots (product_id, page_url, source, captured_at, size, data) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", (product_id, page_url, source, time.time(), len(data), data))
+        except sqlite3.Error as e:
+            # the archive is best effort, the product is still scraped
+            logger.warning(f"Error archiving the snapshot of {product_id}: {e}")
+            return
+        logger.debug(f"Snapshot of {product_id} archived ({len(data)} bytes compressed)")
+
+    def load(self, product_id: str) -> Dict[str, Any] | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM snapshots WHERE product_id = ?", (product_id,)).fetchone()
+        if row is None:
+            return None
+        snapshot = json.loads(zlib.decompress(row["data"]))
+        snapshot.update(product_id=row["product_id"], page_url=row["page_url"], source=row["source"],
+                        captured_at=row["captured_at"])
+        return snapshot
+
+    def product_ids(self) -> List[str]:
+        with self._connect() as conn:
+            return [row["product_id"] for row in conn.execute("SELECT product_id FROM snapshots ORDER BY product_id")]
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT COUNT(*) AS products, COALESCE(SUM(size), 0) AS bytes FROM snapshots").fetchone()
+        return {"products": row["products"], "bytes": row["bytes"]}
+
+
+_snapshot_store: SnapshotStore | None = None
+_snapshot_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> SnapshotStore:
+    # one store instance per process
+    global _snapshot_store
+    with _snapshot_store_lock:
+        if _snapshot_store is None:
+            _snapshot_store = SnapshotStore()
+        return _snapshot_store
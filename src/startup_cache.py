@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator
+
+import undetected_chromedriver as uc
+from undetected_chromedriver.patcher import Patcher
+
+try:
+    import fcntl
+except ImportError:
+    # windows: the cache is only locked between the threads of a process
+    fcntl = None
+
+# local imports
+from metrics import metrics
+from utils import BASE_URL, DRIVER_CACHE_DIR, PROFILE_TEMPLATE_DIR, PROFILE_TEMPLATE_MAX_AGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# without a driver path, every uc.Chrome call looks up the latest chromedriver release, downloads it,
+# unzips it and patches it into the same shared file, and starts from an empty profile.
+# Here the patched driver is kept per chrome version and each browser gets a copy of a warm profile
+
+# profile files that belong to a running browser and must not be copied
+PROFILE_IGNORED_FILES = ("template.json", "Singleton*", "lockfile", "*.lock", "LOCK", "Crashpad", "Crash Reports", "*.tmp")
+
+_locks = {"driver": threading.Lock(), "profile": threading.Lock()}
+_chrome_version: int | None = None
+_driver: Dict[str, Any] | None = None
+
+
+@contextmanager
+def _cache_lock(name: str) -> Iterator[None]:
+    # exclusive between threads and, with fcntl, between the processes sharing the cache
+    os.makedirs(DRIVER_CACHE_DIR, exist_ok=True)
+    with _locks[name], open(os.path.join(DRIVER_CACHE_DIR, f"{name}.lock"), "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def chrome_major_version() -> int | None:
+    # installed chrome's major version, None when it can't be told (then nothing is cached)
+    global _chrome_version
+    if _chrome_version is None:
+        executable = uc.find_chrome_executable()
+        if not executable:
+            return None
+        try:
+            output = subprocess.run([executable, "--version"], capture_output=True, text=True, timeout=30).stdout
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Error reading the chrome version: {e}")
+            return None
+        match = re.search(r"(\d+)\.\d+\.\d+", output)
+        if not match:
+            return None
+        _chrome_version = int(match.group(1))
+    return _chrome_version
+
+
+def _build_driver(path: str, version: int) -> Dict[str, Any]:
+    # what uc does on every launch, done once: release lookup, download, unzip and patch
+    start = time.perf_counter()
+    unpacked_path = f"{path}.{os.getpid()}.tmp"
+    patcher = Patcher(executable_path=unpacked_path, version_main=version)
+    # unzipped in the cache instead of uc's shared folder, which concurrent launches would clobber
+    patcher.zip_path = os.path.join(DRIVER_CACHE_DIR, f"unpack_{os.getpid()}")
+    release = patcher.fetch_release_number()
+    patcher.version_main = release.version[0]
+    patcher.version_full = release
+    patcher.unzip_package(patcher.fetch_package())
+    patcher.patch_exe()
+    if not patcher.is_binary_patched(unpacked_path):
+        os.remove(unpacked_path)
+        raise RuntimeError(f"chromedriver {release.vstring} could not be patched")
+    os.replace(unpacked_path, path)
+
+    info = {"chrome_version": version, "driver_version": release.vstring,
+            "prepare_seconds": round(time.perf_counter() - start, 3), "created_at": time.time()}
+    with open(f"{path}.json", "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    metrics.observe("driver_prepare", info["prepare_seconds"])
+    logger.info(f"chromedriver {release.vstring} patched and cached in {info['prepare_seconds']:.1f}s")
+    return info
+
+
+def cached_driver() -> Dict[str, Any] | None:
+    # path and info of the patched chromedriver matching the installed chrome, built on first use.
+    # None when chrome's version is unknown or the build fails, uc then patches its own copy
+    global _driver
+    if _driver is not None:
+        return _driver
+    version = chrome_major_version()
+    if version is None:
+        return None
+
+    path = os.path.join(DRIVER_CACHE_DIR, f"chromedriver_{version}" + (".exe" if os.name == "nt" else ""))
+    built = False
+    try:
+        with _cache_lock("driver"):
+            if _driver is None:
+                if Patcher(executable_path=path).is_binary_patched(path) and os.path.exists(f"{path}.json"):
+                    with open(f"{path}.json", encoding="utf-8") as f:
+                        info = json.load(f)
+                else:
+                    info = _build_driver(path, version)
+                    built = True
+                _driver = {**info, "path": path, "saved_seconds": info["prepare_seconds"]}
+    except Exception as e:
+        logger.warning(f"Error preparing the cached chromedriver, using undetected_chromedriver's: {e}")
+        return None
+    # the launch that built the cache saves nothing
+    return {**_driver, "saved_seconds": 0.0} if built else _driver
+
+
+def _template_is_fresh() -> bool:
+    try:
+        with open(os.path.join(PROFILE_TEMPLATE_DIR, "template.json"), encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (info.get("base_url") == BASE_URL and info.get("chrome_version") == chrome_major_version()
+            and time.time() - info.get("created_at", 0) < PROFILE_TEMPLATE_MAX_AGE_SECONDS)
+
+
+def _build_template(warm_profile: Callable[[str], None]):
+    # warm_profile runs a browser on the given profile directory (see driver_pool.warm_profile)
+    start = time.perf_counter()
+    build_dir = tempfile.mkdtemp(prefix="profile_template_", dir=os.path.dirname(PROFILE_TEMPLATE_DIR))
+    try:
+        warm_profile(build_dir)
+        with open(os.path.join(build_dir, "template.json"), "w", encoding="utf-8") as f:
+            json.dump({"base_url": BASE_URL, "chrome_version": chrome_major_version(), "created_at": time.time()}, f)
+        shutil.rmtree(PROFILE_TEMPLATE_DIR, ignore_errors=True)
+        os.replace(build_dir, PROFILE_TEMPLATE_DIR)
+    except Exception:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    elapsed = time.perf_counter() - start
+    metrics.observe("profile_template_build", elapsed)
+    logger.info(f"Browser profile template built in {elapsed:.1f}s")
+
+
+def clone_profile(warm_profile: Callable[[str], None]) -> str | None:
+    # copy of the template profile for a new browser, removed by remove_profile when it quits.
+    # The template is (re)built first when missing, stale or made for another site or chrome version
+    try:
+        with _cache_lock("profile"):
+            if not _template_is_fresh():
+                _build_template(warm_profile)
+            with metrics.span("profile_clone"):
+                profile_dir = tempfile.mkdtemp(prefix="baldor_profile_")
+                shutil.copytree(PROFILE_TEMPLATE_DIR, profile_dir, dirs_exist_ok=True,
+                                ignore=shutil.ignore_patterns(*PROFILE_IGNORED_FILES))
+    except Exception as e:
+        logger.warning(f"Error preparing the browser profile, starting from an empty one: {e}")
+        return None
+    return profile_dir
+
+
+def remove_profile(profile_dir: str | None):
+    if profile_dir:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+def record_startup(driver_info: Dict[str, Any] | None, boot_seconds: float):
+    # each launch on the cached driver skips the download and patching uc would have done
+    if driver_info and driver_info["saved_seconds"]:
+        metrics.increment("driver_cache_hits")
+        metrics.increment("startup_seconds_saved", driver_info["saved_seconds"])
+        logger.info(f"webdriver booted in {boot_seconds:.1f}s on the cached chromedriver "
+                    f"(~{driver_info['saved_seconds']:.1f}s of download and patching saved)")
+    else:
+        logger.info(f"webdriver booted in {boot_seconds:.1f}s")
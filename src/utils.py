@@ -5,13 +5,171 @@ from urllib.parse import urlparse
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-DATA_OUTPUT_DIR = os.path.join(PROJECT_ROOT, "output")
+# BALDOR_OUTPUT_DIR keeps runs apart, e.g. benchmark runs against the fixture site
+DATA_OUTPUT_DIR = os.environ.get("BALDOR_OUTPUT_DIR", os.path.join(PROJECT_ROOT, "output"))
 ASSETS_BASE_DIR = os.path.join(DATA_OUTPUT_DIR, "assets")
 
-os.makedirs(DATA_OUTPUT_DIR, exist_ok=True)
-os.makedirs(ASSETS_BASE_DIR, exist_ok=True)
+# BALDOR_BASE_URL points the scraper at another site, e.g. the local fixture site
+BASE_URL = os.environ.get("BALDOR_BASE_URL", "https://www.baldor.com/catalog/")
 
-BASE_URL = "https://www.baldor.com/catalog/"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# specs, BOM and static asset URLs are read from the plain HTML when possible, falling back to the browser
+USE_HTTP_EXTRACTION = True
+HTTP_POOL_SIZE = 10
+HTTP_TIMEOUT_SECONDS = 30
+
+# background asset downloads: worker threads, max queued downloads and streaming chunk size
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_QUEUE_SIZE = 32
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# downloaded assets are cached by URL and revalidated with conditional requests on later runs
+USE_ASSET_CACHE = True
+ASSET_CACHE_DIR = os.path.join(DATA_OUTPUT_DIR, ".asset_cache")
+ASSET_CACHE_MAX_BYTES = 5 * 1024 ** 3
+# entries validated less than this long ago are reused without any request
+ASSET_REVALIDATE_AFTER_SECONDS = 12 * 3600
+
+# content-addressed store holding one copy of every unique asset, hardlinked into the product folders
+BLOB_STORE_DIR = os.path.join(DATA_OUTPUT_DIR, ".blobs")
+
+# CAD files: "direct" resolves the DWG URL and downloads it with the pooled HTTP downloader,
+# "browser" lets chrome download it. The URL comes from the download request captured in the browser
+# ("network") or from the dropdown's data source ("data_source", no browser needed with HTTP extraction).
+# "auto" uses the data source URL when it answers a short probe and only opens a browser to capture
+# the URL when it doesn't (the data source may list internal hosts)
+CAD_DOWNLOAD_MODE = "direct"
+CAD_URL_SOURCE = "auto"
+CAD_PROBE_TIMEOUT_SECONDS = 5
+CAD_DOWNLOAD_ALL_FORMATS = False
+# chrome downloads into this subfolder of the product's assets folder, which nothing else writes to,
+# and the completed CAD file is moved up next to the other assets
+BROWSER_DOWNLOAD_SUBDIR = ".browser_downloads"
+
+# browser extraction mode: "snapshot" reads each pane with a single execute_script,
+# "elements" queries every element through WebDriver
+EXTRACTION_MODE = "snapshot"
+
+# lean browser: headless, images/fonts/trackers blocked through CDP and the consent cookie preset,
+# so the adroll overlay never renders and the cookie overlay handling is skipped
+LEAN_BROWSER = True
+LEAN_BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*adroll.com*", "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*hotjar.com*", "*linkedin.com*", "*bing.com*",
+]
+CONSENT_COOKIES = [{"name": "__adroll_consent", "value": "allow_all"}]
+
+# per-host request scheduling shared by the HTTP, download and browser paths: token bucket starting at
+# RATE_LIMIT_RPS with at most RATE_LIMIT_MAX_CONCURRENCY requests in flight. The rate grows by
+# RATE_LIMIT_INCREASE_RPS per healthy response and is multiplied by RATE_LIMIT_DECREASE_FACTOR on 429/503,
+# errors or responses slower than RATE_LIMIT_SLOW_SECONDS (RATE_LIMIT_SLOW_PAGE_SECONDS for browser page loads)
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_RPS = 4.0
+RATE_LIMIT_MIN_RPS = 0.2
+RATE_LIMIT_MAX_RPS = 16.0
+RATE_LIMIT_BURST = 4
+RATE_LIMIT_MAX_CONCURRENCY = 8
+RATE_LIMIT_INCREASE_RPS = 0.1
+RATE_LIMIT_DECREASE_FACTOR = 0.5
+RATE_LIMIT_SLOW_SECONDS = 5.0
+RATE_LIMIT_SLOW_PAGE_SECONDS = 20.0
+
+# catalog crawl used to discover product ids (defaults to BASE_URL), capped at CRAWL_MAX_PAGES pages
+CRAWL_START_URLS = []
+CRAWL_MAX_PAGES = 5000
+
+# the html of each product's panes is archived compressed, so products can be re-extracted
+# offline after a parsing fix (python src/reextract.py)
+ARCHIVE_SNAPSHOTS = True
+SNAPSHOT_DB_PATH = os.path.join(DATA_OUTPUT_DIR, "snapshots.sqlite3")
+
+# output sink: "json" (one file per product), "jsonl" (single append-only file, fsync every
+# JSONL_FSYNC_EVERY lines or JSONL_FSYNC_SECONDS) or "parquet" (needs pyarrow, products and BOM tables)
+OUTPUT_FORMAT = "json"
+JSONL_OUTPUT_PATH = os.path.join(DATA_OUTPUT_DIR, "products.jsonl")
+JSONL_FSYNC_EVERY = 50
+JSONL_FSYNC_SECONDS = 5.0
+PARQUET_OUTPUT_DIR = os.path.join(DATA_OUTPUT_DIR, "parquet")
+PARQUET_ROW_GROUP_SIZE = 1000
+
+# query index over the scraped products (python src/catalog_index.py), updated after each run
+# from the new and changed product JSON files and the JSON Lines output
+UPDATE_CATALOG_INDEX = True
+CATALOG_INDEX_PATH = os.path.join(DATA_OUTPUT_DIR, "catalog_index.sqlite3")
+
+# delta runs (python src/cli.py scrape --delta) fetch each product page once and compare its fingerprint
+# (HTTP validators, else a hash of the specs, parts and drawings panes) with the last scrape's. Only new
+# and changed products are scraped in full. With the job store, products scraped or checked in the last
+# DELTA_RECHECK_AFTER_SECONDS are skipped, so an interrupted delta run resumes where it stopped
+FINGERPRINT_DB_PATH = os.path.join(DATA_OUTPUT_DIR, "fingerprints.sqlite3")
+DELTA_RECHECK_AFTER_SECONDS = 6 * 3600
+
+# asset files are checked after each run: size against the Content-Length, file signature and
+# PDF/JPEG/PNG trailer. Wrong extensions are fixed, checksums recorded in the manifest and the
+# bad files queued for re-download (python src/cli.py download-assets)
+VERIFY_ASSETS = True
+ASSET_MANIFEST_PATH = os.path.join(DATA_OUTPUT_DIR, "asset_manifest.sqlite3")
+VERIFY_WORKERS = None  # hashing processes, None uses every cpu
+
+# resized and re-encoded copies of the product images for the storefront, built after each run with JSON
+# output (or python src/cli.py images) and recorded in product_data['assets']['image_variants']. Needs Pillow
+GENERATE_IMAGE_VARIANTS = True
+IMAGE_VARIANT_WIDTHS = (None, 800, 320, 120)  # None keeps the source size
+IMAGE_VARIANT_FORMATS = ("webp", "jpeg")
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = None  # processes, None uses every cpu
+
+# per-run metrics: a JSON report per run and a Prometheus text file with per-stage p50/p95
+METRICS_DIR = os.path.join(DATA_OUTPUT_DIR, "metrics")
+
+# number of warm browsers kept alive by the driver pool
+DRIVER_POOL_SIZE = 1
+
+# browser startup cache: chromedriver is downloaded and patched once per chrome version, and every
+# browser starts from a copy of a pre-warmed profile (consent cookie set, catalog scripts and styles
+# cached), rebuilt after PROFILE_TEMPLATE_MAX_AGE_SECONDS
+USE_STARTUP_CACHE = True
+DRIVER_CACHE_DIR = os.path.join(DATA_OUTPUT_DIR, ".driver_cache")
+PROFILE_TEMPLATE_DIR = os.path.join(DATA_OUTPUT_DIR, ".profile_template")
+PROFILE_TEMPLATE_MAX_AGE_SECONDS = 24 * 3600
+
+# resource governor: a browser is recycled after BROWSER_MAX_PAGES products or once its process tree
+# (chrome, its renderers and chromedriver) uses more than BROWSER_MAX_RSS_MB. New browsers only start
+# while the total RSS of the browsers stays within BROWSER_MEMORY_BUDGET_MB (None: half of the machine's
+# memory), counting BROWSER_EXPECTED_RSS_MB for a browser until one has been measured
+USE_RESOURCE_GOVERNOR = True
+BROWSER_MAX_PAGES = 50
+BROWSER_MAX_RSS_MB = 1024
+BROWSER_MEMORY_BUDGET_MB = None
+BROWSER_EXPECTED_RSS_MB = 400
+
+# concurrent scraping: each worker owns one browser. Mode is "thread" or "process"
+SCRAPE_WORKERS = 2
+SCRAPE_MODE = "thread"
+PRODUCT_TIMEOUT_SECONDS = 300
+
+# resumable runs: per-product state is kept in SQLite so completed products are skipped on restart.
+# Failed products are retried on later runs after an exponential backoff, up to JOB_MAX_ATTEMPTS
+USE_JOB_STORE = True
+JOB_STORE_PATH = os.path.join(DATA_OUTPUT_DIR, "jobs.sqlite3")
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF_SECONDS = 60
+
+# distributed runs: the coordinator serves product ids from the job store over HTTP and leases them to
+# workers for LEASE_SECONDS. Workers renew their leases every WORKER_HEARTBEAT_SECONDS, products of a
+# worker that stops heartbeating are re-queued
+COORDINATOR_HOST = "127.0.0.1"
+COORDINATOR_PORT = 8750
+LEASE_SECONDS = 120
+WORKER_HEARTBEAT_SECONDS = 30
+
+def ensure_output_dirs():
+    # called by the commands that write to the output tree, importing this module creates nothing
+    os.makedirs(DATA_OUTPUT_DIR, exist_ok=True)
+    os.makedirs(ASSETS_BASE_DIR, exist_ok=True)
 
 def get_file_extension_from_url(url: str | None) -> str | None:
     if not url: return None
@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import socket
+import hashlib
+import logging
+import argparse
+import threading
+from typing import Dict, Any
+
+import requests
+
+# local imports
+from scrape_runner import scrape_with_timeout, start_worker_services, close_worker_services
+from rate_limiter import get_rate_limiter
+from utils import DATA_OUTPUT_DIR, PRODUCT_TIMEOUT_SECONDS, WORKER_HEARTBEAT_SECONDS, ensure_output_dirs
+
+logger = logging.getLogger(__name__)
+
+# worker of distributed runs: leases product ids from the coordinator (coordinator.py), scrapes them
+# on its own browsers and pushes the product data back, with the manifest of the asset files it wrote
+
+IDLE_POLL_SECONDS = 2.0
+# the coordinator may restart, requests are retried for this long before the worker gives up
+COORDINATOR_RETRY_SECONDS = 120
+COORDINATOR_REQUEST_TIMEOUT = 30
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def asset_manifest(product_data: Dict[str, Any]) -> Dict[str, Any]:
+    # size and sha256 of every asset file, paths relative to this node's output directory
+    manifest = {}
+    for asset_type, relative_path in (product_data.get('assets') or {}).items():
+        if not isinstance(relative_path, str):
+            continue
+        file_path = os.path.join(DATA_OUTPUT_DIR, relative_path)
+        try:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            manifest[asset_type] = {"path": relative_path, "size": os.path.getsize(file_path),
+                                    "sha256": digest.hexdigest()}
+        except OSError as e:
+            logger.warning(f"Error hashing {file_path}: {e}")
+    return manifest
+
+
+class Worker:
+
+    def __init__(self, coordinator_url: str, threads: int = 1, worker_id: str | None = None,
+                 product_timeout: float = PRODUCT_TIMEOUT_SECONDS,
+                 heartbeat_seconds: float = WORKER_HEARTBEAT_SECONDS):
+        self.coordinator_url = coordinator_url.rstrip("/")
+        self.threads = threads
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.product_timeout = product_timeout
+        self.heartbeat_seconds = heartbeat_seconds
+        self.summary: Dict[str, int] = {"ok": 0, "failed": 0, "timeout": 0, "rejected": 0}
+        self._in_flight: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        payload["worker"] = self.worker_id
+        deadline = time.monotonic() + COORDINATOR_RETRY_SECONDS
+        delay = 1.0
+        while True:
+            try:
+                response = requests.post(self.coordinator_url + path, json=payload, timeout=COORDINATOR_REQUEST_TIMEOUT)
+                response.raise_for_status()
+                return response.json()
+            except requests.exceptions.RequestException as e:
+                if time.monotonic() + delay > deadline:
+                    raise
+                logger.warning(f"Coordinator request {path} failed ({e}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            with self._lock:
+                product_ids = list(self._in_flight)
+            if not product_ids:
+                continue
+            try:
+                lost = self._post("/heartbeat", {"product_ids": product_ids})["lost"]
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Heartbeat failed: {e}")
+                continue
+            if lost:
+                # the scrape goes on, the coordinator will reject the result unless nobody else took the product
+                logger.warning(f"Lost the lease of {lost}")
+
+    def _scrape_loop(self):
+        while not self._stop.is_set():
+            try:
+                lease = self._post("/lease", {"count": 1})
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Coordinator unreachable, stopping: {e}")
+                return
+            if lease["done"]:
+                return
+            if not lease["product_ids"]:
+                # everything left is leased to other workers or waiting for its retry backoff
+                time.sleep(IDLE_POLL_SECONDS)
+                continue
+
+            for p_id in lease["product_ids"]:
+                with self._lock:
+                    self._in_flight.add(p_id)
+                try:
+                    self._scrape_and_report(p_id)
+                finally:
+                    with self._lock:
+                        self._in_flight.discard(p_id)
+
+    def _scrape_and_report(self, p_id: str):
+        # assets are downloaded before reporting, so the manifest is complete
+        result = scrape_with_timeout(p_id, self.product_timeout, join_downloads=True)
+        if result["data"]:
+            result["manifest"] = asset_manifest(result["data"])
+        try:
+            accepted = self._post("/result", result)["accepted"]
+        except requests.exceptions.RequestException as e:
+            # the lease expires and the product is scraped again
+            logger.error(f"Error reporting {p_id}: {e}")
+            return
+        with self._lock:
+            self.summary[result["status"] if accepted else "rejected"] += 1
+        logger.info(f"{p_id} {result['status']} in {result['elapsed']:.1f}s" + ("" if accepted else ", rejected"))
+
+    def run(self) -> Dict[str, int]:
+        # one browser per thread, until the coordinator reports the run is over
+        logger.info(f"Worker {self.worker_id} with {self.threads} browsers, coordinator {self.coordinator_url}")
+        start_worker_services()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="heartbeat", daemon=True)
+        heartbeat.start()
+        scrapers = [threading.Thread(target=self._scrape_loop, name=f"scraper-{i}") for i in range(self.threads)]
+        try:
+            for scraper in scrapers:
+                scraper.start()
+            for scraper in scrapers:
+                scraper.join()
+        finally:
+            self._stop.set()
+            close_worker_services()
+        logger.info(f"Worker {self.worker_id} finished: {self.summary}")
+        return self.summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrapes the products leased by a coordinator")
+    parser.add_argument("coordinator_url", help="e.g. http://10.0.0.5:8750")
+    parser.add_argument("--threads", type=int, default=1, help="browsers run by this worker")
+    parser.add_argument("--timeout", type=float, default=PRODUCT_TIMEOUT_SECONDS)
+    parser.add_argument("--rate-share", type=float, default=1.0,
+                        help="share of the per-host request rate used by this worker, e.g. 0.25 with 4 workers")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    ensure_output_dirs()
+    get_rate_limiter().scale(args.rate_share)
+    Worker(args.coordinator_url, args.threads, product_timeout=args.timeout).run()